@@ -0,0 +1,40 @@
+import time
+
+from django.core.cache import cache
+
+
+def _key(scope):
+    return f'generation:{scope}'
+
+
+def _fresh():
+    """Начальное поколение: время в мс, чтобы после вытеснения ключа
+    счётчик не вернулся к значению, под которым уже что-то закешировано.
+    """
+    return int(time.time() * 1000)
+
+
+def get(*scopes):
+    """Текущие поколения областей в порядке scopes."""
+    keys = [_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _fresh(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump(*scopes):
+    """Сдвигает поколения областей, делая их кеш недействительным."""
+    for scope in scopes:
+        try:
+            cache.incr(_key(scope))
+        except ValueError:
+            cache.add(_key(scope), _fresh(), None)
+
+
+def key(prefix, *scopes):
+    """Ключ кеша, меняющийся при сдвиге любого из поколений."""
+    stamp = '.'.join(str(generation) for generation in get(*scopes))
+    return f'{prefix}:{",".join(scopes)}:{stamp}'
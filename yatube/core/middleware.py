@@ -0,0 +1,73 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import queries, replicas
+
+logger = logging.getLogger(__name__)
+
+
+class QueryInspectorMiddleware:
+    """Сообщает о повторах запросов одной формы (N+1) и о превышении
+    бюджета, объявленного у представления через @query_budget.
+
+    Включается настройкой QUERY_INSPECTOR, которая читается на каждом
+    запросе; None — вместе с DEBUG.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not queries.inspecting():
+            return self.get_response(request)
+        with queries.capture() as log:
+            response = self.get_response(request)
+        budget = getattr(request, 'query_budget', None)
+        per_database = getattr(request, 'query_budget_per_database', 0)
+        for problem in log.problems(budget, per_database=per_database):
+            logger.warning('%s %s: %s', request.method, request.path,
+                           problem)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+        request.query_budget_per_database = getattr(
+            view_func, 'query_budget_per_database', 0
+        )
+
+
+class ReplicaMiddleware:
+    """Включает чтение с реплик для представлений с @replica_reads.
+
+    Клиент, который только что писал в базу, получает cookie
+    REPLICA_PIN_COOKIE и REPLICA_PIN_SECONDS читает основную базу,
+    чтобы видеть свои изменения.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas.use_replica(False)
+        try:
+            with replicas.watching_writes():
+                response = self.get_response(request)
+            if replicas.wrote():
+                response.set_cookie(
+                    settings.REPLICA_PIN_COOKIE, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                )
+        finally:
+            replicas.use_replica(False)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas.use_replica(
+            getattr(view_func, 'replica_reads', False)
+            and request.method in ('GET', 'HEAD')
+            and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+        )
@@ -0,0 +1,284 @@
+import hashlib
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.encoding import force_bytes, force_str
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+FORWARD = 'next'
+BACKWARD = 'prev'
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинатор: страницы по курсору вместо COUNT(*) и OFFSET.
+
+    Курсор — непрозрачный токен с номером страницы, направлением и
+    значениями полей сортировки граничной записи. Поле сортировки
+    должно однозначно задавать порядок, поэтому последним всегда идёт pk.
+    """
+
+    def __init__(self, object_list, per_page,
+                 ordering=('-pub_date', '-pk'),
+                 approximate_total=False, total_timeout=300):
+        self.ordering = ordering
+        self.approximate_total = approximate_total
+        self.total_timeout = total_timeout
+        self._number = 1
+        self._has_more = False
+        super().__init__(object_list.order_by(*ordering), per_page)
+
+    def get_page(self, cursor):
+        """Страница по курсору; битый курсор ведёт на первую страницу."""
+        try:
+            return self.page(cursor)
+        except InvalidPage:
+            return self.page(None)
+
+    def page(self, cursor):
+        number, direction, values = self.decode_cursor(cursor)
+        rows = self._fetch_rows(values, direction)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == BACKWARD:
+            rows.reverse()
+            self._has_more = True
+            number = max(number, 2) if has_more else 1
+        else:
+            self._has_more = has_more
+        self._number = number
+        page = Page(rows, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if rows and page.has_next():
+            page.next_cursor = self.encode_cursor(
+                number + 1, FORWARD, rows[-1]
+            )
+        if rows and page.has_previous():
+            page.previous_cursor = self.encode_cursor(
+                number - 1, BACKWARD, rows[0]
+            )
+        return page
+
+    def get_cached_page(self, cursor, key, timeout):
+        """get_page, состояние которой хранится в кеше под ключом key.
+
+        Ключ должен меняться вместе с содержимым ленты; курсор
+        добавляется к нему здесь.
+        """
+        key = f'{key}:' + hashlib.md5(force_bytes(cursor or '')).hexdigest()
+        state = cache.get(key)
+        if state is None:
+            page = self.get_page(cursor)
+            state = (page.number, self._has_more, list(page.object_list),
+                     page.next_cursor, page.previous_cursor)
+            cache.set(key, state, timeout)
+            return page
+        number, self._has_more, rows, next_cursor, previous_cursor = state
+        self._number = number
+        page = Page(rows, number, self)
+        page.next_cursor = next_cursor
+        page.previous_cursor = previous_cursor
+        return page
+
+    def _fetch_rows(self, values, direction):
+        """До per_page + 1 записей за граничной в порядке обхода."""
+        return self._rows_after(self.object_list, values, direction)
+
+    def _rows_after(self, queryset, values, direction):
+        if values is not None:
+            queryset = queryset.filter(
+                self._keyset_filter(values, direction)
+            )
+        if direction == BACKWARD:
+            queryset = queryset.reverse()
+        return list(queryset[:self.per_page + 1])
+
+    @cached_property
+    def num_pages(self):
+        """Число уже известных страниц: текущая и, если есть, следующая."""
+        return self._number + 1 if self._has_more else self._number
+
+    @cached_property
+    def total(self):
+        """Приблизительное число записей или None, если режим выключен.
+
+        COUNT(*) выполняется не чаще раза в total_timeout секунд
+        для одного и того же запроса.
+        """
+        if not self.approximate_total:
+            return None
+        key = 'paginator_total:' + hashlib.md5(
+            force_bytes(self._total_source())
+        ).hexdigest()
+        total = cache.get(key)
+        if total is None:
+            total = self._count()
+            cache.set(key, total, self.total_timeout)
+        return total
+
+    def _total_source(self):
+        return str(self.object_list.order_by().query)
+
+    def _count(self):
+        return self.object_list.order_by().count()
+
+    @cached_property
+    def total_pages(self):
+        if self.total is None:
+            return None
+        return max(1, -(-self.total // self.per_page))
+
+    def encode_cursor(self, number, direction, obj):
+        values = [
+            getattr(obj, field.lstrip('-')) for field in self.ordering
+        ]
+        payload = json.dumps([number, direction, values], default=str)
+        return urlsafe_base64_encode(force_bytes(payload))
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return 1, FORWARD, None
+        try:
+            number, direction, values = json.loads(
+                force_str(urlsafe_base64_decode(cursor))
+            )
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise InvalidPage('Некорректный курсор страницы')
+        if (not isinstance(number, int) or number < 1
+                or direction not in (FORWARD, BACKWARD)
+                or not isinstance(values, list)
+                or len(values) != len(self.ordering)):
+            raise InvalidPage('Некорректный курсор страницы')
+        return number, direction, [
+            self._cursor_value(field, value)
+            for field, value in zip(self.ordering, values)
+        ]
+
+    def _cursor_value(self, field, value):
+        """Значение из курсора, приведённое к типу поля сортировки.
+
+        Курсор приходит от клиента, поэтому любое неподходящее значение,
+        в том числе null и дата без часового пояса, — InvalidPage.
+        """
+        meta = self.object_list.model._meta
+        annotations = self.object_list.query.annotations
+        name = field.lstrip('-')
+        if name in annotations:
+            field = annotations[name].output_field
+        else:
+            field = meta.pk if name == 'pk' else meta.get_field(name)
+        if isinstance(value, (list, dict)):
+            raise InvalidPage('Некорректный курсор страницы')
+        try:
+            value = field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidPage('Некорректный курсор страницы')
+        if value is None or (
+            isinstance(value, datetime) and settings.USE_TZ
+            and timezone.is_naive(value)
+        ):
+            raise InvalidPage('Некорректный курсор страницы')
+        return value
+
+    def _keyset_filter(self, values, direction):
+        """Условие «строго после граничной записи» в порядке сортировки.
+
+        Для (a, b) по убыванию это a < x OR (a = x AND b < y).
+        """
+        condition = Q()
+        for index in reversed(range(len(self.ordering))):
+            field = self.ordering[index].lstrip('-')
+            descending = self.ordering[index].startswith('-')
+            if direction == BACKWARD:
+                descending = not descending
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[index]})
+            if index < len(self.ordering) - 1:
+                step |= Q(**{field: values[index]}) & condition
+            condition = step
+        return condition
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """CursorPaginator над несколькими querysets, например одной
+    выборкой на разных базах.
+
+    Каждый queryset отдаёт свои per_page + 1 записей за курсором,
+    страница — верхушка их слияния в общем порядке сортировки.
+    """
+
+    def __init__(self, querysets, per_page, **kwargs):
+        super().__init__(querysets[0], per_page, **kwargs)
+        self.querysets = [
+            queryset.order_by(*self.ordering) for queryset in querysets
+        ]
+
+    def _fetch_rows(self, values, direction):
+        return self._merge(self.querysets, values, direction)
+
+    def _merge(self, querysets, values, direction):
+        rows = []
+        for queryset in querysets:
+            rows.extend(self._rows_after(queryset, values, direction))
+        if len(querysets) > 1:
+            self._sort(rows, direction)
+        return rows[:self.per_page + 1]
+
+    def _sort(self, rows, direction):
+        """Сортирует rows в порядке обхода: по полям с последнего
+        к первому, пользуясь устойчивостью сортировки.
+        """
+        for field in reversed(self.ordering):
+            descending = field.startswith('-')
+            if direction == BACKWARD:
+                descending = not descending
+            name = field.lstrip('-')
+            rows.sort(key=lambda row: getattr(row, name), reverse=descending)
+
+    def _total_source(self):
+        return ';'.join(
+            f'{queryset.db}:{queryset.order_by().query}'
+            for queryset in self.querysets
+        )
+
+    def _count(self):
+        return sum(
+            queryset.order_by().count() for queryset in self.querysets
+        )
+
+
+class TieredCursorPaginator(MergedCursorPaginator):
+    """MergedCursorPaginator над ярусами — списками querysets, строки
+    которых в порядке сортировки идут ярус за ярусом, например свежие
+    записи и архив.
+
+    Следующий ярус читается, только если предыдущим не хватило
+    записей на страницу; пустой ярус пропускается.
+    """
+
+    def __init__(self, tiers, per_page, **kwargs):
+        super().__init__(
+            [queryset for tier in tiers for queryset in tier],
+            per_page,
+            **kwargs
+        )
+        self.tiers = [
+            [queryset.order_by(*self.ordering) for queryset in tier]
+            for tier in tiers if tier
+        ]
+
+    def _fetch_rows(self, values, direction):
+        tiers = self.tiers if direction == FORWARD else self.tiers[::-1]
+        rows = []
+        for tier in tiers:
+            rows.extend(self._merge(tier, values, direction))
+            if len(rows) > self.per_page:
+                break
+        return rows[:self.per_page + 1]
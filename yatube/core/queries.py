@@ -0,0 +1,96 @@
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+IN_LIST_RE = re.compile(r'IN \((?:(?:%s|\?)(?:, )?)+\)')
+
+
+def normalize(sql):
+    """Форма запроса: литералы и списки IN заменены заглушками."""
+    shape = LITERAL_RE.sub('?', sql)
+    shape = IN_LIST_RE.sub('IN (...)', shape)
+    return ' '.join(shape.split())
+
+
+class QueryLog:
+    """Запросы к БД, сгруппированные по базе и форме."""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.shapes[context['connection'].alias, normalize(sql)] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def databases(self):
+        """Базы, к которым были запросы."""
+        return {alias for alias, _ in self.shapes}
+
+    def repeats(self, limit):
+        """Формы, выполненные на одной базе limit и более раз, —
+        признак N+1. Один запрос к каждой из нескольких баз повтором
+        не считается.
+        """
+        return {
+            shape: count for (_, shape), count in self.shapes.items()
+            if count >= limit
+        }
+
+    def allowance(self, budget, per_database=0):
+        """Бюджет с надбавкой per_database за каждую базу сверх первой."""
+        return budget + per_database * max(len(self.databases) - 1, 0)
+
+    def problems(self, budget=None, repeat_limit=None, per_database=0):
+        """Описания повторов и превышения бюджета запросов."""
+        if repeat_limit is None:
+            repeat_limit = settings.QUERY_REPEAT_LIMIT
+        problems = [
+            f'{count} запросов одной формы: {shape}'
+            for shape, count in self.repeats(repeat_limit).items()
+        ]
+        if budget is not None:
+            budget = self.allowance(budget, per_database)
+            if self.count > budget:
+                problems.append(
+                    f'{self.count} запросов при бюджете {budget}'
+                )
+        return problems
+
+
+@contextmanager
+def capture():
+    """Собирает запросы текущего потока ко всем базам в QueryLog."""
+    log = QueryLog()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(log))
+        yield log
+
+
+def inspecting():
+    """Включён ли QueryInspectorMiddleware: QUERY_INSPECTOR, а если
+    она None — DEBUG.
+    """
+    if settings.QUERY_INSPECTOR is None:
+        return settings.DEBUG
+    return settings.QUERY_INSPECTOR
+
+
+def query_budget(limit, per_database=0):
+    """Объявляет, сколько запросов к БД может сделать представление.
+
+    per_database — надбавка за каждую базу сверх первой, к которой
+    представление обратилось: шарды и архив читаются по отдельности.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        view.query_budget_per_database = per_database
+        return view
+    return decorator
@@ -0,0 +1,91 @@
+import random
+import re
+import threading
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+WRITE_RE = re.compile(
+    r'\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|REPLACE\s+INTO|UPDATE'
+    r'|DELETE\s+FROM)\s+"?(\w+)"?',
+    re.IGNORECASE,
+)
+
+_state = threading.local()
+
+
+def replica_reads(view):
+    """Разрешает представлению читать с реплик из DATABASE_REPLICAS."""
+    view.replica_reads = True
+    return view
+
+
+def use_replica(enabled):
+    _state.replica = enabled
+    _state.wrote = False
+
+
+def note_write():
+    """Отмечает запись, сделанную за текущий запрос, например
+    в потоке-писателе core.writer.
+    """
+    _state.wrote = True
+
+
+def wrote():
+    """Писал ли текущий запрос в базу."""
+    return getattr(_state, 'wrote', False)
+
+
+def _note_executed_write(execute, sql, params, many, context):
+    result = execute(sql, params, many, context)
+    match = WRITE_RE.match(sql)
+    if match and match.group(1) not in settings.REPLICA_UNPINNED_TABLES:
+        note_write()
+    return result
+
+
+@contextmanager
+def watching_writes():
+    """Отмечает запись, когда INSERT, UPDATE или DELETE действительно
+    выполняется в текущем потоке, а не когда роутер лишь выбрал базу
+    для записи: так выбирает её и чтение в get_or_create.
+    """
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(
+                connections[alias].execute_wrapper(_note_executed_write)
+            )
+        yield
+
+
+class ReplicaRouter:
+    """Чтения представлений с @replica_reads уходят на случайную реплику,
+    все записи — в основную базу.
+
+    После первой выполненной записи (watching_writes) остаток запроса
+    читает основную базу, а
+    ReplicaMiddleware закрепляет за клиентом основную базу ещё на
+    REPLICA_PIN_SECONDS, пока реплики догоняют изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and getattr(_state, 'replica', False) and not wrote():
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
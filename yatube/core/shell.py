@@ -0,0 +1,48 @@
+import copy
+import json
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+HOLE_RE = re.compile(r'<!--hole:([\w-]+)-->')
+
+
+def hole_marker(template_name, kwargs):
+    """Метка на месте пользовательского фрагмента в общей оболочке."""
+    payload = json.dumps([template_name, kwargs])
+    return f'<!--hole:{urlsafe_base64_encode(force_bytes(payload))}-->'
+
+
+def fill_holes(shell, request, context):
+    """Подставляет в оболочку фрагменты, отрисованные для request.user."""
+    def render_hole(match):
+        template_name, kwargs = json.loads(
+            force_str(urlsafe_base64_decode(match.group(1)))
+        )
+        return render_to_string(
+            template_name, {**context, **kwargs}, request=request
+        )
+    return HOLE_RE.sub(render_hole, shell)
+
+
+def render_shell(request, template_name, context, key):
+    """render(), кеширующий страницу в виде, общем для всех посетителей.
+
+    Оболочка рисуется для анонимного посетителя, а места тегов
+    {% hole %} заполняются заново при каждом запросе.
+    """
+    shell = cache.get(key)
+    if shell is None:
+        anonymous = copy.copy(request)
+        anonymous.user = AnonymousUser()
+        shell = render_to_string(
+            template_name, {**context, 'shell': True}, request=anonymous
+        )
+        cache.set(key, shell, settings.SHELL_CACHE_TIMEOUT)
+    return HttpResponse(fill_holes(shell, request, context))
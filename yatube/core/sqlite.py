@@ -0,0 +1,19 @@
+from django.conf import settings
+
+
+def apply_pragmas(cursor, pragmas):
+    """Выполняет PRAGMA name = value для каждой пары из pragmas."""
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure(sender, connection, **kwargs):
+    """Настраивает каждое новое подключение к SQLite по SQLITE_PRAGMAS.
+
+    journal_mode=wal хранится в самом файле базы, остальные
+    настройки действуют только на это подключение.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, settings.SQLITE_PRAGMAS)
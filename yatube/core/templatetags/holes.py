@@ -0,0 +1,22 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.shell import hole_marker
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **kwargs):
+    """Включает шаблон, зависящий от пользователя.
+
+    При отрисовке общей оболочки оставляет вместо него метку, которую
+    core.shell.fill_holes заполняет для каждого запроса. Значения
+    kwargs должны сериализоваться в JSON.
+    """
+    if context.get('shell'):
+        return mark_safe(hole_marker(template_name, kwargs))
+    with context.push(**kwargs):
+        return context.template.engine.get_template(
+            template_name
+        ).render(context)
@@ -0,0 +1,121 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, transaction
+
+from . import replicas
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue()
+_thread = None
+_thread_lock = threading.Lock()
+_local = threading.local()
+
+
+def _writer_thread():
+    global _thread
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(
+                target=_run, name='db-writer', daemon=True
+            )
+            _thread.start()
+    return _thread
+
+
+def _aliases(using):
+    """Базы задачи: основная и using, например шард записи."""
+    return list(dict.fromkeys([DEFAULT_DB_ALIAS, using]))
+
+
+@contextmanager
+def _atomic(aliases):
+    """transaction.atomic() сразу на нескольких базах."""
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def submit(func, *args, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Выполняет func(*args, **kwargs) в потоке-писателе и возвращает
+    её результат или выбрасывает её исключение.
+
+    using — база, на которую func пишет помимо основной: транзакция
+    пачки и точка сохранения задачи открываются и на ней.
+
+    Без WRITE_QUEUE, а также внутри самого писателя и внутри
+    транзакции вызывающего функция выполняется сразу: в чужой
+    транзакции записи не были бы видны до её фиксации.
+    """
+    if (not settings.WRITE_QUEUE or getattr(_local, 'writer', False)
+            or any(transaction.get_connection(alias).in_atomic_block
+                   for alias in _aliases(using))):
+        return func(*args, **kwargs)
+    future = Future()
+    _queue.put((future, func, args, kwargs, using))
+    _writer_thread()
+    try:
+        return future.result()
+    finally:
+        replicas.note_write()
+
+
+def _take_batch():
+    """Первая задача очереди и те, что успели прийти за
+    WRITE_QUEUE_LINGER секунд, но не больше WRITE_QUEUE_BATCH_SIZE.
+    """
+    batch = [_queue.get()]
+    linger = settings.WRITE_QUEUE_LINGER
+    while len(batch) < settings.WRITE_QUEUE_BATCH_SIZE:
+        try:
+            batch.append(_queue.get(timeout=linger) if linger
+                         else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _run():
+    _local.writer = True
+    while True:
+        batch = _take_batch()
+        try:
+            commit(batch)
+        except Exception as error:
+            logger.exception('Не удалось зафиксировать пачку записей')
+            for future, *_ in batch:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            close_old_connections()
+
+
+def commit(batch):
+    """Выполняет пачку задач в одной транзакции на каждой их базе.
+
+    Каждая задача идёт в своей точке сохранения на своих базах: её
+    ошибка откатывает только её. Результаты отдаются после фиксации,
+    чтобы вызывающий сразу видел свои изменения.
+    """
+    outcomes = []
+    aliases = list(dict.fromkeys(
+        alias for *_, using in batch for alias in _aliases(using)
+    ))
+    with _atomic(aliases):
+        for future, func, args, kwargs, using in batch:
+            try:
+                with _atomic(_aliases(using)):
+                    outcomes.append((future, func(*args, **kwargs), None))
+            except Exception as error:
+                outcomes.append((future, None, error))
+    for future, result, error in outcomes:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
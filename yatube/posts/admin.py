@@ -1,5 +1,17 @@
 from django.contrib import admin
-from .models import Post, Group, Comment
+from django.contrib.auth.admin import UserAdmin
+
+from . import deletion, fulltext
+from .models import Post, Group, Comment, User
+
+
+class FullTextSearchMixin:
+    """Поиск по индексу FTS5 вместо LIKE по search_fields."""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return fulltext.matching(queryset, search_term), False
 
 
 class CommentInline(admin.TabularInline):
@@ -7,7 +19,7 @@ class CommentInline(admin.TabularInline):
     fields = ('text', 'created', 'author',)
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -21,6 +33,13 @@ class PostAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
     inlines = [CommentInline]
 
+    def delete_model(self, request, obj):
+        deletion.delete_post(obj)
+
+    def delete_queryset(self, request, queryset):
+        for post in queryset:
+            deletion.delete_post(post)
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
@@ -34,7 +53,7 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'post',
@@ -44,9 +63,23 @@ class CommentAdmin(admin.ModelAdmin):
     )
     search_fields = ('text',)
     list_filter = ('created',)
+    ordering = ('-created',)
     empty_value_display = '-пусто-'
 
 
+class DeferredDeleteUserAdmin(UserAdmin):
+    """Удаление пользователя скрывает его сразу, а вычищает фоном."""
+
+    def delete_model(self, request, obj):
+        deletion.delete_user(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            deletion.delete_user(user)
+
+
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Post, PostAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.unregister(User)
+admin.site.register(User, DeferredDeleteUserAdmin)
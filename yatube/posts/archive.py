@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core import generations
+from . import shards
+from .models import Post
+
+
+def cutoff(days=None):
+    """Дата, старше которой записи уходят в архив: days дней назад,
+    по умолчанию ARCHIVE_AFTER_DAYS.
+    """
+    if days is None:
+        days = settings.ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_older(before, batch_size):
+    """Переносит записи старше before с комментариями, метками
+    и строками лент со свежих баз в архив POST_ARCHIVE.
+
+    Записи идут от старых к новым пачками по batch_size, каждая пачка —
+    своя транзакция; после каждой отдаётся число перенесённых записей.
+    Порядок важен: архив всегда старше свежих баз, и
+    TieredCursorPaginator читает его только на глубоких страницах.
+    Скрытые записи не переносятся: их вычистит deletion.purge().
+    """
+    target = settings.POST_ARCHIVE
+    shards.sync_references(target)
+    for alias in shards.aliases():
+        posts = Post.objects.using(alias).filter(pub_date__lt=before)
+        while True:
+            batch = list(posts.order_by('pub_date', 'pk').values_list(
+                'pk', 'author_id', 'group_id'
+            )[:batch_size])
+            if not batch:
+                break
+            post_ids, author_ids, group_ids = zip(*batch)
+            moved = shards.transfer(posts.filter(pk__in=post_ids), target)
+            generations.bump(
+                'posts',
+                *{f'author:{pk}' for pk in author_ids},
+                *{f'group:{pk}' for pk in group_ids if pk},
+            )
+            yield moved
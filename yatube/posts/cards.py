@@ -0,0 +1,35 @@
+import hashlib
+
+from django.utils.encoding import force_bytes
+
+from core import generations
+
+
+def card_scopes(post):
+    scopes = [f'user:{post.author_id}']
+    if post.group_id:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+def card_key(post, stamps):
+    """Ключ карточки: запись, время её изменения и поколения группы
+    и автора, от которых зависит вёрстка.
+    """
+    scopes = '.'.join(str(stamps[scope]) for scope in card_scopes(post))
+    return f'post_card:{post.pk}:{post.updated.timestamp()}:{scopes}'
+
+
+def shell_key(name, posts, scopes, extra=''):
+    """Ключ закешированной оболочки страницы с карточками posts.
+
+    Меняется вместе с поколениями scopes, поколениями авторов и групп
+    карточек и временем изменения самих записей.
+    """
+    scopes = list(scopes) + sorted(
+        {scope for post in posts for scope in card_scopes(post)}
+    )
+    stamps = ','.join(f'{post.pk}@{post.updated.timestamp()}'
+                      for post in posts)
+    source = f'{generations.key(name, *scopes)}:{stamps}:{extra}'
+    return f'shell:{name}:' + hashlib.md5(force_bytes(source)).hexdigest()
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+PROCESS_LOCAL_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+# Сроки кешей, которые сбрасываются сдвигом поколения или удалением
+# ключа: с кешем процесса остальные процессы отдают их устаревшими
+# до конца срока
+INVALIDATED_TIMEOUTS = (
+    'FEED_CACHE_TIMEOUT',
+    'POST_CARD_CACHE_TIMEOUT',
+    'SHELL_CACHE_TIMEOUT',
+    'AUTHOR_RECENT_TIMEOUT',
+)
+
+
+@register()
+def shared_cache(app_configs, **kwargs):
+    """Карта шардов, адреса строк, страницы лент, карточки, оболочки
+    и списки записей авторов сбрасываются через кеш. Кеш процесса
+    допустим только при одной базе с записями и сроках этих кешей
+    не дольше LOCAL_CACHE_MAX_TIMEOUT: иначе изменения в одном
+    процессе надолго не видны остальным.
+    """
+    if settings.CACHES['default']['BACKEND'] != PROCESS_LOCAL_CACHE:
+        return []
+    errors = []
+    if len(settings.POST_SHARDS) > 1:
+        errors.append(Error(
+            'POST_SHARDS задаёт несколько баз, а кеш LocMemCache '
+            'у каждого процесса свой',
+            hint='Подключите общий кеш: Memcached, Redis или базу данных.',
+            id='posts.E001',
+        ))
+    too_long = [
+        name for name in INVALIDATED_TIMEOUTS
+        if getattr(settings, name) is None
+        or getattr(settings, name) > settings.LOCAL_CACHE_MAX_TIMEOUT
+    ]
+    if too_long:
+        errors.append(Error(
+            f'{", ".join(too_long)} дольше LOCAL_CACHE_MAX_TIMEOUT, '
+            'а кеш LocMemCache у каждого процесса свой',
+            hint='Подключите общий кеш: Memcached, Redis или базу данных, '
+                 'или сократите сроки до LOCAL_CACHE_MAX_TIMEOUT.',
+            id='posts.E002',
+        ))
+    return errors
@@ -0,0 +1,80 @@
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from core import generations
+from . import shards
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def bump_user(user_id, field, delta):
+    """Атомарно меняет счётчик пользователя.
+
+    Строка счётчиков создаётся только при увеличении: при удалении
+    пользователя каскад не должен воссоздавать её заново.
+    """
+    generations.bump(f'profile:{user_id}')
+    stats = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats = stats.filter(**{f'{field}__gte': -delta})
+    if not stats.update(**{field: F(field) + delta}) and delta > 0:
+        UserStats.objects.get_or_create(user_id=user_id)
+        stats.update(**{field: F(field) + delta})
+
+
+def bump_post(post_id, delta, using=None):
+    posts = Post.objects.using(using).filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
+
+
+def _count(queryset, field):
+    """Подзапрос COUNT(*) по связанной таблице для UPDATE ... SET."""
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field
+    ).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def recount():
+    """Пересчитывает все счётчики одним UPDATE на таблицу."""
+    UserStats.objects.bulk_create(
+        [
+            UserStats(user_id=user_id)
+            for user_id in User.objects.filter(
+                stats__isnull=True
+            ).values_list('pk', flat=True)
+        ],
+        ignore_conflicts=True,
+    )
+    for alias in shards.databases():
+        Post.objects.using(alias).update(
+            # Комментарии удалённых пользователей уже не в счётчике
+            comments_count=_count(
+                Comment.objects.using(alias).filter(
+                    author__deletion__isnull=True
+                ),
+                'post',
+            )
+        )
+    UserStats.objects.update(
+        followers_count=_count(Follow.objects, 'author'),
+        following_count=_count(Follow.objects, 'user'),
+    )
+    if len(shards.databases()) == 1:
+        UserStats.objects.update(posts_count=_count(Post.objects, 'author'))
+        return
+    # Записи автора лежат на своей базе и в архиве, не обязательно
+    # на основной.
+    totals = Counter()
+    for alias in shards.databases():
+        totals.update(dict(
+            Post.objects.using(alias).order_by().values('author').annotate(
+                total=Count('pk')
+            ).values_list('author', 'total').iterator()
+        ))
+    UserStats.objects.update(posts_count=0)
+    for author_id, total in totals.items():
+        UserStats.objects.filter(user_id=author_id).update(posts_count=total)
@@ -0,0 +1,212 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core import generations
+from . import counters, feeds, shards
+from .models import (
+    Comment, DeletedUser, Post, PostTag, TimelineEntry, UserStats,
+)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_scheduled = False
+_scheduled_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='purge'
+        )
+    return _executor
+
+
+def delete_post(post):
+    """Скрывает запись сразу; комментарии, метки, строки лент и саму
+    запись с её картинкой purge() удаляет позже, пачками.
+    """
+    hidden = Post._base_manager.using(post._state.db).filter(
+        pk=post.pk, deleted=False
+    ).update(deleted=True, updated=timezone.now())
+    post.deleted = True
+    if hidden:
+        counters.bump_user(post.author_id, 'posts_count', -1)
+        feeds.remove_recent(post)
+        scopes = ['posts', f'author:{post.author_id}', f'post:{post.pk}']
+        if post.group_id:
+            scopes.append(f'group:{post.group_id}')
+        generations.bump(*scopes)
+    schedule()
+
+
+def _hide_comments(user, alias, scopes):
+    """Вычитает скрытые комментарии user из счётчиков записей на базе
+    alias: purge() потом удалит их уже без сигналов.
+    """
+    totals = Comment._base_manager.using(alias).filter(
+        author=user
+    ).order_by().values('post').annotate(
+        total=Count('pk')
+    ).values_list('post', 'total')
+    for post_id, total in totals.iterator():
+        counters.bump_post(post_id, -total, alias)
+        scopes.add(f'post:{post_id}')
+
+
+def delete_user(user):
+    """Отключает пользователя и скрывает его записи и комментарии;
+    всё, что на него ссылается, и его самого purge() удаляет позже,
+    пачками.
+
+    Записи помечаются короткими UPDATE по PURGE_BATCH_SIZE строк,
+    чтобы не держать блокировку записи базы на всё время.
+    """
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    _, created = DeletedUser.objects.get_or_create(user=user)
+    scopes = {'posts', f'author:{user.pk}', f'profile:{user.pk}'}
+    for alias in shards.databases():
+        if created:
+            _hide_comments(user, alias, scopes)
+        posts = Post._base_manager.using(alias).filter(
+            author=user, deleted=False
+        )
+        while True:
+            batch = list(posts.values_list('pk', 'group_id')[
+                :settings.PURGE_BATCH_SIZE
+            ])
+            if not batch:
+                break
+            post_ids, group_ids = zip(*batch)
+            Post._base_manager.using(alias).filter(pk__in=post_ids).update(
+                deleted=True, updated=timezone.now()
+            )
+            scopes.update(f'group:{pk}' for pk in group_ids if pk)
+    UserStats.objects.filter(user=user).update(posts_count=0)
+    cache.delete(feeds.recent_key(user.pk))
+    generations.bump(*scopes)
+    schedule()
+
+
+def _delete_in_batches(queryset, batch_size, signals=False):
+    """Удаляет строки queryset пачками по batch_size, каждую пачку —
+    в своей транзакции. Без signals — одним DELETE без сигналов
+    и каскада: вызывающий знает, что на строки никто не ссылается.
+    """
+    alias = queryset.db
+    while True:
+        with transaction.atomic(using=alias):
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            rows = queryset.model._base_manager.using(alias).filter(
+                pk__in=ids
+            )
+            if signals:
+                rows.delete()
+            else:
+                rows._raw_delete(alias)
+
+
+def _purge_posts(posts, batch_size):
+    """Удаляет записи posts пачками: сначала строки, которые на них
+    ссылаются, затем сами записи — с сигналами, которые отдают
+    картинки на удаление. Возвращает число записей.
+    """
+    alias = posts.db
+    count = 0
+    while True:
+        post_ids = list(posts.values_list('pk', flat=True)[:batch_size])
+        if not post_ids:
+            return count
+        for model in (TimelineEntry, PostTag, Comment):
+            _delete_in_batches(
+                model._base_manager.using(alias).filter(post__in=post_ids),
+                batch_size,
+            )
+        with transaction.atomic(using=alias):
+            Post._base_manager.using(alias).filter(pk__in=post_ids).delete()
+        count += len(post_ids)
+
+
+def _purge_user(user, batch_size):
+    """Удаляет пользователя после его записей, комментариев, подписок
+    и ленты. Возвращает число удалённых записей.
+    """
+    count = 0
+    for alias in shards.databases():
+        count += _purge_posts(
+            Post._base_manager.using(alias).filter(author=user), batch_size
+        )
+        # Из счётчиков комментарии вычел ещё delete_user
+        _delete_in_batches(
+            Comment._base_manager.using(alias).filter(author=user),
+            batch_size,
+        )
+        _delete_in_batches(
+            TimelineEntry._base_manager.using(alias).filter(user=user),
+            batch_size,
+        )
+    # Подписки — с сигналами, ради счётчиков и лент подписчиков
+    for follows in (user.follower.all(), user.following.all()):
+        _delete_in_batches(follows, batch_size, signals=True)
+    user.delete()
+    return count
+
+
+def purge(batch_size=None):
+    """Окончательно удаляет скрытые записи и пользователей из
+    delete_user со всем, что на них ссылается, пачками по batch_size
+    строк, по умолчанию PURGE_BATCH_SIZE.
+
+    Возвращает число удалённых записей и пользователей.
+    """
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    purged = 0
+    for deletion in DeletedUser.objects.select_related('user'):
+        purged += _purge_user(deletion.user, batch_size) + 1
+    for alias in shards.databases():
+        purged += _purge_posts(
+            Post._base_manager.using(alias).filter(deleted=True), batch_size
+        )
+    return purged
+
+
+def _purge_in_background():
+    global _scheduled
+    with _scheduled_lock:
+        _scheduled = False
+    try:
+        purge()
+    except Exception:
+        logger.exception('Не удалось дочистить удалённые записи')
+    finally:
+        close_old_connections()
+
+
+def _submit():
+    """Ставит purge() в очередь, если он уже не ждёт там."""
+    global _scheduled
+    with _scheduled_lock:
+        if _scheduled:
+            return
+        _scheduled = True
+    executor().submit(_purge_in_background)
+
+
+def schedule():
+    """Запускает purge() в фоновом потоке после фиксации транзакции.
+
+    Без PURGE_IN_BACKGROUND удалённое вычищает manage.py purge_deleted.
+    """
+    if settings.PURGE_IN_BACKGROUND:
+        transaction.on_commit(_submit)
@@ -0,0 +1,256 @@
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.paginator import FORWARD, TieredCursorPaginator
+from . import shards
+from .models import Follow, Post, TimelineEntry
+
+
+def recent_key(author_id):
+    return f'author_recent:{author_id}'
+
+
+def _load_recent(author_id, alias):
+    """Последние записи автора с базы alias как ((pub_date, pk), ...)
+    и флаг полноты.
+
+    Архив читается, только если на базе автора записей не хватило.
+    """
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pub_date', 'pk')
+    keys = []
+    for queryset in [
+        posts.using(alias), *shards.archived(posts)
+    ]:
+        keys.extend(queryset[:settings.AUTHOR_RECENT_LENGTH + 1 - len(keys)])
+        if len(keys) > settings.AUTHOR_RECENT_LENGTH:
+            break
+    complete = len(keys) <= settings.AUTHOR_RECENT_LENGTH
+    return keys[:settings.AUTHOR_RECENT_LENGTH], complete
+
+
+def recent_posts(author_ids):
+    """Списки последних записей авторов: из кеша, недостающие — из БД."""
+    keys = {recent_key(author_id): author_id for author_id in author_ids}
+    cached = cache.get_many(keys)
+    aliases = shards.shards_for(
+        [author_id for key, author_id in keys.items() if key not in cached]
+    )
+    missing = {
+        recent_key(author_id): _load_recent(author_id, alias)
+        for author_id, alias in aliases.items()
+    }
+    if missing:
+        cache.set_many(missing, settings.AUTHOR_RECENT_TIMEOUT)
+    cached.update(missing)
+    return list(cached.values())
+
+
+def add_recent(post):
+    """Добавляет новую запись в закешированный список автора."""
+    key = recent_key(post.author_id)
+    recent = cache.get(key)
+    if recent is None:
+        return
+    keys, complete = recent
+    keys = [(post.pub_date, post.pk)] + keys
+    if len(keys) > settings.AUTHOR_RECENT_LENGTH:
+        keys, complete = keys[:settings.AUTHOR_RECENT_LENGTH], False
+    cache.set(key, (keys, complete), settings.AUTHOR_RECENT_TIMEOUT)
+
+
+def remove_recent(post):
+    """Убирает удалённую запись из закешированного списка автора."""
+    key = recent_key(post.author_id)
+    recent = cache.get(key)
+    if recent is None:
+        return
+    keys, complete = recent
+    keys = [item for item in keys if item[1] != post.pk]
+    if not keys and not complete:
+        # Границы обрезанного списка больше нет — перечитать из БД
+        cache.delete(key)
+        return
+    cache.set(key, (keys, complete), settings.AUTHOR_RECENT_TIMEOUT)
+
+
+def merge_recent(recent, after, limit):
+    """k-way слияние списков авторов в ленту по убыванию (pub_date, pk).
+
+    Возвращает не более limit ключей строго после after или None,
+    если до limit не хватает записей, отброшенных при обрезке списков,
+    или граница обрезанного списка неизвестна, потому что он пуст.
+    """
+    if any(not keys for keys, complete in recent if not complete):
+        return None
+    horizon = max(
+        (keys[-1] for keys, complete in recent if not complete),
+        default=None,
+    )
+    result = []
+    for key in heapq.merge(*(keys for keys, _ in recent), reverse=True):
+        if after is not None and key >= after:
+            continue
+        if horizon is not None and key < horizon:
+            return None
+        result.append(key)
+        if len(result) == limit:
+            break
+    return result
+
+
+def followed(user):
+    """id авторов, на которых подписан user."""
+    return list(Follow.objects.filter(user=user).values_list(
+        'author_id', flat=True
+    ))
+
+
+class JoinPaginator(TieredCursorPaginator):
+    """Лента подписок соединением Follow и Post.
+
+    Подписки лежат на основной базе, поэтому на других базах
+    с записями, включая архив, выборка идёт по списку авторов
+    author_ids; без него он читается из Follow.
+    """
+
+    def __init__(self, user, per_page, author_ids=None, **kwargs):
+        posts = Post.objects.select_related('author', 'group')
+        joined = posts.filter(author__following__user=user)
+        if len(shards.databases()) == 1:
+            tiers = [[joined]]
+        else:
+            if author_ids is None:
+                author_ids = followed(user)
+            tiers = shards.tiers(posts.filter(author_id__in=author_ids))
+            if not shards.is_sharded():
+                # Свежие записи лежат на основной базе рядом с подписками
+                tiers[0] = [joined]
+        super().__init__(tiers, per_page, **kwargs)
+
+
+class EntryPaginator(TieredCursorPaginator):
+    """Страницы записей по индексной таблице со ссылкой post
+    и копией pub_date, например TimelineEntry или PostTag.
+
+    Строки таблицы лежат на базе своей записи и читаются со всех баз.
+    """
+
+    def __init__(self, entries, per_page, **kwargs):
+        super().__init__(
+            shards.tiers(
+                entries.filter(post__deleted=False).select_related(
+                    'post__author', 'post__group'
+                )
+            ),
+            per_page,
+            ordering=('-pub_date', '-post_id'),
+            **kwargs
+        )
+
+    def page(self, cursor):
+        page = super().page(cursor)
+        page.object_list = [entry.post for entry in page.object_list]
+        return page
+
+
+class TimelinePaginator(EntryPaginator):
+    """Лента подписок из материализованной таблицы TimelineEntry.
+
+    На каждой базе лента хранит лишь свежие TIMELINE_LENGTH записей.
+    Страницы за горизонтом обрезанной ленты и переходы назад
+    обслуживает соединение из JoinPaginator; его записи
+    оборачиваются в несохранённые строки ленты.
+    """
+
+    def __init__(self, user, per_page, **kwargs):
+        self.user = user
+        self.join_kwargs = kwargs
+        self._exhausted = []
+        entries = TimelineEntry.objects.filter(user=user)
+        super().__init__(entries, per_page, **kwargs)
+
+    def _rows_after(self, queryset, values, direction):
+        rows = super()._rows_after(queryset, values, direction)
+        if len(rows) <= self.per_page:
+            self._exhausted.append((queryset.db, rows[-1] if rows else None))
+        return rows
+
+    def _fetch_rows(self, values, direction):
+        if direction == FORWARD:
+            self._exhausted = []
+            rows = super()._fetch_rows(values, direction)
+            if self._complete(rows):
+                return rows
+        posts = JoinPaginator(
+            self.user, self.per_page, **self.join_kwargs
+        )._fetch_rows(values, direction)
+        return [
+            TimelineEntry(user_id=self.user.pk, post=post,
+                          author_id=post.author_id, pub_date=post.pub_date)
+            for post in posts
+        ]
+
+    def _complete(self, rows):
+        """Нет ли среди rows пропусков из-за обрезки лент.
+
+        Лента базы, исчерпанная выше конца страницы, могла потерять
+        там строки, если её обрезали, то есть в ней не меньше
+        TIMELINE_LENGTH строк.
+        """
+        end = None
+        if len(rows) > self.per_page:
+            end = (rows[-1].pub_date, rows[-1].post_id)
+        for alias, last in self._exhausted:
+            if (end is None or last is None
+                    or (last.pub_date, last.post_id) > end) and (
+                    TimelineEntry.objects.using(alias).filter(
+                        user=self.user
+                    )[settings.TIMELINE_LENGTH - 1:].exists()):
+                return False
+        return True
+
+
+class PullPaginator(JoinPaginator):
+    """Лента подписок слиянием закешированных списков авторов.
+
+    Глубокие страницы и переходы назад обслуживает соединение
+    из JoinPaginator.
+    """
+
+    def __init__(self, user, per_page, **kwargs):
+        self.author_ids = followed(user)
+        super().__init__(user, per_page, self.author_ids, **kwargs)
+
+    def _fetch_rows(self, values, direction):
+        if direction == FORWARD:
+            after = None
+            if values is not None:
+                after = tuple(values)
+            keys = merge_recent(
+                recent_posts(self.author_ids), after, self.per_page + 1
+            )
+            if keys is not None:
+                posts = shards.in_bulk(
+                    Post.objects.select_related('author', 'group'),
+                    [pk for _, pk in keys],
+                )
+                if len(posts) == len(keys):
+                    return [posts[pk] for _, pk in keys]
+        return super()._fetch_rows(values, direction)
+
+
+FOLLOW_PAGINATORS = {
+    'sql': JoinPaginator,
+    'timeline': TimelinePaginator,
+    'pull': PullPaginator,
+}
+
+
+def follow_paginator(user, per_page, **kwargs):
+    """Пагинатор ленты подписок для движка из FOLLOW_FEED_ENGINE."""
+    paginator_class = FOLLOW_PAGINATORS[settings.FOLLOW_FEED_ENGINE]
+    return paginator_class(user, per_page, **kwargs)
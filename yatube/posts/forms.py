@@ -1,4 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
+from .ingest import ImageTooLarge, ingest
 from .models import Post, Comment
 
 
@@ -13,6 +16,17 @@ class PostForm(forms.ModelForm):
             raise forms.ValidationError('Текст поста должен быть заполнен')
         return data
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            return ingest(image)
+        except ImageTooLarge:
+            raise forms.ValidationError(
+                'Картинка слишком большая, уменьшите её разрешение'
+            )
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,130 @@
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Comment, Post
+
+# Таблицы FTS5 с внешним содержимым: индексируется поле text, rowid — pk.
+INDEXES = {
+    Post: 'posts_post_fts',
+    Comment: 'posts_comment_fts',
+}
+TRIGGERS = ('insert', 'delete', 'update')
+
+# Границы совпадения в snippet(); заменяются на <mark> после экранирования.
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+SNIPPET_TOKENS = 16
+
+WORD_RE = re.compile(r'\w+')
+
+
+def index_sql(model, table):
+    source = model._meta.db_table
+    delete = (f"INSERT INTO {table}({table}, rowid, text) "
+              f"VALUES ('delete', old.id, old.text);")
+    insert = f'INSERT INTO {table}(rowid, text) VALUES (new.id, new.text);'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        f"text, content='{source}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER IF NOT EXISTS {table}_insert '
+        f'AFTER INSERT ON {source} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_delete '
+        f'AFTER DELETE ON {source} BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_update '
+        f'AFTER UPDATE OF text ON {source} BEGIN {delete} {insert} END',
+    ]
+
+
+def install(using='default'):
+    """Создаёт индексы FTS5 и поддерживающие их триггеры.
+
+    SQLite удаляет триггеры вместе с таблицей, которую миграция
+    пересобирает, поэтому функция вызывается после каждого migrate;
+    если триггеров не было, индекс пересобирается целиком.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for model, table in INDEXES.items():
+            names = [f'{table}_{event}' for event in TRIGGERS]
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master "
+                "WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+                names,
+            )
+            complete = cursor.fetchone()[0] == len(names)
+            for statement in index_sql(model, table):
+                cursor.execute(statement)
+            if not complete:
+                cursor.execute(
+                    f"INSERT INTO {table}({table}) VALUES ('rebuild')"
+                )
+
+
+def match_expression(text):
+    """Запрос пользователя как выражение MATCH.
+
+    Все слова обязательны, последнее ищется как префикс; операторы
+    и кавычки FTS5 из ввода не попадают в запрос.
+    """
+    terms = [f'"{word}"' for word in WORD_RE.findall(text)]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching(queryset, text):
+    """Объекты queryset, текст которых подходит под запрос text."""
+    expression = match_expression(text)
+    if not expression:
+        return queryset.none()
+    if connections[queryset.db].vendor != 'sqlite':
+        return queryset.filter(text__icontains=text)
+    table = INDEXES[queryset.model]
+    source = queryset.model._meta.db_table
+    # pk__in=RawSQL(...) даёт IN ((...)), что SQLite читает как скаляр.
+    return queryset.extra(
+        where=[f'{source}.id IN '
+               f'(SELECT rowid FROM {table} WHERE {table} MATCH %s)'],
+        params=[expression],
+    )
+
+
+def search_posts(text):
+    """Записи под запрос с рангом bm25 (меньше — лучше) и фрагментом."""
+    posts = matching(Post.objects.select_related('author', 'group'), text)
+    if connections[posts.db].vendor != 'sqlite':
+        return posts.annotate(
+            rank=Value(0.0, output_field=FloatField()), snippet=F('text')
+        )
+    table = INDEXES[Post]
+    match = (f'FROM {table} WHERE {table} MATCH %s '
+             f'AND rowid = {Post._meta.db_table}.id')
+    expression = match_expression(text)
+    return posts.annotate(
+        rank=RawSQL(
+            f'SELECT bm25({table}) {match}', (expression,), FloatField()
+        ),
+        snippet=RawSQL(
+            f"SELECT snippet({table}, 0, %s, %s, '…', {SNIPPET_TOKENS}) "
+            f'{match}',
+            (HIGHLIGHT_START, HIGHLIGHT_END, expression),
+            TextField(),
+        ),
+    )
+
+
+def highlight(snippet):
+    """Фрагмент из snippet() в HTML с <mark> вокруг совпадений."""
+    return mark_safe(
+        escape(snippet)
+        .replace(HIGHLIGHT_START, '<mark>')
+        .replace(HIGHLIGHT_END, '</mark>')
+    )
@@ -0,0 +1,131 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from sorl.thumbnail import delete as delete_thumbnails
+
+from core import generations
+from . import shards
+from .ingest import placeholder as make_placeholder
+from .models import Post, StoredImage
+from .thumbnails import source_image
+
+logger = logging.getLogger(__name__)
+
+
+def image_name(post):
+    """Имя картинки записи без обращения к БД для отложенного поля."""
+    value = post.__dict__.get('image')
+    return getattr(value, 'name', value) or ''
+
+
+def placeholder(image):
+    """Заглушка для картинки записи; пустая, если картинки нет
+    или файл не читается.
+    """
+    if not image:
+        return ''
+    committed = image._committed
+    try:
+        image.open()
+        return make_placeholder(image, settings.IMAGE_PLACEHOLDER_WIDTH)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        logger.exception('Не удалось построить заглушку для %s', image.name)
+        return ''
+    finally:
+        # Незафиксированную загрузку ещё сохранит хранилище.
+        if committed:
+            image.close()
+
+
+def retain(name, content=None):
+    """Учитывает ещё одну запись, ссылающуюся на файл name.
+
+    Строка StoredImage служит замком файла: ссылка учитывается
+    записью в неё, и удаление того же файла ждёт конца транзакции.
+    Если файл удалили между сохранением загрузки content и этим
+    вызовом, он записывается заново.
+    """
+    if not name:
+        return
+    with transaction.atomic():
+        # Сначала запись, а не чтение: замок берётся сразу
+        counted = StoredImage.objects.filter(name=name).update(
+            references=F('references') + 1
+        )
+        if not counted:
+            StoredImage.objects.create(name=name, references=1)
+        storage = source_image(name).storage
+        if content is not None and not storage.exists(name):
+            content.seek(0)
+            storage.save(name, content)
+
+
+def release(name):
+    """Снимает ссылку на файл; последний освобождённый файл удаляется
+    вместе с миниатюрами после фиксации транзакции.
+    """
+    if not name:
+        return
+    StoredImage.objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1
+    )
+    transaction.on_commit(lambda: _delete_unreferenced(name))
+
+
+def _delete_unreferenced(name):
+    """Удаляет файл name, если на него так и не появилось ссылок.
+
+    Счётчик перепроверяется, а файл удаляется в той же транзакции,
+    что и строка StoredImage: retain() того же файла ждёт её.
+    """
+    with transaction.atomic():
+        deleted, _ = StoredImage.objects.filter(
+            name=name, references=0
+        ).delete()
+        if deleted:
+            _delete_file(name)
+
+
+def _delete_file(name):
+    try:
+        delete_thumbnails(source_image(name))
+    except (OSError, SuspiciousFileOperation):
+        logger.exception('Не удалось удалить файл %s', name)
+
+
+def shard(name):
+    """Переносит файл name в подкаталог его хеша и возвращает новое имя.
+
+    Записи и учёт ссылок переводятся на новое имя одной короткой
+    транзакцией; старый файл с миниатюрами удаляется после неё.
+    """
+    storage = source_image(name).storage
+    with storage.open(name) as file:
+        new_name = storage.save(name, file)
+    if new_name == name:
+        return name
+    with transaction.atomic():
+        scopes = {'posts'}
+        for posts in shards.across(Post._base_manager.filter(image=name)):
+            for author_id, group_id in posts.values_list(
+                'author_id', 'group_id'
+            ):
+                scopes.add(f'author:{author_id}')
+                if group_id:
+                    scopes.add(f'group:{group_id}')
+            posts.update(image=new_name, updated=timezone.now())
+        references = StoredImage.objects.filter(name=name).values_list(
+            'references', flat=True
+        ).first() or 0
+        StoredImage.objects.get_or_create(name=new_name)
+        StoredImage.objects.filter(name=new_name).update(
+            references=F('references') + references
+        )
+        StoredImage.objects.filter(name=name).delete()
+        generations.bump(*scopes)
+        transaction.on_commit(lambda: _delete_file(name))
+    return new_name
@@ -0,0 +1,85 @@
+import base64
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+OUTPUT_FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'PNG': ('png', 'image/png'),
+    'GIF': ('gif', 'image/gif'),
+    'WEBP': ('webp', 'image/webp'),
+}
+
+
+# Форматы, которые Pillow умеет раскодировать сразу в уменьшенном виде
+DRAFT_FORMATS = ('JPEG', 'MPO')
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def process(file, max_pixels, master_size, quality=90,
+            max_decoded_pixels=None):
+    """Ужимает картинку до master_size, не раскодируя её целиком.
+
+    Размер проверяется по заголовку до декодирования. JPEG декодируется
+    сразу в уменьшенном в 2, 4 или 8 раз масштабе (draft), остальные
+    форматы — целиком, поэтому для них действует меньший предел
+    max_decoded_pixels. Поворот из EXIF применяется к пикселям, а сами
+    метаданные EXIF в результат не попадают.
+    Возвращает (байты, формат).
+    """
+    with Image.open(file) as image:
+        width, height = image.size
+        source_format = image.format
+        limit = max_pixels
+        if source_format not in DRAFT_FORMATS and max_decoded_pixels:
+            limit = min(limit, max_decoded_pixels)
+        if width * height > limit:
+            raise ImageTooLarge(f'{width}x{height}')
+        scale = min(1, master_size[0] / width, master_size[1] / height)
+        image.draft(None, (int(width * scale), int(height * scale)))
+        image.thumbnail(master_size, Image.LANCZOS)
+        image = ImageOps.exif_transpose(image)
+        output_format = source_format
+        if output_format not in OUTPUT_FORMATS:
+            output_format = 'JPEG'
+        if output_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        options = {'quality': quality} if output_format != 'GIF' else {}
+        image.save(buffer, output_format, **options)
+    return buffer.getvalue(), output_format
+
+
+def ingest(upload):
+    """Загруженный файл, приведённый к мастер-размеру без EXIF."""
+    upload.seek(0)
+    data, output_format = process(
+        upload,
+        settings.IMAGE_MAX_PIXELS,
+        settings.IMAGE_MASTER_SIZE,
+        settings.IMAGE_MASTER_QUALITY,
+        settings.IMAGE_MAX_DECODED_PIXELS,
+    )
+    extension, content_type = OUTPUT_FORMATS[output_format]
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return SimpleUploadedFile(f'{name}.{extension}', data, content_type)
+
+
+def placeholder(file, width):
+    """Крошечная копия картинки в виде data: URI для первой отрисовки."""
+    with Image.open(file) as image:
+        image.draft('RGB', (width, width))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((width, width))
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=50)
+    file.seek(0)
+    return 'data:image/jpeg;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings as django_settings
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import generations
+
+EMPTY_VALUE = cached_db_kvstore.EMPTY_VALUE
+
+GENERATION_SCOPE = 'thumbnail_kvstore'
+INSERT_SCOPE = 'thumbnail_kvstore_insert'
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    """KV-хранилище sorl с LRU в памяти процесса и пакетной предвыборкой.
+
+    Порядок поиска: LRU, общий кеш, таблица thumbnail_kvstore.
+    prefetch() заполняет LRU сразу для всей страницы одним get_many
+    и одним запросом к БД.
+
+    Записи LRU, в том числе об отсутствии ключа, живут не дольше
+    THUMBNAIL_LRU_TIMEOUT. Кроме того, удаление и перезапись
+    существующего ключа сдвигают общее поколение, а prefetch()
+    сверяется с ним и отбрасывает записи LRU, сделанные до изменений
+    в других процессах. Новый ключ сдвигает отдельное поколение,
+    от которого зависят только записи об отсутствии ключей: иначе
+    каждая новая миниатюра сбрасывала бы LRU всех процессов.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = (None, None)
+        self.stats = {'hits': 0, 'misses': 0, 'prefetched': 0}
+
+    def _remember(self, key, value):
+        expires = time.monotonic() + django_settings.THUMBNAIL_LRU_TIMEOUT
+        with self._lock:
+            self._lru[key] = (value, self._generation, expires)
+            self._lru.move_to_end(key)
+            while len(self._lru) > django_settings.THUMBNAIL_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _recall(self, key):
+        """Значение из LRU или None, если его нет или оно устарело.
+
+        Вызывается под self._lock.
+        """
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        value, (generation, inserts), expires = entry
+        current, current_inserts = self._generation
+        stale = generation != current or (
+            value == EMPTY_VALUE and inserts != current_inserts
+        )
+        if stale or expires <= time.monotonic():
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return value
+
+    def _get_raw(self, key):
+        with self._lock:
+            value = self._recall(key)
+            if value is not None:
+                self.stats['hits'] += 1
+            else:
+                self.stats['misses'] += 1
+        if value is None:
+            value = super()._get_raw(key)
+            self._remember(key, EMPTY_VALUE if value is None else value)
+        if value == EMPTY_VALUE:
+            return None
+        return value
+
+    def _set_raw(self, key, value):
+        stored, created = KVStoreModel.objects.get_or_create(
+            key=key, defaults={'value': value}
+        )
+        changed = not created and stored.value != value
+        if changed:
+            stored.value = value
+            stored.save()
+        self.cache.set(key, value, settings.THUMBNAIL_CACHE_TIMEOUT)
+        if created:
+            generations.bump(INSERT_SCOPE)
+        elif changed:
+            generations.bump(GENERATION_SCOPE)
+        self._remember(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        generations.bump(GENERATION_SCOPE)
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def prefetch(self, keys):
+        """Загружает значения ключей, которых ещё нет в LRU, пачкой.
+
+        Заодно сверяет поколения: после удалений и перезаписей в других
+        процессах весь LRU считается устаревшим, после новых ключей —
+        только записи об отсутствии ключей.
+        """
+        generation = tuple(generations.get(GENERATION_SCOPE, INSERT_SCOPE))
+        with self._lock:
+            self._generation = generation
+            keys = [key for key in keys if self._recall(key) is None]
+        if not keys:
+            return
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            stored = dict(KVStoreModel.objects.filter(
+                key__in=missing
+            ).values_list('key', 'value'))
+            found = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(found, settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(found)
+        for key, value in values.items():
+            self._remember(key, value)
+        with self._lock:
+            self.stats['prefetched'] += len(keys)
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self.stats:
+                self.stats[name] = 0
+
+    def clear_local(self):
+        """Очищает LRU процесса; общий кеш и БД не затрагиваются."""
+        with self._lock:
+            self._lru.clear()
+        self.reset_stats()
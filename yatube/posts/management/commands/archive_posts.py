@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = ('Переносит старые записи с комментариями к ним в архивную '
+            'базу POST_ARCHIVE')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Возраст записей, дней; по умолчанию '
+                                 'ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.ARCHIVE_BATCH_SIZE,
+                            help='Сколько записей переносить за проход')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Пауза между проходами, секунд')
+
+    def handle(self, *args, **options):
+        if not settings.POST_ARCHIVE:
+            raise CommandError('Архивная база POST_ARCHIVE не задана')
+        before = archive.cutoff(options['days'])
+        count = 0
+        for moved in archive.archive_older(before, options['batch_size']):
+            count += moved
+            self.stdout.write(f'Перенесено записей: {count}')
+            time.sleep(options['pause'])
+        self.stdout.write(f'Готово, перенесено записей: {count}')
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import shards, tags
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет хештеги и упоминания для уже существующих записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Сколько записей обрабатывать за проход')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Пауза между проходами, секунд')
+        parser.add_argument('--after', type=int, default=0,
+                            help='Продолжить с записей с id больше этого')
+
+    def handle(self, *args, **options):
+        count = 0
+        for alias in shards.databases():
+            last = options['after']
+            while True:
+                posts = list(Post.objects.using(alias).filter(
+                    pk__gt=last
+                ).order_by('pk').only(
+                    'pk', 'text', 'pub_date'
+                )[:options['batch_size']])
+                if not posts:
+                    break
+                tags.sync(posts, alias)
+                last = posts[-1].pk
+                count += len(posts)
+                self.stdout.write(
+                    f'Обработано записей: {count}, до id {last}'
+                )
+                time.sleep(options['pause'])
+        self.stdout.write(f'Готово, обработано записей: {count}')
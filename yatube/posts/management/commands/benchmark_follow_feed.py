@@ -0,0 +1,43 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.feeds import FOLLOW_PAGINATORS
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время построения ленты подписок разными движками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Читатель ленты')
+        parser.add_argument('--pages', type=int, default=5,
+                            help='Сколько страниц пролистать подряд')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Число повторов для усреднения')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('Пользователь не найден')
+        cache.clear()
+        for engine, paginator_class in FOLLOW_PAGINATORS.items():
+            self.walk(user, paginator_class, options['pages'])
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                self.walk(user, paginator_class, options['pages'])
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(
+                f'{engine:>8}: {elapsed * 1000:.2f} мс '
+                f'на {options["pages"]} стр.'
+            )
+
+    def walk(self, user, paginator_class, pages):
+        cursor = None
+        for _ in range(pages):
+            page = paginator_class(user, 10).get_page(cursor)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.sqlite import apply_pragmas
+
+# Настройки SQLite и драйвера sqlite3 по умолчанию
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'delete',
+    'synchronous': 'full',
+    'mmap_size': 0,
+    'cache_size': -2000,
+}
+DEFAULT_CACHED_STATEMENTS = 128
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author INTEGER, '
+    'text TEXT, pub_date REAL)',
+    'CREATE INDEX post_pub_date ON post (pub_date DESC, id DESC)',
+)
+READ = 'SELECT id, author, text FROM post ORDER BY pub_date DESC, id DESC '\
+       'LIMIT 10'
+WRITE = 'INSERT INTO post (author, text, pub_date) VALUES (?, ?, ?)'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite без настроек '
+            'и с SQLITE_PRAGMAS при параллельных чтениях и записях')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Потоков, читающих ленту')
+        parser.add_argument('--writers', type=int, default=2,
+                            help='Потоков, добавляющих записи')
+        parser.add_argument('--seconds', type=float, default=3,
+                            help='Длительность прогона каждого профиля')
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Записей в базе перед прогоном')
+
+    def handle(self, *args, **options):
+        profiles = {
+            'default': (DEFAULT_PRAGMAS, DEFAULT_CACHED_STATEMENTS),
+            'tuned': (
+                settings.SQLITE_PRAGMAS,
+                settings.DATABASES['default'].get('OPTIONS', {}).get(
+                    'cached_statements', DEFAULT_CACHED_STATEMENTS
+                ),
+            ),
+        }
+        for name, (pragmas, statements) in profiles.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.prepare(path, options['rows'])
+                reads, writes, locked = self.run(
+                    path, pragmas, statements, options
+                )
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{name:>8}: чтений {reads / seconds:.0f}/с, '
+                f'записей {writes / seconds:.0f}/с, '
+                f'ошибок блокировки {locked}'
+            )
+
+    def prepare(self, path, rows):
+        with sqlite3.connect(path) as db:
+            for statement in SCHEMA:
+                db.execute(statement)
+            db.executemany(WRITE, (
+                (pk % 100, f'Запись {pk}', pk) for pk in range(rows)
+            ))
+        db.close()
+
+    def run(self, path, pragmas, statements, options):
+        """Запускает потоки на options['seconds'] секунд и возвращает
+        число чтений, записей и отказов «database is locked».
+        """
+        counts = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+
+        def worker(write):
+            db = sqlite3.connect(
+                path, isolation_level=None, cached_statements=statements
+            )
+            apply_pragmas(db.cursor(), pragmas)
+            done = locked = 0
+            while time.monotonic() < deadline:
+                try:
+                    if write:
+                        db.execute('BEGIN IMMEDIATE')
+                        db.execute(WRITE, (1, 'Запись', time.time()))
+                        db.execute('COMMIT')
+                    else:
+                        db.execute(READ).fetchall()
+                    done += 1
+                except sqlite3.OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    if db.in_transaction:
+                        db.execute('ROLLBACK')
+                    locked += 1
+            db.close()
+            with lock:
+                counts['writes' if write else 'reads'] += done
+                counts['locked'] += locked
+
+        threads = [
+            threading.Thread(target=worker, args=(write,))
+            for write in [False] * options['readers']
+            + [True] * options['writers']
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts['reads'], counts['writes'], counts['locked']
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import media_gc
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки, на которые не ссылаются записи, '
+            'и миниатюры, о которых не знает sorl')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, что можно удалить')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Сколько файлов проверять за проход')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Пауза между проходами, секунд')
+        parser.add_argument('--min-age', type=int, default=60 * 60,
+                            help='Не трогать файлы моложе, секунд')
+
+    def handle(self, *args, **options):
+        files, size = media_gc.collect(
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+            min_age=options['min_age'],
+            pause=lambda: time.sleep(options['pause']),
+        )
+        action = 'Можно удалить' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'{action} файлов: {files}, байт: {size}'
+        )
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import deletion
+
+
+class Command(BaseCommand):
+    help = ('Окончательно удаляет скрытые записи и удалённых '
+            'пользователей со всем, что на них ссылается')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.PURGE_BATCH_SIZE,
+                            help='Сколько строк удалять за транзакцию')
+
+    def handle(self, *args, **options):
+        purged = deletion.purge(options['batch_size'])
+        self.stdout.write(f'Удалено записей и пользователей: {purged}')
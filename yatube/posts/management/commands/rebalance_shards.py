@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import shards
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Переносит записи автора с комментариями к ним на другую '
+            'базу из POST_SHARDS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Автор')
+        parser.add_argument('alias', help='База, на которую перенести')
+
+    def handle(self, *args, **options):
+        if options['alias'] not in settings.POST_SHARDS:
+            raise CommandError('Базы нет в POST_SHARDS')
+        try:
+            author = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('Пользователь не найден')
+        moved = shards.move_author(author, options['alias'])
+        self.stdout.write(
+            f'Перенесено записей: {moved}, база автора: {options["alias"]}'
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пользователи; по умолчанию все, у кого есть подписки',
+        )
+        parser.add_argument(
+            '--trim', action='store_true',
+            help='Только обрезать ленты до TIMELINE_LENGTH записей',
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(follower__isnull=False).distinct()
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+        action = timeline.trim if options['trim'] else timeline.rebuild
+        count = 0
+        for user in users.iterator():
+            action(user)
+            count += 1
+        self.stdout.write(f'Обработано лент: {count}')
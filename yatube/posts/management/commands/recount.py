@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики записей, комментариев и подписок'
+
+    def handle(self, *args, **options):
+        counters.recount()
+        self.stdout.write('Счётчики пересчитаны')
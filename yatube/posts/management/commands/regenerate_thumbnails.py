@@ -0,0 +1,105 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from posts import shards, thumbnails
+from posts.models import Post
+
+
+def _generate_chunk(names, force):
+    """Миниатюры для пачки файлов: (число готовых, неудачные имена)."""
+    failed = []
+    for name in names:
+        try:
+            thumbnails.generate(name, force=force)
+        except Exception:
+            failed.append(name)
+    return len(names) - len(failed), failed
+
+
+def _generate_chunk_in_worker(names, force):
+    """Задача дочернего процесса: _generate_chunk и закрытие соединений.
+
+    В родителе соединение закрывать нельзя: по нему читаются имена.
+    """
+    try:
+        return _generate_chunk(names, force)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Пересоздаёт миниатюры всех картинок записей в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Число процессов; 1 — без пула')
+        parser.add_argument('--chunk-size', type=int, default=50,
+                            help='Сколько файлов отдавать процессу за раз')
+        parser.add_argument('--force', action='store_true',
+                            help='Удалить старые миниатюры перед созданием')
+
+    def chunks(self, size):
+        """Имена картинок записей со всех баз, включая архив, пачками
+        по size. Имена читаются потоком; картинку, которая уже встречалась
+        на предыдущей базе, пачка пропускает.
+        """
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        seen = []
+        for queryset in shards.across(names):
+            chunk = []
+            for name in queryset.iterator():
+                chunk.append(name)
+                if len(chunk) == size:
+                    yield from self._unseen(chunk, seen)
+                    chunk = []
+            if chunk:
+                yield from self._unseen(chunk, seen)
+            seen.append(queryset)
+
+    def _unseen(self, chunk, seen):
+        for queryset in seen:
+            known = set(queryset.filter(image__in=chunk))
+            chunk = [name for name in chunk if name not in known]
+        if chunk:
+            yield chunk
+
+    def generate(self, chunks, workers, force):
+        """Результаты _generate_chunk по пачкам. В пуле одновременно
+        не больше двух пачек на процесс, чтобы не держать все имена
+        в памяти.
+        """
+        if workers == 1:
+            for chunk in chunks:
+                yield _generate_chunk(chunk, force)
+            return
+        # Дочерние процессы не должны делить соединения родителя:
+        # пул запускается до того, как родитель начнёт читать имена
+        # (при fork первая задача сразу порождает все процессы пула).
+        connections.close_all()
+        with ProcessPoolExecutor(workers) as pool:
+            pool.submit(close_old_connections).result()
+            running = deque()
+            for chunk in chunks:
+                running.append(
+                    pool.submit(_generate_chunk_in_worker, chunk, force)
+                )
+                if len(running) >= 2 * workers:
+                    yield running.popleft().result()
+            while running:
+                yield running.popleft().result()
+
+    def handle(self, *args, **options):
+        chunks = self.chunks(options['chunk_size'])
+        done = 0
+        for count, failed in self.generate(
+            chunks, options['workers'], options['force']
+        ):
+            done += count
+            for name in failed:
+                self.stderr.write(f'Ошибка: {name}')
+        self.stdout.write(f'Готово файлов: {done}')
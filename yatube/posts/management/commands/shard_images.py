@@ -0,0 +1,57 @@
+import time
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+
+from posts import images, thumbnails
+from posts.models import Post, StoredImage
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки записей из плоского каталога '
+            'в подкаталоги по хешу')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Сколько файлов переносить за проход')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Пауза между проходами, секунд')
+        parser.add_argument('--no-thumbnails', action='store_true',
+                            help='Не готовить миниатюры для новых имён')
+
+    def batches(self, size):
+        """Неперенесённые файлы пачками по возрастанию имени.
+
+        Перенесённые файлы пропускаются, поэтому прерванный запуск
+        можно просто повторить.
+        """
+        storage = Post._meta.get_field('image').storage
+        last = ''
+        while True:
+            names = list(
+                StoredImage.objects.filter(name__gt=last).order_by(
+                    'name'
+                ).values_list('name', flat=True)[:size]
+            )
+            if not names:
+                return
+            last = names[-1]
+            batch = [name for name in names if not storage.is_sharded(name)]
+            if batch:
+                yield batch
+
+    def handle(self, *args, **options):
+        moved = 0
+        for batch in self.batches(options['batch_size']):
+            for name in batch:
+                try:
+                    new_name = images.shard(name)
+                except (OSError, SuspiciousFileOperation) as error:
+                    self.stderr.write(f'Пропущен {name}: {error}')
+                    continue
+                if not options['no_thumbnails']:
+                    thumbnails.generate(new_name)
+                moved += 1
+            self.stdout.write(f'Перенесено файлов: {moved}')
+            time.sleep(options['pause'])
+        self.stdout.write(f'Готово, перенесено файлов: {moved}')
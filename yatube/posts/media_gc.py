@@ -0,0 +1,148 @@
+import posixpath
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from sorl.thumbnail import default, delete
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import shards
+from .models import Post, StoredImage
+from .thumbnails import source_image
+
+
+def walk(storage, path):
+    """Имена файлов каталога path и его подкаталогов по одному."""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for name in sorted(files):
+        yield posixpath.join(path, name)
+    for directory in sorted(directories):
+        yield from walk(storage, posixpath.join(path, directory))
+
+
+def batches(names, size):
+    batch = []
+    for name in names:
+        batch.append(name)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _settled(storage, names, min_age):
+    """Файлы старше min_age секунд: свежие могут ещё ждать свою запись."""
+    threshold = timezone.now() - timedelta(seconds=min_age)
+    return [
+        name for name in names
+        if storage.get_modified_time(name) < threshold
+    ]
+
+
+def originals():
+    """Хранилище и каталог исходных картинок записей."""
+    field = Post._meta.get_field('image')
+    return field.storage, field.upload_to.rstrip('/')
+
+
+def orphan_originals(names, min_age):
+    """Картинки из names, на которые не ссылается ни одна запись."""
+    storage, _ = originals()
+    referenced = set()
+    # Скрытые записи держат картинку до окончательного удаления
+    for posts in shards.across(Post._base_manager.filter(image__in=names)):
+        referenced.update(posts.values_list('image', flat=True))
+    names = [name for name in names if name not in referenced]
+    return _settled(storage, names, min_age)
+
+
+def orphan_thumbnails(names, min_age):
+    """Миниатюры из names, о которых не знает KV-хранилище sorl."""
+    keys = {
+        add_prefix(ImageFile(name, default.storage).key): name
+        for name in names
+    }
+    known = set(KVStoreModel.objects.filter(key__in=keys).values_list(
+        'key', flat=True
+    ))
+    names = [name for key, name in keys.items() if key not in known]
+    return _settled(default.storage, names, min_age)
+
+
+def registered_thumbnails(name):
+    """Миниатюры, созданные sorl для исходника name."""
+    keys = default.kvstore._get(
+        source_image(name).key, identity='thumbnails'
+    ) or []
+    thumbnails = (default.kvstore._get(key) for key in keys)
+    return [thumbnail.name for thumbnail in thumbnails if thumbnail]
+
+
+def original_size(name):
+    """Сколько байт освободит удаление исходника вместе с миниатюрами."""
+    size = source_image(name).storage.size(name)
+    for thumbnail in registered_thumbnails(name):
+        if default.storage.exists(thumbnail):
+            size += default.storage.size(thumbnail)
+    return size
+
+
+def delete_original(name):
+    """Удаляет исходник, его миниатюры и записи о них, если на него
+    так и не появилось ссылок. Возвращает, удалён ли файл.
+
+    Как в images._delete_unreferenced: счётчик и записи перепроверяются
+    под замком строки StoredImage, а файл удаляется в той же транзакции
+    и только вместе со строкой. Повторная загрузка того же файла
+    не меняет его mtime, так что min_age её не защищает.
+    """
+    with transaction.atomic():
+        # У файлов, загруженных до учёта ссылок, строки-замка нет
+        StoredImage.objects.get_or_create(name=name)
+        deleted, _ = StoredImage.objects.filter(
+            name=name, references=0
+        ).delete()
+        if not deleted:
+            return False
+        if any(posts.exists() for posts in shards.across(
+            Post._base_manager.filter(image=name)
+        )):
+            transaction.set_rollback(True)
+            return False
+        delete(source_image(name))
+    return True
+
+
+def collect(dry_run=False, batch_size=500, min_age=3600, pause=None):
+    """Удаляет неиспользуемые картинки и миниатюры пачками.
+
+    Сначала обходится каталог исходников, затем каталог миниатюр,
+    чтобы миниатюры удалённых исходников уже не учитывались.
+    После каждой пачки вызывается pause(). Возвращает
+    (число файлов, байт) — удалённых или, при dry_run, к удалению.
+    """
+    files = size = 0
+    for batch in batches(walk(*originals()), batch_size):
+        for name in orphan_originals(batch, min_age):
+            name_size = original_size(name)
+            if dry_run or delete_original(name):
+                files += 1
+                size += name_size
+        if pause is not None:
+            pause()
+    thumbnails = walk(default.storage, sorl_settings.THUMBNAIL_PREFIX)
+    for batch in batches(thumbnails, batch_size):
+        for name in orphan_thumbnails(batch, min_age):
+            files += 1
+            size += default.storage.size(name)
+            if not dry_run:
+                default.storage.delete(name)
+        if pause is not None:
+            pause()
+    return files, size
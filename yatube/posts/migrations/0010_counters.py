@@ -0,0 +1,103 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:11
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def has_column(schema_editor, column):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        return column in {
+            info.name for info in
+            connection.introspection.get_table_description(
+                cursor, 'posts_post'
+            )
+        }
+
+
+def add_comments_count(apps, schema_editor):
+    # Откат не удаляет столбец: DROP COLUMN появился лишь в SQLite 3.35.
+    # Оставшийся после отката столбец повторно не добавляется.
+    if has_column(schema_editor, 'comments_count'):
+        return
+    schema_editor.execute(
+        'ALTER TABLE "posts_post" ADD COLUMN "comments_count" '
+        'integer unsigned NOT NULL DEFAULT 0 '
+        'CHECK ("comments_count" >= 0)'
+    )
+
+
+def count(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field
+    ).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in User.objects.values_list(
+            'pk', flat=True)],
+        batch_size=500,
+    )
+    Post.objects.update(comments_count=count(Comment.objects, 'post'))
+    UserStats.objects.update(
+        posts_count=count(Post.objects, 'author'),
+        followers_count=count(Follow.objects, 'author'),
+        following_count=count(Follow.objects, 'user'),
+    )
+
+
+class Migration(migrations.Migration):
+    # Поле comments_count добавляется через ALTER TABLE ADD COLUMN, а не
+    # пересборкой posts_post: AddField в SQLite копирует всю таблицу
+    # под блокировкой записи. Атомарно выполняется только заполнение
+    # счётчиков.
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число записей')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+            ],
+            options={
+                'verbose_name': 'счётчики пользователя',
+                'verbose_name_plural': 'счётчики пользователей',
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    add_comments_count, migrations.RunPython.noop,
+                    hints={'model_name': 'post'},
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='post',
+                    name='comments_count',
+                    field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+                ),
+            ],
+        ),
+        migrations.RunPython(
+            fill_counters, migrations.RunPython.noop, atomic=True
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def has_column(schema_editor, column):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        return column in {
+            info.name for info in
+            connection.introspection.get_table_description(
+                cursor, 'posts_post'
+            )
+        }
+
+
+def add_updated(apps, schema_editor):
+    # Откат столбец не удаляет (DROP COLUMN — только с SQLite 3.35),
+    # и повторно применённая миграция застаёт его на месте.
+    if has_column(schema_editor, 'updated'):
+        return
+    # ADD COLUMN в SQLite принимает только постоянное значение
+    # по умолчанию: время миграции подставляется в SQL литералом.
+    now = schema_editor.connection.ops.adapt_datetimefield_value(
+        django.utils.timezone.now()
+    )
+    schema_editor.execute(
+        'ALTER TABLE "posts_post" ADD COLUMN "updated" datetime '
+        'NOT NULL DEFAULT %s' % schema_editor.quote_value(now)
+    )
+
+
+class Migration(migrations.Migration):
+    # Поле updated добавляется через ALTER TABLE ADD COLUMN, а не
+    # пересборкой posts_post: AddField в SQLite копирует всю таблицу
+    # под блокировкой записи.
+    atomic = False
+
+    dependencies = [
+        ('posts', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    add_updated, migrations.RunPython.noop,
+                    hints={'model_name': 'post'},
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='post',
+                    name='updated',
+                    field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+                    preserve_default=False,
+                ),
+            ],
+        ),
+    ]
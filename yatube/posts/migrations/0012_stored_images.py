@@ -0,0 +1,53 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:18
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def count_references(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    StoredImage = apps.get_model('posts', 'StoredImage')
+    references = Post.objects.exclude(image='').order_by().values(
+        'image').annotate(total=Count('pk'))
+    StoredImage.objects.bulk_create(
+        [StoredImage(name=row['image'], references=row['total'])
+         for row in references.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    # Хранилище картинки меняется только в состоянии моделей: схема
+    # столбца image та же, а AlterField в SQLite копирует всю таблицу
+    # posts_post под блокировкой записи.
+
+    dependencies = [
+        ('posts', '0011_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+                ('thumbnails_ready', models.BooleanField(default=False, verbose_name='Миниатюры готовы')),
+            ],
+            options={
+                'verbose_name': 'файл картинки',
+                'verbose_name_plural': 'файлы картинок',
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='post',
+                    name='image',
+                    field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+                ),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+def has_column(schema_editor, column):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        return column in {
+            info.name for info in
+            connection.introspection.get_table_description(
+                cursor, 'posts_post'
+            )
+        }
+
+
+def add_image_placeholder(apps, schema_editor):
+    # Столбец, оставшийся после отката (SQLite до 3.35 не умеет
+    # DROP COLUMN), используется как есть.
+    if has_column(schema_editor, 'image_placeholder'):
+        return
+    schema_editor.execute(
+        'ALTER TABLE "posts_post" ADD COLUMN "image_placeholder" '
+        "text NOT NULL DEFAULT ''"
+    )
+
+
+class Migration(migrations.Migration):
+    # Поле image_placeholder добавляется через ALTER TABLE ADD COLUMN,
+    # а не пересборкой posts_post: AddField в SQLite копирует всю
+    # таблицу под блокировкой записи.
+    atomic = False
+
+    dependencies = [
+        ('posts', '0012_stored_images'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    add_image_placeholder, migrations.RunPython.noop,
+                    hints={'model_name': 'post'},
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='post',
+                    name='image_placeholder',
+                    field=models.TextField(blank=True, editable=False, verbose_name='Заглушка картинки'),
+                ),
+            ],
+        ),
+    ]
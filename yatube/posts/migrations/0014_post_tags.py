@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('#', 'хештег'), ('@', 'упоминание')], max_length=1, verbose_name='Вид')),
+                ('name', models.CharField(max_length=150, verbose_name='Имя')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags', to='posts.Post', verbose_name='Запись')),
+            ],
+            options={
+                'verbose_name': 'метка записи',
+                'verbose_name_plural': 'метки записей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='posttag',
+            index=models.Index(fields=['kind', 'name', '-pub_date', '-post'], name='post_tag_name_pub_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='posttag',
+            constraint=models.UniqueConstraint(fields=('post', 'kind', 'name'), name='unique_post_tag'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def has_column(schema_editor, column):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        return column in {
+            info.name for info in
+            connection.introspection.get_table_description(
+                cursor, 'posts_post'
+            )
+        }
+
+
+def add_deleted(apps, schema_editor):
+    # При откате столбец остаётся, ведь старые SQLite не знают
+    # DROP COLUMN; со значением по умолчанию он прежнему коду не мешает.
+    if has_column(schema_editor, 'deleted'):
+        return
+    schema_editor.execute(
+        'ALTER TABLE "posts_post" ADD COLUMN "deleted" bool '
+        'NOT NULL DEFAULT 0'
+    )
+
+
+class Migration(migrations.Migration):
+    # Поле deleted добавляется через ALTER TABLE ADD COLUMN, а не
+    # пересборкой posts_post: AddField в SQLite копирует всю таблицу
+    # под блокировкой записи. Каждая операция фиксируется отдельно.
+    atomic = False
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0016_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedUser',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='deletion', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('requested', models.DateTimeField(auto_now_add=True, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'удалённый пользователь',
+                'verbose_name_plural': 'удалённые пользователи',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_pub_date',
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    add_deleted, migrations.RunPython.noop,
+                    hints={'model_name': 'post'},
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='post',
+                    name='deleted',
+                    field=models.BooleanField(default=False, editable=False, verbose_name='Удалена'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id', 'deleted'], name='post_pub_date'),
+        ),
+    ]
@@ -1,9 +1,36 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
+class RoutedQuerySet(models.QuerySet):
+    """create() без явной базы выбирает её по самой строке, как save().
+
+    Обычный create() спрашивает роутер без instance, и роутер шардов
+    не узнал бы автора записи.
+    """
+
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True)
+        return obj
+
+
+class VisibleManager(models.Manager.from_queryset(RoutedQuerySet)):
+    """Записи без отметки об удалении; отмеченные видит только
+    _base_manager до их окончательного удаления.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted=False)
+
+
 class Group(models.Model):
     title = models.CharField('Название сообщества', max_length=200)
     slug = models.SlugField('Ссылка сообщества', unique=True)
@@ -18,9 +45,10 @@ class Group(models.Model):
 
 
 class Post(models.Model):
-    objects = None
+    objects = VisibleManager()
     text = models.TextField('Текст записи')
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -39,8 +67,24 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    image_placeholder = models.TextField(
+        'Заглушка картинки',
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+    deleted = models.BooleanField(
+        'Удалена',
+        default=False,
+        editable=False
+    )
 
     def __str__(self):
         return self.text
@@ -49,6 +93,17 @@ class Post(models.Model):
         ordering = ('-pub_date',)
         verbose_name = 'запись'
         verbose_name_plural = 'записи'
+        # Ленты: все записи, записи автора и группы по убыванию даты.
+        # Флаг deleted в хвосте: видимые записи считаются по индексу,
+        # не заглядывая в таблицу.
+        indexes = [
+            models.Index(fields=['-pub_date', '-id', 'deleted'],
+                         name='post_pub_date'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date'),
+        ]
 
 
 class Comment(models.Model):
@@ -66,10 +121,15 @@ class Comment(models.Model):
     created = models.DateTimeField(verbose_name='Дата создания',
                                    auto_now_add=True)
 
+    objects = RoutedQuerySet.as_manager()
+
     class Meta:
-        ordering = ('-created',)
         verbose_name = 'комментарий'
         verbose_name_plural = 'комментарии'
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created'),
+        ]
 
 
 class Follow(models.Model):
@@ -83,8 +143,144 @@ class Follow(models.Model):
                                )
 
     class Meta:
-        ordering = ('-author',)
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'], name='unique_follow')
         ]
+        # Подписчики автора: раскладка записей по лентам и счётчики.
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='timeline',
+                             verbose_name='Читатель')
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='timeline_entries',
+                             verbose_name='Запись')
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+',
+                               verbose_name='Автор')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author'),
+        ]
+
+
+class PostTag(models.Model):
+    """Хештег или упоминание пользователя из текста записи."""
+    HASHTAG = '#'
+    MENTION = '@'
+    KINDS = (
+        (HASHTAG, 'хештег'),
+        (MENTION, 'упоминание'),
+    )
+
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='tags',
+                             verbose_name='Запись')
+    kind = models.CharField('Вид', max_length=1, choices=KINDS)
+    name = models.CharField('Имя', max_length=150)
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'метка записи'
+        verbose_name_plural = 'метки записей'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'kind', 'name'], name='unique_post_tag')
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'name', '-pub_date', '-post'],
+                         name='post_tag_name_pub_date'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}{self.name}'
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, обновляемые при записи."""
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats',
+                                verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField('Число записей', default=0)
+    followers_count = models.PositiveIntegerField('Число подписчиков',
+                                                  default=0)
+    following_count = models.PositiveIntegerField('Число подписок',
+                                                  default=0)
+
+    class Meta:
+        verbose_name = 'счётчики пользователя'
+        verbose_name_plural = 'счётчики пользователей'
+
+
+class StoredImage(models.Model):
+    """Файл картинки и число записей, которые на него ссылаются."""
+    name = models.CharField('Имя файла', max_length=100, primary_key=True)
+    references = models.PositiveIntegerField('Число ссылок', default=0)
+    thumbnails_ready = models.BooleanField('Миниатюры готовы',
+                                           default=False)
+
+    class Meta:
+        verbose_name = 'файл картинки'
+        verbose_name_plural = 'файлы картинок'
+
+
+class AuthorShard(models.Model):
+    """База, на которой лежат записи автора и комментарии к ним."""
+    author = models.OneToOneField(User,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='shard',
+                                  verbose_name='Автор')
+    alias = models.CharField('Псевдоним базы', max_length=100)
+
+    class Meta:
+        verbose_name = 'база автора'
+        verbose_name_plural = 'базы авторов'
+
+
+class IdSequence(models.Model):
+    """Последний выданный id, общий для всех баз с записями."""
+    name = models.CharField('Имя', max_length=100, primary_key=True)
+    value = models.BigIntegerField('Значение', default=0)
+
+    class Meta:
+        verbose_name = 'последовательность id'
+        verbose_name_plural = 'последовательности id'
+
+
+class DeletedUser(models.Model):
+    """Пользователь, удалённый с сайта, чьи строки ещё не вычищены."""
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='deletion',
+                                verbose_name='Пользователь')
+    requested = models.DateTimeField('Дата удаления', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'удалённый пользователь'
+        verbose_name_plural = 'удалённые пользователи'
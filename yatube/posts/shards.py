@@ -0,0 +1,396 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+
+from core import generations
+from .models import (
+    AuthorShard, Comment, DeletedUser, Group, IdSequence, Post, PostTag,
+    TimelineEntry, User,
+)
+
+# Записи автора и всё, что ссылается на них, лежат на одной базе
+SHARDED_MODELS = (Post, Comment, PostTag, TimelineEntry)
+# Справочные строки, на которые ссылаются записи, есть на каждой базе.
+# DeletedUser — ради фильтра author__deletion__isnull на любой базе.
+REFERENCE_MODELS = (User, Group, DeletedUser)
+
+
+def aliases():
+    """Базы со свежими записями."""
+    return settings.POST_SHARDS
+
+
+def databases():
+    """Все базы с записями: свежие и архив."""
+    if settings.POST_ARCHIVE:
+        return [*aliases(), settings.POST_ARCHIVE]
+    return aliases()
+
+
+def is_sharded():
+    return len(settings.POST_SHARDS) > 1
+
+
+def hot(queryset):
+    """Та же выборка на каждой базе со свежими записями; при одной
+    базе — сама выборка, чтобы её по-прежнему направляли роутеры.
+    """
+    if not is_sharded():
+        return [queryset]
+    return [queryset.using(alias) for alias in aliases()]
+
+
+def archived(queryset):
+    """Та же выборка в архиве: список из одного queryset или пустой."""
+    if not settings.POST_ARCHIVE:
+        return []
+    return [queryset.using(settings.POST_ARCHIVE)]
+
+
+def across(queryset):
+    """Та же выборка на каждой базе с записями, включая архив."""
+    return hot(queryset) + archived(queryset)
+
+
+def tiers(queryset):
+    """Ярусы выборки для TieredCursorPaginator: свежие записи, архив."""
+    return [hot(queryset), archived(queryset)]
+
+
+def _map_key(author_id):
+    return f'author_shard:{author_id}'
+
+
+def _initial_shard(author_id):
+    return aliases()[author_id % len(aliases())]
+
+
+def shard_for(author_id):
+    """База записей автора: по карте шардов, для новых авторов —
+    по остатку от деления id на число баз.
+
+    Карта кешируется, поэтому кеш должен быть общим для всех
+    процессов (проверка posts.E001): иначе после rebalance_shards
+    процессы читали бы автора со старой базы.
+    """
+    return shards_for([author_id])[author_id]
+
+
+def shards_for(author_ids):
+    """shard_for() для многих авторов: одна выборка из кеша и один
+    запрос к карте шардов на тех, кого в кеше нет.
+    """
+    if not is_sharded():
+        return {author_id: aliases()[0] for author_id in author_ids}
+    keys = {_map_key(author_id): author_id for author_id in author_ids}
+    cached = cache.get_many(keys)
+    found = {keys[key]: alias for key, alias in cached.items()}
+    missing = [author_id for author_id in keys.values()
+               if author_id not in found]
+    if missing:
+        stored = dict(AuthorShard.objects.using(DEFAULT_DB_ALIAS).filter(
+            author_id__in=missing
+        ).values_list('author_id', 'alias'))
+        loaded = {
+            author_id: stored.get(author_id) or _initial_shard(author_id)
+            for author_id in missing
+        }
+        cache.set_many(
+            {_map_key(author_id): alias
+             for author_id, alias in loaded.items()},
+            settings.SHARD_MAP_TIMEOUT,
+        )
+        found.update(loaded)
+    return found
+
+
+def place(author_id):
+    """Закрепляет автора за его базой в карте шардов и возвращает
+    базу по самой карте, а не по кешу.
+
+    Без этого добавление базы в POST_SHARDS сдвинуло бы остатки
+    от деления, и записи старых авторов потерялись бы; а запись,
+    сделанная по устаревшему кешу, ушла бы на базу, с которой автора
+    уже перенесли.
+    """
+    shard, _ = AuthorShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+        author_id=author_id,
+        defaults={'alias': _initial_shard(author_id)},
+    )
+    cache.set(_map_key(author_id), shard.alias, settings.SHARD_MAP_TIMEOUT)
+    return shard.alias
+
+
+def next_id(name):
+    """Следующий id из общей последовательности name.
+
+    Строка последовательности создаётся при первом обращении, затем
+    сдвигается. С SQLite 3.35 и новее это один запрос с RETURNING,
+    на старых — сдвиг, вставка при отсутствии строки и чтение
+    в одной транзакции: сдвиг держит блокировку записи до её конца.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    quote = connection.ops.quote_name
+    table, key, value = (
+        quote(IdSequence._meta.db_table), quote('name'), quote('value')
+    )
+    if connection.Database.sqlite_version_info >= (3, 35):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({key}, {value}) VALUES (%s, 1) '
+                f'ON CONFLICT ({key}) DO UPDATE SET {value} = {value} + 1 '
+                f'RETURNING {value}',
+                [name],
+            )
+            return cursor.fetchone()[0]
+    with transaction.atomic(using=DEFAULT_DB_ALIAS), \
+            connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {value} = {value} + 1 WHERE {key} = %s',
+            [name],
+        )
+        if not cursor.rowcount:
+            cursor.execute(
+                f'INSERT INTO {table} ({key}, {value}) VALUES (%s, 1)',
+                [name],
+            )
+        cursor.execute(
+            f'SELECT {value} FROM {table} WHERE {key} = %s', [name]
+        )
+        return cursor.fetchone()[0]
+
+
+def _row_key(model, pk):
+    return f'shard:{model._meta.label_lower}:{pk}'
+
+
+def locate(model, pk, refresh=False):
+    """База, на которой лежит строка model с ключом pk, или None —
+    если такой строки нет или база свежих записей всего одна.
+
+    С refresh база ищется заново, мимо кеша.
+    """
+    if not is_sharded():
+        return None
+    key = _row_key(model, pk)
+    alias = None if refresh else cache.get(key)
+    if alias is None:
+        for alias in databases():
+            if model._base_manager.using(alias).filter(pk=pk).exists():
+                break
+        else:
+            return None
+        cache.set(key, alias, settings.SHARD_MAP_TIMEOUT)
+    return alias
+
+
+def get(queryset, pk):
+    """Строка с ключом pk с той базы, где она лежит, в том числе
+    из архива; DoesNotExist, если её нет нигде.
+    """
+    alias = locate(queryset.model, pk)
+    try:
+        return queryset.using(alias).get(pk=pk)
+    except queryset.model.DoesNotExist:
+        if alias is not None:
+            # Строку могли перенести на другую базу или в архив после
+            # того, как её база попала в кеш; поиск заново идёт и по архиву
+            alias = locate(queryset.model, pk, refresh=True)
+        elif not is_sharded():
+            # Без шардов locate не ищет строку, архив проверяется здесь
+            alias = settings.POST_ARCHIVE
+        if alias is None:
+            raise
+    return queryset.using(alias).get(pk=pk)
+
+
+def in_bulk(queryset, ids):
+    """in_bulk по базам с записями: следующая база, в том числе
+    архив, читается, только если нашлись ещё не все ids.
+    """
+    ids = set(ids)
+    found = {}
+    for shard in across(queryset):
+        found.update(shard.in_bulk(ids - found.keys()))
+        if len(found) == len(ids):
+            break
+    return found
+
+
+def replicate(instance):
+    """Копирует справочную строку с основной базы на остальные."""
+    model = type(instance)
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields
+        if not field.primary_key
+    }
+    for alias in databases():
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        rows = model._base_manager.using(alias)
+        if not rows.filter(pk=instance.pk).update(**values):
+            rows.bulk_create([instance])
+
+
+def replicate_delete(instance):
+    """Удаляет справочную строку с остальных баз вместе с каскадом."""
+    for alias in databases():
+        if alias != DEFAULT_DB_ALIAS:
+            type(instance)._base_manager.using(alias).filter(
+                pk=instance.pk
+            ).delete()
+
+
+def sync_references(alias):
+    """Докопирует на базу alias справочные строки, которых там нет."""
+    for model in REFERENCE_MODELS:
+        present = set(
+            model._base_manager.using(alias).values_list('pk', flat=True)
+        )
+        model._base_manager.using(alias).bulk_create(
+            model._base_manager.using(DEFAULT_DB_ALIAS).exclude(
+                pk__in=present
+            ),
+            batch_size=settings.SHARD_BATCH_SIZE,
+        )
+
+
+def _copy(queryset, alias, keep_pk=True):
+    """Копирует строки queryset на базу alias как есть.
+
+    Вставка «сырая», как у loaddata: bulk_create проставил бы
+    pub_date и другие поля auto_now заново.
+    """
+    model = queryset.model
+    fields = [
+        field for field in model._meta.concrete_fields
+        if keep_pk or not field.primary_key
+    ]
+    rows = list(queryset)
+    size = min(
+        settings.SHARD_BATCH_SIZE,
+        connections[alias].ops.bulk_batch_size(fields, rows) or len(rows),
+    )
+    for start in range(0, len(rows), size):
+        model._base_manager.using(alias)._insert(
+            rows[start:start + size], fields=fields, raw=True, using=alias
+        )
+    return len(rows)
+
+
+def transfer(posts, target):
+    """Переносит записи posts с комментариями, метками и строками лент
+    с базы выборки на базу target. Возвращает число записей.
+
+    Записи на исходной базе заблокированы на время переноса, так что
+    новые комментарии к ним не потеряются между копированием
+    и удалением. Справочные строки на target должны уже быть.
+    """
+    source = posts.db
+    with transaction.atomic(using=source):
+        # Пустой UPDATE берёт блокировку записи SQLite до конца переноса
+        posts.update(comments_count=F('comments_count'))
+        post_ids = list(posts.values_list('pk', flat=True))
+        posts = Post._base_manager.using(source).filter(pk__in=post_ids)
+        comments = Comment._base_manager.using(source).filter(
+            post__in=post_ids
+        )
+        tags = PostTag._base_manager.using(source).filter(post__in=post_ids)
+        entries = TimelineEntry._base_manager.using(source).filter(
+            post__in=post_ids
+        )
+        with transaction.atomic(using=target):
+            moved = _copy(posts.order_by('pk'), target)
+            _copy(comments.order_by('pk'), target)
+            _copy(tags, target, keep_pk=False)
+            _copy(entries, target, keep_pk=False)
+        comment_ids = list(comments.values_list('pk', flat=True))
+        cache.delete_many(
+            [_row_key(Post, pk) for pk in post_ids]
+            + [_row_key(Comment, pk) for pk in comment_ids]
+        )
+        # Без сигналов удаления: записи не исчезли, а переехали,
+        # и счётчики со ссылками на картинки трогать нельзя
+        for queryset in (entries, tags, comments, posts):
+            queryset._raw_delete(source)
+    return moved
+
+
+def move_author(author, target):
+    """Переносит свежие записи автора на базу target и переключает
+    на неё карту шардов. Возвращает число перенесённых записей.
+    """
+    source = shard_for(author.pk)
+    if source == target:
+        return 0
+    sync_references(target)
+    with transaction.atomic(using=source):
+        moved = transfer(
+            Post._base_manager.using(source).filter(author=author), target
+        )
+        AuthorShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            author=author, defaults={'alias': target}
+        )
+        cache.delete(_map_key(author.pk))
+    generations.bump('posts', f'author:{author.pk}')
+    return moved
+
+
+class ShardRouter:
+    """Пишет записи, комментарии, метки и строки лент на базу автора
+    записи; читает по подсказке instance — для author.posts,
+    post.comments, comment.post и т. п.
+
+    При одной базе в POST_SHARDS решает только за строки из архива.
+    """
+
+    def _shard_of(self, model, instance):
+        alias = self._database_of(model, instance)
+        if is_sharded() or alias == settings.POST_ARCHIVE:
+            return alias
+        return None
+
+    def _database_of(self, model, instance):
+        # У новой строки _state.db мог выставить чужой ForeignKey,
+        # например comment.author = user, — ей верить нельзя
+        if (isinstance(instance, SHARDED_MODELS) and instance._state.db
+                and not instance._state.adding):
+            return instance._state.db
+        if isinstance(instance, Post) and instance.author_id:
+            return shard_for(instance.author_id)
+        if isinstance(instance, SHARDED_MODELS) and instance.post_id:
+            post = instance._meta.get_field('post').get_cached_value(
+                instance, None
+            )
+            if post is not None and post._state.db:
+                return post._state.db
+            return locate(Post, instance.post_id)
+        if isinstance(instance, User) and model is Post:
+            return shard_for(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        if model not in SHARDED_MODELS:
+            return None
+        return self._shard_of(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        if model not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if is_sharded():
+            if isinstance(instance, Post) and instance._state.adding:
+                return place(instance.author_id)
+            if isinstance(instance, User) and model is Post:
+                return place(instance.pk)
+        return self._shard_of(model, instance)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if len(databases()) == 1:
+            return None
+        known = {DEFAULT_DB_ALIAS, *databases()}
+        if {obj1._state.db, obj2._state.db} <= known:
+            return True
+        return None
@@ -0,0 +1,198 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import (
+    post_delete, post_init, post_migrate, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from core import generations
+from . import (
+    counters, feeds, fulltext, images, shards, tags, thumbnails, timeline,
+)
+from .models import (
+    Comment, DeletedUser, Follow, Group, Post, User, UserStats,
+)
+
+
+def timeline_enabled():
+    return settings.FOLLOW_FEED_ENGINE == 'timeline'
+
+
+@receiver(post_save, sender=User)
+def user_stats_create(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=DeletedUser)
+def reference_replicate(sender, instance, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS and len(shards.databases()) > 1:
+        shards.replicate(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=DeletedUser)
+def reference_replicate_delete(sender, instance, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS and len(shards.databases()) > 1:
+        shards.replicate_delete(instance)
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def sharded_id(sender, instance, **kwargs):
+    # Строки разных баз не должны совпасть по id: по нему их ищут
+    # адреса /posts/<id>/ и перенос автора между базами.
+    if instance.pk is None and shards.is_sharded():
+        instance.pk = shards.next_id(sender._meta.label_lower)
+
+
+@receiver(post_save, sender=User)
+def user_invalidate(sender, instance, created, update_fields, **kwargs):
+    if not created and update_fields != frozenset({'last_login'}):
+        generations.bump(f'user:{instance.pk}')
+
+
+def post_scopes(post, group_id):
+    scopes = ['posts', f'author:{post.author_id}']
+    if group_id:
+        scopes.append(f'group:{group_id}')
+    return scopes
+
+
+@receiver(post_init, sender=Post)
+def post_remember_loaded(sender, instance, **kwargs):
+    # Через __dict__, чтобы отложенные поля не подгружались запросом.
+    instance.loaded_group_id = instance.__dict__.get('group_id')
+    instance.loaded_text = instance.__dict__.get('text')
+    instance.loaded_image = images.image_name(instance)
+
+
+@receiver(pre_save, sender=Post)
+def post_image_placeholder(sender, instance, **kwargs):
+    if 'image' not in instance.__dict__:
+        return
+    loaded = '' if instance._state.adding else instance.loaded_image
+    if images.image_name(instance) != loaded:
+        instance.image_placeholder = images.placeholder(instance.image)
+
+
+@receiver(pre_save, sender=Post)
+def post_image_upload(sender, instance, **kwargs):
+    # Содержимое новой загрузки: retain() запишет файл заново,
+    # если его удалят до учёта ссылки
+    image = instance.__dict__.get('image')
+    instance.image_upload = None
+    if image and not getattr(image, '_committed', True):
+        instance.image_upload = image.file
+
+
+@receiver(post_save, sender=Post)
+def post_image_references(sender, instance, created, **kwargs):
+    if 'image' not in instance.__dict__:
+        return
+    loaded = '' if created else instance.loaded_image
+    current = images.image_name(instance)
+    if current != loaded:
+        images.retain(current, getattr(instance, 'image_upload', None))
+        images.release(loaded)
+    instance.loaded_image = current
+    instance.image_upload = None
+
+
+@receiver(post_save, sender=Post)
+def post_tags_sync(sender, instance, created, using, **kwargs):
+    text = instance.__dict__.get('text')
+    if text is not None and (created or text != instance.loaded_text):
+        tags.sync([instance], using)
+    instance.loaded_text = text
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, **kwargs):
+    generations.bump(*post_scopes(instance, instance.group_id))
+    if instance.loaded_group_id not in (None, instance.group_id):
+        generations.bump(f'group:{instance.loaded_group_id}')
+    instance.loaded_group_id = instance.group_id
+    if not created:
+        return
+    counters.bump_user(instance.author_id, 'posts_count', 1)
+    feeds.add_recent(instance)
+    if timeline_enabled():
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_recent_cleanup(sender, instance, **kwargs):
+    images.release(images.image_name(instance))
+    generations.bump(*post_scopes(instance, instance.group_id))
+    # Скрытую запись deletion.delete_post уже вычел из счётчика и лент
+    if not instance.deleted:
+        counters.bump_user(instance.author_id, 'posts_count', -1)
+        feeds.remove_recent(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_count_add(sender, instance, created, using, **kwargs):
+    generations.bump(f'post:{instance.post_id}')
+    if created and instance.post_id:
+        counters.bump_post(instance.post_id, 1, using)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_count_remove(sender, instance, using, **kwargs):
+    generations.bump(f'post:{instance.post_id}')
+    if instance.post_id:
+        counters.bump_post(instance.post_id, -1, using)
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, **kwargs):
+    if not created:
+        return
+    counters.bump_user(instance.author_id, 'followers_count', 1)
+    counters.bump_user(instance.user_id, 'following_count', 1)
+    if timeline_enabled():
+        timeline.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow_cleanup(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'followers_count', -1)
+    counters.bump_user(instance.user_id, 'following_count', -1)
+    if timeline_enabled():
+        timeline.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Group)
+def group_invalidate(sender, instance, **kwargs):
+    generations.bump(f'group:{instance.pk}')
+
+
+@receiver(pre_delete, sender=Group)
+def group_delete_invalidate(sender, instance, **kwargs):
+    author_ids = set()
+    for posts in shards.across(Post.objects.filter(group=instance)):
+        author_ids.update(posts.values_list('author_id', flat=True))
+    generations.bump(
+        'posts',
+        f'group:{instance.pk}',
+        *(f'author:{author_id}' for author_id in author_ids),
+    )
+
+
+@receiver(post_migrate)
+def fulltext_install(sender, using, **kwargs):
+    if sender.name == 'posts':
+        fulltext.install(using)
+
+
+@receiver(setting_changed)
+def thumbnails_drain(setting, **kwargs):
+    # Задачи, поставленные при прежнем MEDIA_ROOT, доделываются до того,
+    # как его каталог удалят
+    if setting == 'MEDIA_ROOT':
+        thumbnails.drain()
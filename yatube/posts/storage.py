@@ -0,0 +1,60 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, сохраняющее файл под SHA-256 его содержимого.
+
+    Повторная загрузка той же картинки не создаёт новый файл: save()
+    вернёт имя уже лежащего на диске. Файлы раскладываются по
+    подкаталогам из первых байт хеша: posts/ab/cd/abcd….jpg.
+    """
+
+    shard_depth = 2
+
+    def digest(self, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def shards(self, digest):
+        return [digest[2 * i:2 * i + 2] for i in range(self.shard_depth)]
+
+    def is_sharded(self, name):
+        """Лежит ли файл name уже в подкаталоге своего хеша."""
+        parts = name.split('/')
+        digest = os.path.splitext(parts[-1])[0]
+        return (len(parts) > self.shard_depth
+                and parts[-1 - self.shard_depth:-1] == self.shards(digest))
+
+    def content_name(self, name, digest):
+        extension = os.path.splitext(name)[1].lower()
+        directory = posixpath.dirname(name)
+        if self.is_sharded(name):
+            directory = '/'.join(name.split('/')[:-1 - self.shard_depth])
+        return posixpath.join(
+            directory, *self.shards(digest), digest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, self.digest(content))
+        if self.exists(name):
+            return name
+        saved = self._save(name, content)
+        if saved != name:
+            # Ту же картинку параллельно записал другой запрос:
+            # _save() положил копию под свободным именем, она не нужна.
+            self.delete(saved)
+        return name
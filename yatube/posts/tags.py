@@ -0,0 +1,99 @@
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+from .models import PostTag, User
+
+HASHTAG_RE = re.compile(r'(?<!\w)#(\w{1,100})')
+MENTION_RE = re.compile(r'(?<!\w)@([\w.+-]{0,149}\w)')
+LINK_RE = re.compile(f'{HASHTAG_RE.pattern}|{MENTION_RE.pattern}')
+
+
+def extract(text):
+    """Хештеги в нижнем регистре и упомянутые имена пользователей."""
+    hashtags = {name.lower() for name in HASHTAG_RE.findall(text)}
+    return hashtags, set(MENTION_RE.findall(text))
+
+
+def existing(usernames):
+    """Те из имён usernames, что есть на сайте, — одним запросом."""
+    if not usernames:
+        return set()
+    return set(User.objects.filter(
+        username__in=usernames
+    ).values_list('username', flat=True))
+
+
+def entries(posts):
+    """Строки PostTag для записей; упоминания — только существующих."""
+    parsed = [(post, *extract(post.text)) for post in posts]
+    known = existing(
+        set().union(*(mentions for _, _, mentions in parsed))
+    )
+    result = []
+    for post, hashtags, mentions in parsed:
+        names = [(PostTag.HASHTAG, name) for name in sorted(hashtags)]
+        names += [(PostTag.MENTION, name)
+                  for name in sorted(mentions & known)]
+        result.extend(
+            PostTag(post_id=post.pk, kind=kind, name=name,
+                    pub_date=post.pub_date)
+            for kind, name in names
+        )
+    return result
+
+
+def sync(posts, using=None):
+    """Пересобирает метки записей posts с базы using по их тексту."""
+    tags = PostTag.objects.using(using)
+    with transaction.atomic(using=tags.db):
+        tags.filter(post__in=[post.pk for post in posts]).delete()
+        tags.bulk_create(entries(posts), batch_size=settings.TAG_BATCH_SIZE)
+
+
+def parse_slug(slug):
+    """Имя из адреса /tag/<slug>/: «@имя» — упоминание, иначе хештег."""
+    if slug.startswith(PostTag.MENTION):
+        return PostTag.MENTION, slug[1:]
+    return PostTag.HASHTAG, slug.lower()
+
+
+def prefetch(posts):
+    """Разом проверяет имена, упомянутые в записях страницы, чтобы
+    linkify() не спрашивал базу для каждой карточки.
+    """
+    mentions = {post.pk: extract(post.text)[1] for post in posts}
+    known = existing(set().union(*mentions.values()))
+    for post in posts:
+        post.known_mentions = mentions[post.pk] & known
+
+
+def linkify(text, known=None):
+    """Экранированный текст со ссылками на страницы меток.
+
+    Ссылкой становятся только упоминания из known — тех, кто есть на
+    сайте, как и в метках записи; без known они проверяются здесь же.
+    """
+    if known is None:
+        known = existing(set(MENTION_RE.findall(text)))
+    parts = []
+    position = 0
+    for match in LINK_RE.finditer(text):
+        hashtag, mention = match.groups()
+        if mention and mention not in known:
+            continue
+        slug = hashtag.lower() if hashtag else PostTag.MENTION + mention
+        parts.append(conditional_escape(text[position:match.start()]))
+        parts.append(
+            '<a href="{}">{}</a>'.format(
+                conditional_escape(reverse('posts:tag', args=[slug])),
+                conditional_escape(match.group()),
+            )
+        )
+        position = match.end()
+    parts.append(conditional_escape(text[position:]))
+    return mark_safe(''.join(parts))
@@ -0,0 +1,36 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core import generations
+from posts import tags, thumbnails
+from posts.cards import card_key, card_scopes
+
+register = template.Library()
+
+CARD_TEMPLATE = 'includes/post_card.html'
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Карточки записей страницы: одна выборка из кеша на всю страницу."""
+    posts = list(posts)
+    scopes = sorted({scope for post in posts for scope in card_scopes(post)})
+    stamps = dict(zip(scopes, generations.get(*scopes)))
+    keys = [card_key(post, stamps) for post in posts]
+    cards = cache.get_many(keys)
+    missing = [
+        (key, post) for key, post in zip(keys, posts) if key not in cards
+    ]
+    tags.prefetch([post for _, post in missing])
+    thumbnails.prefetch([post for _, post in missing])
+    rendered = {
+        key: render_to_string(CARD_TEMPLATE, {'post': post})
+        for key, post in missing
+    }
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
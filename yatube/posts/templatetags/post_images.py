@@ -0,0 +1,51 @@
+from django import template
+from django.conf import settings
+
+from posts import thumbnails
+
+register = template.Library()
+
+MIME_TYPES = {
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+}
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(post):
+    """Картинка записи: лестница ширин в srcset, по <source> на формат
+    и встроенная заглушка до загрузки.
+
+    Берутся только готовые миниатюры; пока их нет, показывается
+    исходный файл.
+    """
+    if not post.image:
+        return {}
+    variants = {}
+    for options, image in thumbnails.ready(post.image.name):
+        variants.setdefault(options.get('format', 'JPEG'), []).append(image)
+    if not variants:
+        return {
+            'src': post.image.url,
+            'placeholder': post.image_placeholder,
+        }
+    *formats, fallback = variants
+    largest = variants[fallback][-1]
+    return {
+        'sources': [
+            (MIME_TYPES[image_format], srcset(variants[image_format]))
+            for image_format in formats
+        ],
+        'src': largest.url,
+        'srcset': srcset(variants[fallback]),
+        'sizes': settings.POST_IMAGE_SIZES,
+        'width': largest.width,
+        'height': largest.height,
+        'placeholder': post.image_placeholder,
+    }
+
+
+def srcset(images):
+    return ', '.join(f'{image.url} {image.width}w' for image in images)
@@ -0,0 +1,11 @@
+from django import template
+
+from posts import tags
+
+register = template.Library()
+
+
+@register.filter(is_safe=True)
+def tagged(post):
+    """Текст записи со ссылками на хештеги и упоминания."""
+    return tags.linkify(post.text, getattr(post, 'known_mentions', None))
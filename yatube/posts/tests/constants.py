@@ -9,6 +9,8 @@ DELETE_COMMENT_URL = 'posts:delete_comment'
 POST_FOLLOW_URL = 'posts:profile_follow'
 POST_UNFOLLOW_URL = 'posts:profile_unfollow'
 FOLLOW_INDEX_URL = 'posts:follow_index'
+SEARCH_URL = 'posts:search'
+TAG_URL = 'posts:tag'
 
 INDEX_TEMPLATE = "posts/index.html"
 GROUP_LIST_TEMPLATE = "posts/group_list.html"
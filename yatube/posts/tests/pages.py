@@ -0,0 +1,113 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+
+from core import middleware
+from posts import thumbnails, urls
+from posts.models import Comment, Follow, Group, Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+class SeededPagesMixin:
+    """Наполненная база и адрес каждого маршрута posts.urls.
+
+    У каждой третьей записи есть картинка; миниатюры готовы
+    только у половины из них.
+    """
+
+    page_params = {'search': {'q': 'запись'}}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media = override_settings(
+            MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_PREGENERATE=False
+        )
+        cls.media.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media.disable()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', first_name='Автор'
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group,
+                text=f'Запись {i} #тег @reader',
+                image=SimpleUploadedFile(
+                    f'image{i}.gif', SMALL_GIF + bytes([i]), 'image/gif'
+                ) if i % 3 == 0 else '',
+            )
+            for i in range(15)
+        ]
+        for post in cls.posts[::6]:
+            thumbnails.generate(post.image.name)
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.posts[0], author=user, text='Комментарий'
+            )
+            for user in (cls.reader, cls.author, cls.reader)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def url_kwargs(self):
+        return {
+            'slug': self.group.slug,
+            'username': self.author.username,
+            'post_id': self.posts[0].pk,
+            'comment_id': self.comments[0].pk,
+            'name': 'тег',
+        }
+
+    def pages(self):
+        """Имя, адрес и параметры GET для каждого маршрута."""
+        values = self.url_kwargs()
+        for pattern in urls.urlpatterns:
+            kwargs = {
+                name: values[name] for name in pattern.pattern.converters
+            }
+            url = reverse(f'{urls.app_name}:{pattern.name}', kwargs=kwargs)
+            yield pattern.name, url, self.page_params.get(pattern.name, {})
+
+
+class StrictQueryBudgetMixin:
+    """Включает QueryInspectorMiddleware и роняет тест, если тот
+    сообщает о повторах запросов или превышении @query_budget.
+    """
+
+    def setUp(self):
+        super().setUp()
+        inspector = override_settings(QUERY_INSPECTOR=True)
+        inspector.enable()
+        self.addCleanup(inspector.disable)
+        patcher = mock.patch.object(
+            middleware.logger, 'warning', side_effect=self.fail_on_warning
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail_on_warning(self, message, *args):
+        raise AssertionError(message % args)
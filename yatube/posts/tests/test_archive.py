@@ -0,0 +1,199 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import counters, shards
+from posts.models import (
+    Comment, Follow, Group, Post, PostTag, TimelineEntry, User, UserStats,
+)
+from .pages import StrictQueryBudgetMixin
+
+ARCHIVE = 'archive'
+
+
+@override_settings(POST_ARCHIVE=ARCHIVE, ARCHIVE_AFTER_DAYS=365)
+class ArchiveTests(StrictQueryBudgetMixin, TransactionTestCase):
+    """Архив — файл SQLite с полной схемой, созданный на класс."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.databases[ARCHIVE] = dict(
+            connections['default'].settings_dict,
+            NAME=os.path.join(cls.directory.name, 'archive.sqlite3'),
+        )
+        call_command('migrate', database=ARCHIVE, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[ARCHIVE].close()
+        delattr(connections._connections, ARCHIVE)
+        del connections.databases[ARCHIVE]
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(
+            call_command, 'flush', database=ARCHIVE, interactive=False,
+            verbosity=0,
+        )
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(15):
+            Post.objects.create(
+                author=self.author, group=self.group,
+                text=f'Запись {number} #метка',
+            )
+        self.old = list(Post.objects.order_by('pk')[:5])
+        start = timezone.now() - timedelta(days=400)
+        self.old_dates = [
+            start + timedelta(minutes=minutes) for minutes in range(5)
+        ]
+        for post, pub_date in zip(self.old, self.old_dates):
+            Post.objects.filter(pk=post.pk).update(pub_date=pub_date)
+            TimelineEntry.objects.filter(post=post).update(pub_date=pub_date)
+            PostTag.objects.filter(post=post).update(pub_date=pub_date)
+        Comment.objects.create(
+            post=self.old[0], author=self.reader, text='Старый ответ'
+        )
+        out = StringIO()
+        call_command('archive_posts', batch_size=2, stdout=out)
+        self.assertIn('Готово, перенесено записей: 5', out.getvalue())
+
+    def texts(self, page):
+        return [post.text.split(' #')[0] for post in page]
+
+    def test_old_rows_move_to_archive(self):
+        self.assertEqual(Post.objects.count(), 10)
+        self.assertEqual(
+            list(Post.objects.using(ARCHIVE).order_by('pk').values_list(
+                'pub_date', flat=True
+            )),
+            self.old_dates,
+        )
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(
+            Comment.objects.using(ARCHIVE).get().post_id, self.old[0].pk
+        )
+        self.assertEqual(PostTag.objects.using(ARCHIVE).count(), 5)
+        self.assertEqual(TimelineEntry.objects.using(ARCHIVE).count(), 5)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 15
+        )
+
+    def test_feeds_read_archive_on_deep_pages(self):
+        expected = [f'Запись {number}' for number in range(14, -1, -1)]
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:tag', args=['метка']),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                page = response.context['page_obj']
+                response = self.client.get(url, {'cursor': page.next_cursor})
+                deep = response.context['page_obj']
+                self.assertEqual(
+                    self.texts(page) + self.texts(deep), expected
+                )
+                response = self.client.get(
+                    url, {'cursor': deep.previous_cursor}
+                )
+                self.assertEqual(
+                    self.texts(response.context['page_obj']), expected[:10]
+                )
+
+    def test_first_page_skips_archive(self):
+        Post.objects.create(author=self.author, text='Ещё одна')
+        with CaptureQueriesContext(connections[ARCHIVE]) as queries:
+            self.client.get(reverse('posts:index'))
+        # Архив спрашивают только о приблизительном числе записей
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'COUNT(*)' not in query['sql']
+        ])
+
+    def test_follow_feeds_read_archive(self):
+        self.client.force_login(self.reader)
+        for engine in ('sql', 'timeline', 'pull'):
+            with self.subTest(engine=engine), \
+                    self.settings(FOLLOW_FEED_ENGINE=engine):
+                cache.clear()
+                url = reverse('posts:follow_index')
+                page = self.client.get(url).context['page_obj']
+                deep = self.client.get(
+                    url, {'cursor': page.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(
+                    self.texts(deep),
+                    [f'Запись {number}' for number in range(4, -1, -1)],
+                )
+
+    def test_archived_post_detail_and_comments(self):
+        post = self.old[0]
+        self.client.force_login(self.reader)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertContains(response, 'Старый ответ')
+        self.client.post(
+            reverse('posts:add_comment', args=[post.pk]),
+            {'text': 'Новый ответ'},
+        )
+        self.assertEqual(Comment.objects.using(ARCHIVE).count(), 2)
+        self.assertEqual(
+            Post.objects.using(ARCHIVE).get(pk=post.pk).comments_count, 2
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk + 100])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_falls_back_to_archive_after_stale_location(self):
+        post = Post.objects.latest('pk')
+        with mock.patch.object(shards, 'is_sharded', return_value=True):
+            self.assertEqual(shards.locate(Post, post.pk), 'default')
+            # Архивирует другой процесс: местный кеш адресов не очищается
+            with mock.patch.object(shards.cache, 'delete_many'):
+                shards.transfer(Post.objects.filter(pk=post.pk), ARCHIVE)
+            found = shards.get(Post.objects.all(), post.pk)
+            self.assertEqual(found._state.db, ARCHIVE)
+            with self.assertRaises(Post.DoesNotExist):
+                shards.get(Post.objects.all(), post.pk + 100)
+
+    def test_search_finds_archived_posts(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'Запись'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+        response = self.client.get(reverse('posts:search'), {'q': '0'})
+        self.assertEqual(self.texts(response.context['page_obj']),
+                         ['Запись 0'])
+
+    def test_recount_includes_archive(self):
+        UserStats.objects.update(posts_count=0)
+        counters.recount()
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 15
+        )
+
+    def test_command_requires_archive(self):
+        with self.settings(POST_ARCHIVE=None):
+            with self.assertRaises(CommandError):
+                call_command('archive_posts', stdout=StringIO())
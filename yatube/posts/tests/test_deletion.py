@@ -0,0 +1,148 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from posts import counters, deletion
+from posts.models import (
+    Comment, DeletedUser, Follow, Post, PostTag, StoredImage, TimelineEntry,
+    User, UserStats,
+)
+from .test_thumbnails import SMALL_GIF
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, PURGE_IN_BACKGROUND=False,
+                   THUMBNAIL_PREGENERATE=False)
+class DeletionTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = Post.objects.create(
+            author=self.author,
+            text='Удаляемая #метка',
+            image=SimpleUploadedFile('photo.gif', SMALL_GIF, 'image/gif'),
+        )
+        for number in range(5):
+            Comment.objects.create(
+                post=self.post, author=self.reader, text=f'Ответ {number}'
+            )
+        self.client.force_login(self.author)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_delete_hides_post_at_once(self):
+        self.client.post(
+            reverse('posts:post_delete', args=[self.post.pk]),
+            {'confirm': 'True'},
+        )
+        self.assertTrue(Post._base_manager.filter(pk=self.post.pk).exists())
+        self.assertEqual(Comment.objects.count(), 5)
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.client.force_login(self.reader)
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:tag', args=['метка']),
+            reverse('posts:follow_index'),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(len(response.context['page_obj']), 0)
+        response = self.client.get(reverse('posts:search'), {'q': 'Удаляемая'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_purge_removes_rows_in_batches(self):
+        deletion.delete_post(self.post)
+        self.assertEqual(deletion.purge(batch_size=2), 1)
+        self.assertFalse(Post._base_manager.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(PostTag.objects.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(
+            StoredImage.objects.get(name=self.post.image.name).references, 0
+        )
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_delete_user(self):
+        other = Post.objects.create(author=self.reader, text='Чужая')
+        Comment.objects.create(post=other, author=self.author, text='Мой')
+        Follow.objects.create(user=self.author, author=self.reader)
+        deletion.delete_user(self.author)
+        self.assertFalse(User.objects.get(pk=self.author.pk).is_active)
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+        response = self.client.get(
+            reverse('posts:post_detail', args=[other.pk])
+        )
+        self.assertNotContains(response, 'Мой')
+        self.assertEqual(Post.objects.get(pk=other.pk).comments_count, 0)
+        out = StringIO()
+        call_command('purge_deleted', batch_size=2, stdout=out)
+        self.assertIn('Удалено записей и пользователей: 2', out.getvalue())
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(DeletedUser.objects.exists())
+        self.assertFalse(Post._base_manager.exclude(pk=other.pk).exists())
+        self.assertEqual(Post.objects.get(pk=other.pk).comments_count, 0)
+        self.assertEqual(self.stats(self.reader).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_inactive_user_comments_stay_visible(self):
+        self.reader.is_active = False
+        self.reader.save()
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        self.assertEqual(len(response.context['comments']), 5)
+
+    def test_recount_skips_deleted_user_comments(self):
+        deletion.delete_user(self.reader)
+        Post.objects.update(comments_count=7)
+        counters.recount()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count, 0)
+
+    def test_admin_deletes_user_softly(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='secret'
+        )
+        self.client.force_login(admin)
+        self.client.post(
+            reverse('admin:auth_user_delete', args=[self.author.pk]),
+            {'post': 'yes'},
+        )
+        self.assertTrue(DeletedUser.objects.filter(user=self.author).exists())
+        self.assertTrue(Post._base_manager.filter(pk=self.post.pk).exists())
+
+
+@override_settings(PURGE_IN_BACKGROUND=True)
+class BackgroundPurgeTests(TransactionTestCase):
+    def test_view_delete_is_purged_in_background(self):
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(author=author, text='Фоном')
+        Comment.objects.create(post=post, author=author, text='Ответ')
+        self.client.force_login(author)
+        self.client.post(
+            reverse('posts:post_delete', args=[post.pk]), {'confirm': 'True'}
+        )
+        # Пул из одного потока: пустая задача ждёт конца чистки
+        deletion.executor().submit(lambda: None).result()
+        self.assertFalse(Post._base_manager.exists())
+        self.assertFalse(Comment.objects.exists())
@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts import deletion
+from posts.feeds import JoinPaginator, PullPaginator, merge_recent
+from posts.models import Follow, Post, User
+
+
+@override_settings(FOLLOW_FEED_ENGINE='pull', AUTHOR_RECENT_LENGTH=3)
+class PullFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}') for i in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        for i in range(12):
+            Post.objects.create(
+                text=f'Запись {i}', author=cls.authors[i % 3]
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, paginator_class):
+        pages, cursor = [], None
+        while True:
+            page = paginator_class(self.reader, 4).get_page(cursor)
+            pages.append([post.pk for post in page.object_list])
+            cursor = page.next_cursor
+            if cursor is None:
+                return pages
+
+    def test_pull_matches_join(self):
+        """Слияние списков авторов даёт ту же ленту, что и соединение."""
+        self.assertEqual(self.walk(PullPaginator), self.walk(JoinPaginator))
+
+    def test_recent_lists_follow_writes(self):
+        """Новые и удалённые записи сразу отражаются в ленте."""
+        self.walk(PullPaginator)
+        post = Post.objects.create(text='Свежая', author=self.authors[0])
+        first = PullPaginator(self.reader, 4).get_page(None)
+        self.assertEqual(first.object_list[0], post)
+        post.delete()
+        first = PullPaginator(self.reader, 4).get_page(None)
+        self.assertNotIn(post, first.object_list)
+
+    @override_settings(AUTHOR_RECENT_LENGTH=2)
+    def test_deleting_every_cached_post_of_author(self):
+        """Опустевший обрезанный список автора не ломает ленту."""
+        self.walk(PullPaginator)
+        author = self.authors[0]
+        for post in author.posts.order_by('-pub_date', '-pk')[:2]:
+            deletion.delete_post(post)
+        self.assertIsNone(merge_recent([([], False)], None, 1))
+        self.assertEqual(self.walk(PullPaginator), self.walk(JoinPaginator))
+
+    def test_merge_stops_at_truncated_horizon(self):
+        """За горизонтом обрезанного списка слияние отказывает."""
+        recent = [([(5, 5), (3, 3)], False), ([(4, 4), (1, 1)], True)]
+        self.assertEqual(merge_recent(recent, None, 3), [(5, 5), (4, 4),
+                                                         (3, 3)])
+        self.assertIsNone(merge_recent(recent, (3, 3), 2))
+
+    def test_benchmark_command(self):
+        """Команда сравнения движков печатает время каждого движка."""
+        out = StringIO()
+        call_command('benchmark_follow_feed', 'reader', repeat=1, stdout=out)
+        for engine in ('sql', 'timeline', 'pull'):
+            self.assertIn(engine, out.getvalue())
@@ -0,0 +1,191 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from sorl.thumbnail import default
+
+from posts import images, media_gc, thumbnails
+from posts.models import Post, StoredImage, User
+from .test_thumbnails import SMALL_GIF
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_PREGENERATE=False)
+class ContentAddressedImagesTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='uploader')
+
+    def create_post(self, name='photo.gif'):
+        return Post.objects.create(
+            author=self.user,
+            text='С картинкой',
+            image=SimpleUploadedFile(name, SMALL_GIF, 'image/gif'),
+        )
+
+    def test_same_content_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом с подсчётом ссылок."""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))),
+                         1)
+        stored = StoredImage.objects.get(name=first.image.name)
+        self.assertEqual(stored.references, 2)
+
+    def test_last_reference_deletes_file(self):
+        """Файл удаляется, когда на него не ссылается ни одна запись."""
+        first = self.create_post()
+        second = self.create_post()
+        path = first.image.path
+        first.delete()
+        self.assertEqual(
+            StoredImage.objects.get(name=second.image.name).references, 1
+        )
+        second.delete()
+        images._delete_unreferenced(second.image.name)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_concurrent_identical_upload_keeps_name(self):
+        """Параллельная загрузка того же файла получает то же имя
+        и не оставляет копий."""
+        first = self.create_post()
+        storage = first.image.storage
+        exists = storage.exists
+        checked = []
+
+        def racing_exists(name):
+            # Первая проверка ещё не видит файл параллельной загрузки
+            if not checked:
+                checked.append(name)
+                return False
+            return exists(name)
+
+        with mock.patch.object(storage, 'exists', side_effect=racing_exists):
+            name = storage.save('posts/again.gif', ContentFile(SMALL_GIF))
+        self.assertEqual(name, first.image.name)
+        self.assertEqual(os.listdir(os.path.dirname(first.image.path)),
+                         [os.path.basename(name)])
+
+    def test_upload_survives_concurrent_delete(self):
+        """Файл, удалённый между сохранением загрузки той же картинки
+        и учётом ссылки на него, записывается заново.
+        """
+        first = self.create_post()
+        name = first.image.name
+        first.delete()
+        retain = images.retain
+
+        def delete_then_retain(name, content=None):
+            images._delete_unreferenced(name)
+            self.assertFalse(first.image.storage.exists(name))
+            retain(name, content)
+
+        with mock.patch.object(images, 'retain', delete_then_retain):
+            second = self.create_post()
+        self.assertEqual(second.image.name, name)
+        self.assertTrue(second.image.storage.exists(name))
+        self.assertEqual(StoredImage.objects.get(name=name).references, 1)
+
+    def test_thumbnails_skipped_for_known_digest(self):
+        """Миниатюры не готовятся повторно для уже обработанного файла."""
+        thumbnails.generate(self.create_post().image.name)
+        with mock.patch.object(thumbnails.transaction, 'on_commit') as hook:
+            thumbnails.schedule(self.create_post())
+        hook.assert_not_called()
+
+    def test_uploads_sharded_by_digest(self):
+        """Новые картинки раскладываются по подкаталогам из хеша."""
+        name = self.create_post().image.name
+        directory, first, second, filename = name.split('/')
+        self.assertEqual(directory, 'posts')
+        self.assertEqual(first + second, filename[:4])
+
+    def test_shard_images_command(self):
+        """Команда переносит плоские файлы и повторно ничего не трогает."""
+        legacy = FileSystemStorage(location=TEMP_MEDIA_ROOT).save(
+            'posts/legacy.gif', ContentFile(SMALL_GIF)
+        )
+        post = Post.objects.create(
+            author=self.user, text='Старая запись', image=legacy
+        )
+        out = StringIO()
+        # В TestCase транзакция не фиксируется, поэтому хуки сразу.
+        with mock.patch.object(images.transaction, 'on_commit',
+                               lambda callback: callback()):
+            call_command('shard_images', no_thumbnails=True, stdout=out)
+        self.assertIn('перенесено файлов: 1', out.getvalue())
+        post.refresh_from_db()
+        storage = post.image.storage
+        self.assertTrue(storage.is_sharded(post.image.name))
+        self.assertTrue(storage.exists(post.image.name))
+        self.assertFalse(storage.exists(legacy))
+        self.assertEqual(StoredImage.objects.get().name, post.image.name)
+        self.assertEqual(StoredImage.objects.get().references, 1)
+        out = StringIO()
+        call_command('shard_images', no_thumbnails=True, stdout=out)
+        self.assertIn('перенесено файлов: 0', out.getvalue())
+
+    def test_collect_keeps_reuploaded_original(self):
+        """Сборщик не удаляет файл, на который успела сослаться
+        повторная загрузка, даже если сочёл его ничейным.
+        """
+        post = self.create_post()
+        name = post.image.name
+        self.assertFalse(media_gc.delete_original(name))
+        Post.objects.filter(pk=post.pk).delete()
+        StoredImage.objects.filter(name=name).update(references=0)
+        post = self.create_post()
+        self.assertFalse(media_gc.delete_original(name))
+        self.assertTrue(post.image.storage.exists(name))
+        self.assertEqual(StoredImage.objects.get(name=name).references, 1)
+
+    def test_collect_rechecks_posts_under_lock(self):
+        """Файл с записью, но без учтённых ссылок, остаётся на месте."""
+        post = self.create_post()
+        StoredImage.objects.filter(name=post.image.name).update(references=0)
+        self.assertFalse(media_gc.delete_original(post.image.name))
+        self.assertTrue(post.image.storage.exists(post.image.name))
+        self.assertTrue(StoredImage.objects.filter(
+            name=post.image.name
+        ).exists())
+
+    def test_collect_media(self):
+        """Сборщик удаляет только ничейные исходники и миниатюры."""
+        post = self.create_post()
+        thumbnails.generate(post.image.name)
+        live_thumbnails = media_gc.registered_thumbnails(post.image.name)
+        storage = FileSystemStorage(location=TEMP_MEDIA_ROOT)
+        orphans = [
+            storage.save('posts/orphan.gif', ContentFile(SMALL_GIF)),
+            storage.save('cache/ab/cd/orphan.jpg', ContentFile(b'thumb')),
+        ]
+        out = StringIO()
+        call_command('collect_media', dry_run=True, min_age=0, stdout=out)
+        self.assertIn(
+            f'Можно удалить файлов: 2, байт: {len(SMALL_GIF) + 5}',
+            out.getvalue()
+        )
+        self.assertTrue(all(storage.exists(name) for name in orphans))
+        call_command('collect_media', min_age=0, stdout=StringIO())
+        self.assertFalse(any(storage.exists(name) for name in orphans))
+        self.assertTrue(storage.exists(post.image.name))
+        self.assertTrue(live_thumbnails)
+        self.assertTrue(all(
+            default.storage.exists(name) for name in live_thumbnails
+        ))
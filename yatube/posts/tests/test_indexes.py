@@ -0,0 +1,87 @@
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from core.paginator import BACKWARD, FORWARD, CursorPaginator
+from posts.models import (
+    Comment, Follow, Group, Post, PostTag, TimelineEntry, User
+)
+
+
+def query_plan(queryset):
+    """Вывод EXPLAIN QUERY PLAN для запроса одной строкой."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return ' | '.join(row[-1] for row in cursor.fetchall())
+
+
+class FeedIndexesTests(TestCase):
+    """Каждая лента читается по индексу без сортировки во временном
+    B-дереве, в том числе при переходе по курсору в обе стороны.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Запись'
+        )
+
+    def assertUsesIndex(self, queryset, index):
+        plan = query_plan(queryset)
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def pages(self, queryset, ordering=('-pub_date', '-pk')):
+        """Первая страница и страницы по курсору вперёд и назад."""
+        paginator = CursorPaginator(queryset, 10, ordering=ordering)
+        values = [timezone.now(), 1]
+        yield paginator.object_list[:11]
+        for direction in (FORWARD, BACKWARD):
+            page = paginator.object_list.filter(
+                paginator._keyset_filter(values, direction)
+            )
+            if direction == BACKWARD:
+                page = page.reverse()
+            yield page[:11]
+
+    def test_index_feed(self):
+        for queryset in self.pages(Post.objects.all()):
+            self.assertUsesIndex(queryset, 'post_pub_date')
+
+    def test_author_feed(self):
+        for queryset in self.pages(Post.objects.filter(author=self.user)):
+            self.assertUsesIndex(queryset, 'post_author_pub_date')
+
+    def test_group_feed(self):
+        for queryset in self.pages(Post.objects.filter(group=self.group)):
+            self.assertUsesIndex(queryset, 'post_group_pub_date')
+
+    def test_post_comments(self):
+        comments = Comment.objects.filter(post=self.post).order_by(
+            '-created', '-pk'
+        )
+        self.assertUsesIndex(comments, 'comment_post_created')
+
+    def test_followers(self):
+        followers = Follow.objects.filter(author=self.user).values_list(
+            'user_id', flat=True
+        )
+        self.assertUsesIndex(followers, 'follow_author_user')
+
+    def test_following_lookup(self):
+        following = Follow.objects.filter(user=self.user, author=self.user)
+        # UniqueConstraint в SQLite — ограничение таблицы с автоиндексом.
+        self.assertUsesIndex(following, 'sqlite_autoindex_posts_follow')
+
+    def test_tag_page(self):
+        entries = PostTag.objects.filter(kind=PostTag.HASHTAG, name='tag')
+        for queryset in self.pages(entries, ('-pub_date', '-post_id')):
+            self.assertUsesIndex(queryset, 'post_tag_name_pub_date')
+
+    def test_timeline(self):
+        entries = TimelineEntry.objects.filter(user=self.user)
+        for queryset in self.pages(entries, ('-pub_date', '-post_id')):
+            self.assertUsesIndex(queryset, 'timeline_user_pub_date')
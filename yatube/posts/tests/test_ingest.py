@@ -0,0 +1,133 @@
+import os
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from posts.forms import PostForm
+
+# Пик RSS берётся из VmHWM: в отличие от ru_maxrss он не наследуется
+# от родительского процесса при exec.
+PEAK_RSS_SCRIPT = '''
+import sys
+
+from PIL import Image
+
+from posts.ingest import process
+
+
+def peak_rss():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+
+
+Image.init()
+before = peak_rss()
+if sys.argv[2] == 'ingest':
+    process(sys.argv[1], 10 ** 9, (1920, 1920),
+            max_decoded_pixels=int(sys.argv[3]))
+else:
+    Image.open(sys.argv[1]).load()
+print(peak_rss() - before)
+'''
+
+
+def jpeg_upload(size, orientation=None, name='photo.jpg'):
+    buffer = BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(THUMBNAIL_PREGENERATE=False)
+class ImageIngestTests(TestCase):
+    def clean_image(self, upload):
+        form = PostForm(data={'text': 'Текст'}, files={'image': upload})
+        self.assertTrue(form.is_valid(), form.errors)
+        return Image.open(form.cleaned_data['image'])
+
+    @override_settings(IMAGE_MASTER_SIZE=(100, 100))
+    def test_downscaled_to_master_size(self):
+        """Большая картинка ужимается до мастер-размера."""
+        image = self.clean_image(jpeg_upload((400, 200)))
+        self.assertEqual(image.size, (100, 50))
+
+    def test_orientation_applied_and_exif_stripped(self):
+        """Поворот из EXIF применяется, метаданные удаляются."""
+        image = self.clean_image(jpeg_upload((40, 20), orientation=6))
+        self.assertEqual(image.size, (20, 40))
+        self.assertNotIn('exif', image.info)
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_oversized_rejected_by_header(self):
+        """Картинка больше IMAGE_MAX_PIXELS отклоняется формой."""
+        form = PostForm(data={'text': 'Текст'},
+                        files={'image': jpeg_upload((100, 100))})
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    @override_settings(IMAGE_MAX_DECODED_PIXELS=1000)
+    def test_oversized_png_rejected_before_decode(self):
+        """Для PNG, который раскодируется целиком, предел ниже."""
+        buffer = BytesIO()
+        Image.new('RGBA', (100, 100)).save(buffer, 'PNG')
+        form = PostForm(data={'text': 'Текст'}, files={
+            'image': SimpleUploadedFile(
+                'image.png', buffer.getvalue(), 'image/png'
+            ),
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+        self.assertTrue(self.clean_image(jpeg_upload((100, 100))))
+
+    def peak_rss(self, path, mode):
+        result = subprocess.run(
+            [sys.executable, '-c', PEAK_RSS_SCRIPT, path, mode,
+             str(settings.IMAGE_MAX_DECODED_PIXELS)],
+            cwd=settings.BASE_DIR, capture_output=True, check=True,
+            text=True,
+        )
+        return int(result.stdout)
+
+    @skipUnless(os.path.exists('/proc/self/status'), 'нужен procfs')
+    def test_peak_rss_bounded(self):
+        """Приём 40-мегапиксельного JPEG не раскодирует его целиком."""
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as file:
+            Image.new('RGB', (8000, 5000), 'red').save(file, 'JPEG')
+            file.flush()
+            full_decode = self.peak_rss(file.name, 'full')
+            ingest = self.peak_rss(file.name, 'ingest')
+        # VmHWM в килобайтах: полный декод занимает ~120 МБ.
+        self.assertLess(ingest, 40 * 1024)
+        self.assertLess(ingest * 4, full_decode)
+
+    @skipUnless(os.path.exists('/proc/self/status'), 'нужен procfs')
+    def test_peak_rss_bounded_for_png(self):
+        """PNG раскодируется целиком, но не больше
+        IMAGE_MAX_DECODED_PIXELS: 40 Мп отклоняются по заголовку,
+        а разрешённые 8 Мп в RGBA укладываются в ~85 МБ.
+        """
+        with tempfile.NamedTemporaryFile(suffix='.png') as file:
+            Image.new('RGBA', (8000, 5000)).save(file, 'PNG')
+            file.flush()
+            result = subprocess.run(
+                [sys.executable, '-c', PEAK_RSS_SCRIPT, file.name,
+                 'ingest', str(settings.IMAGE_MAX_DECODED_PIXELS)],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+            )
+            self.assertIn('ImageTooLarge', result.stderr)
+        with tempfile.NamedTemporaryFile(suffix='.png') as file:
+            Image.new('RGBA', (4000, 2000)).save(file, 'PNG')
+            file.flush()
+            ingest = self.peak_rss(file.name, 'ingest')
+        self.assertLess(ingest, 100 * 1024)
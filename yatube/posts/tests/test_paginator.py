@@ -1,12 +1,18 @@
+import json
 from http import HTTPStatus
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
 
 from posts.models import Post, Group, User
 from .constants import (
     INDEX_URL,
     GROUP_LIST_URL,
     PROFILE_URL,
+    FOLLOW_INDEX_URL,
 )
 
 
@@ -43,7 +49,74 @@ class PaginationTestCase(TestCase):
                 self.assertEqual(response.status_code, HTTPStatus.OK)
                 self.assertEqual(len(response.context['page_obj']),
                                  posts_on_first_page)
-                response = self.guest_client.get(f"{url}?page=2")
+                cursor = response.context['page_obj'].next_cursor
+                response = self.guest_client.get(f"{url}?cursor={cursor}")
                 self.assertEqual(response.status_code, HTTPStatus.OK)
                 self.assertEqual(len(response.context['page_obj']),
                                  posts_on_second_page)
+
+    def test_cursor_navigation(self):
+        """Курсоры вперёд и назад возвращают соседние страницы."""
+        url = reverse(GROUP_LIST_URL, kwargs={'slug': self.group.slug})
+        first_page = self.guest_client.get(url).context['page_obj']
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+        second_page = self.guest_client.get(
+            f'{url}?cursor={first_page.next_cursor}'
+        ).context['page_obj']
+        self.assertEqual(second_page.number, 2)
+        self.assertFalse(second_page.has_next())
+        self.assertFalse(
+            set(first_page.object_list) & set(second_page.object_list)
+        )
+        previous_page = self.guest_client.get(
+            f'{url}?cursor={second_page.previous_cursor}'
+        ).context['page_obj']
+        self.assertEqual(previous_page.number, 1)
+        self.assertEqual(list(previous_page.object_list),
+                         list(first_page.object_list))
+
+    def test_invalid_cursor_returns_first_page(self):
+        """Некорректный курсор открывает первую страницу."""
+        url = reverse(GROUP_LIST_URL, kwargs={'slug': self.group.slug})
+        response = self.guest_client.get(f'{url}?cursor=broken')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    @override_settings(FOLLOW_FEED_ENGINE='pull')
+    def test_tampered_cursor_values_return_first_page(self):
+        """Курсор с неверными типами значений тоже ведёт на первую
+        страницу, а не к ошибке сервера.
+        """
+        user = User.objects.get(pk=self.user.pk)
+        user.following.create(user=user)
+        self.guest_client.force_login(user)
+        date = '2024-01-01 00:00:00+00:00'
+        urls = [
+            reverse(INDEX_URL),
+            reverse(PROFILE_URL, kwargs={'username': self.user.username}),
+            reverse(FOLLOW_INDEX_URL),
+        ]
+        for values in (
+            ['x', 'y'], [date, 'abc'], [1, 2], [None, None],
+            ['2024-01-01 00:00:00', 1], [[date], {}],
+        ):
+            cursor = urlsafe_base64_encode(
+                force_bytes(json.dumps([2, 'next', values]))
+            )
+            for url in urls:
+                with self.subTest(url=url, values=values):
+                    response = self.guest_client.get(
+                        f'{url}?cursor={cursor}'
+                    )
+                    self.assertEqual(response.status_code, HTTPStatus.OK)
+                    self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_deep_page_has_no_offset(self):
+        """Следующая страница выбирается по ключу, без OFFSET."""
+        url = reverse(GROUP_LIST_URL, kwargs={'slug': self.group.slug})
+        cursor = self.guest_client.get(url).context['page_obj'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(f'{url}?cursor={cursor}')
+        for query in queries.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
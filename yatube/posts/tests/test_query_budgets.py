@@ -0,0 +1,125 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import resolve
+from sorl.thumbnail import default
+
+from core import queries
+from core.middleware import QueryInspectorMiddleware
+from posts.models import Post
+from .pages import SeededPagesMixin
+
+
+class QueryBudgetTests(SeededPagesMixin, TestCase):
+    """Каждая страница posts.urls укладывается в объявленный бюджет
+    запросов и не повторяет запрос одной формы на каждую запись,
+    в том числе с картинками в карточках.
+    """
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def test_every_view_declares_budget(self):
+        for name, url, _ in self.pages():
+            with self.subTest(page=name):
+                view = resolve(url).func
+                self.assertIsInstance(
+                    getattr(view, 'query_budget', None), int,
+                    'Представление без @query_budget'
+                )
+
+    def test_pages_fit_budget_without_repeats(self):
+        for name, url, params in self.pages():
+            with self.subTest(page=name):
+                cache.clear()
+                default.kvstore.clear_local()
+                with queries.capture() as log:
+                    self.client.get(url, params)
+                view = resolve(url).func
+                self.assertEqual(
+                    log.problems(
+                        view.query_budget,
+                        per_database=view.query_budget_per_database,
+                    ),
+                    [],
+                )
+
+
+class QueryLogTests(TestCase):
+
+    def test_normalize_replaces_literals(self):
+        self.assertEqual(
+            queries.normalize(
+                "SELECT * FROM t WHERE id = 5 AND name = 'it''s' "
+                'AND pk IN (%s, %s, %s)'
+            ),
+            'SELECT * FROM t WHERE id = ? AND name = ? AND pk IN (...)',
+        )
+
+    def test_problems_report_repeats_and_budget(self):
+        log = queries.QueryLog()
+        for pk in range(3):
+            log(lambda *args: None, f'SELECT 1 FROM t WHERE id = {pk}',
+                (), False, {'connection': connection})
+        self.assertEqual(log.count, 3)
+        self.assertEqual(log.problems(repeat_limit=4), [])
+        self.assertEqual(len(log.problems(repeat_limit=3)), 1)
+        self.assertEqual(
+            log.problems(budget=2, repeat_limit=4),
+            ['3 запросов при бюджете 2'],
+        )
+
+    def test_other_databases_raise_budget_not_repeats(self):
+        log = queries.QueryLog()
+        for alias in ('default', 'shard1', 'archive'):
+            log(lambda *args: None, 'SELECT 1 FROM t', (), False,
+                {'connection': mock.Mock(alias=alias)})
+        self.assertEqual(log.problems(repeat_limit=3), [])
+        self.assertEqual(log.problems(budget=1, per_database=1), [])
+        self.assertEqual(
+            log.problems(budget=0, per_database=1),
+            ['3 запросов при бюджете 2'],
+        )
+
+
+@override_settings(QUERY_INSPECTOR=True, QUERY_REPEAT_LIMIT=3)
+class QueryInspectorMiddlewareTests(TestCase):
+
+    def inspect(self, budget, queries_made):
+        def view(request):
+            for _ in range(queries_made):
+                Post.objects.filter(pk=1).exists()
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        middleware = QueryInspectorMiddleware(view)
+        middleware.process_view(
+            request, queries.query_budget(budget)(view), (), {}
+        )
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            middleware(request)
+        return logs.output
+
+    def test_warns_about_repeats(self):
+        output = self.inspect(budget=10, queries_made=3)
+        self.assertEqual(len(output), 1)
+        self.assertIn('3 запросов одной формы', output[0])
+
+    def test_warns_when_budget_exceeded(self):
+        output = self.inspect(budget=1, queries_made=2)
+        self.assertEqual(len(output), 1)
+        self.assertIn('2 запросов при бюджете 1', output[0])
+
+    def test_setting_is_read_per_request(self):
+        middleware = QueryInspectorMiddleware(HttpResponse)
+        for value, debug in ((False, True), (None, False)):
+            with self.subTest(QUERY_INSPECTOR=value, DEBUG=debug), \
+                    self.settings(QUERY_INSPECTOR=value, DEBUG=debug), \
+                    mock.patch.object(queries, 'capture') as capture:
+                middleware(RequestFactory().get('/'))
+            capture.assert_not_called()
+        with self.settings(QUERY_INSPECTOR=None, DEBUG=True):
+            self.assertTrue(queries.inspecting())
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from sorl.thumbnail import default
+
+from core.queries import normalize
+from .pages import SeededPagesMixin
+
+SNAPSHOT = os.path.join(os.path.dirname(__file__), 'query_plans.json')
+# Перезапись снимков: UPDATE_QUERY_PLANS=1 python manage.py test ...
+UPDATE = os.environ.get('UPDATE_QUERY_PLANS') == '1'
+
+GUARDED_TABLES = ('posts_post', 'posts_comment', 'posts_follow')
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+# Обращение к таблице: SEARCH или SCAN, таблица (или её псевдоним
+# в запросе) и индекс. Старые SQLite пишут «SCAN TABLE x AS T4»,
+# новые — «SCAN T4», поэтому слово TABLE и имя под псевдонимом
+# отбрасываются, как и столбцы ключа поиска в скобках.
+ACCESS_RE = re.compile(
+    r'(?P<access>SEARCH|SCAN) (?:TABLE )?(?P<table>\S+)'
+    r'(?: AS (?P<alias>\S+))?'
+    r'(?: USING (?:(?:AUTOMATIC )?(?:COVERING )?INDEX (?P<index>\S+)'
+    r'|(?P<primary>(?:INTEGER )?PRIMARY KEY)))?'
+)
+TEMP_B_TREE = 'TEMP B-TREE'
+LIMIT_RE = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+
+
+def normalize_plan_line(line):
+    """Существенное в строке EXPLAIN QUERY PLAN или None: какой индекс
+    используется, полный ли это проход, строится ли временное B-дерево.
+    """
+    if line.startswith('USE TEMP B-TREE'):
+        return TEMP_B_TREE
+    match = ACCESS_RE.match(line)
+    if match is None:
+        return None
+    step = f'{match["access"]} {match["alias"] or match["table"]}'
+    if match['index']:
+        step += f' INDEX {match["index"]}'
+    elif match['primary']:
+        step += ' PRIMARY KEY'
+    return step
+
+
+def query_plan(sql):
+    """План запроса, сведённый к normalize_plan_line, одной строкой."""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        lines = [row[-1] for row in cursor.fetchall()]
+    steps = (normalize_plan_line(line) for line in lines)
+    return ' | '.join(step for step in steps if step)
+
+
+def is_regression(plan, sql):
+    """Полный проход или сортировка во временном B-дереве по таблицам
+    записей, комментариев и подписок.
+
+    Обход по индексу в порядке сортировки (SCAN … INDEX) допустим,
+    только если у запроса есть LIMIT, как у страницы ленты; без LIMIT
+    это тот же полный проход.
+    """
+    steps = plan.split(' | ')
+    exempt = '(?! INDEX)' if LIMIT_RE.search(sql) else ''
+    for table in GUARDED_TABLES:
+        scan = re.compile(rf'SCAN {table}\b{exempt}')
+        if any(scan.match(step) for step in steps):
+            return True
+    return TEMP_B_TREE in steps and any(
+        re.search(rf'\b{table}\b', plan) for table in GUARDED_TABLES
+    )
+
+
+class QueryPlanSnapshotTests(SeededPagesMixin, TestCase):
+    """Планы всех запросов каждой страницы posts.urls сравниваются
+    с закоммиченными снимками в query_plans.json.
+    """
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def capture(self, url, params):
+        """Планы запросов страницы: форма запроса → план."""
+        cache.clear()
+        default.kvstore.clear_local()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, params)
+        return {
+            normalize(query['sql']): query_plan(query['sql'])
+            for query in queries.captured_queries
+            if query['sql'].lstrip().upper().startswith(EXPLAINED)
+        }
+
+    def test_query_plans_match_snapshots(self):
+        plans = {
+            name: self.capture(url, params)
+            for name, url, params in self.pages()
+        }
+        with open(SNAPSHOT, encoding='utf-8') as snapshot:
+            expected = json.load(snapshot)
+        if UPDATE:
+            with open(SNAPSHOT, 'w', encoding='utf-8') as snapshot:
+                json.dump(
+                    {name: [{'sql': sql, 'plan': plan}
+                            for sql, plan in sorted(queries.items())]
+                     for name, queries in plans.items()},
+                    snapshot, ensure_ascii=False, indent=2, sort_keys=True,
+                )
+                snapshot.write('\n')
+        for name, queries in plans.items():
+            with self.subTest(page=name):
+                self.assertIn(name, expected, 'Нет снимка для страницы')
+                known = {query['plan'] for query in expected[name]}
+                new = [
+                    (sql, plan) for sql, plan in queries.items()
+                    if plan not in known and is_regression(plan, sql)
+                ]
+                self.assertEqual(new, [], 'Новый полный проход или '
+                                          'сортировка без индекса')
+                if not UPDATE:
+                    self.assertEqual(
+                        set(queries.values()), known,
+                        'Планы изменились: проверьте их и перезапишите '
+                        'снимки с UPDATE_QUERY_PLANS=1',
+                    )
+
+    def test_index_scan_needs_limit(self):
+        plan = 'SCAN posts_post INDEX posts_pub_date'
+        self.assertFalse(is_regression(
+            plan, 'SELECT * FROM posts_post ORDER BY pub_date LIMIT 11'
+        ))
+        self.assertTrue(is_regression(
+            plan, 'SELECT * FROM posts_post ORDER BY pub_date'
+        ))
+
+    def test_plan_lines_of_old_and_new_sqlite_match(self):
+        for old, new in [
+            ('SCAN TABLE posts_post', 'SCAN posts_post'),
+            ('SEARCH TABLE auth_user AS T4 USING INTEGER PRIMARY KEY '
+             '(rowid=?)', 'SEARCH T4 USING INTEGER PRIMARY KEY (rowid=?)'),
+            ('SEARCH TABLE posts_follow USING COVERING INDEX '
+             'follow_author_user (author_id=?)',
+             'SEARCH posts_follow USING INDEX follow_author_user '
+             '(author_id=? AND user_id=?)'),
+            ('USE TEMP B-TREE FOR ORDER BY', 'USE TEMP B-TREE FOR GROUP BY'),
+        ]:
+            with self.subTest(line=new):
+                self.assertEqual(normalize_plan_line(old),
+                                 normalize_plan_line(new))
+        self.assertIsNone(normalize_plan_line('SCALAR SUBQUERY 1'))
@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import replicas
+from posts.models import Post, User
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRouterTests(TransactionTestCase):
+    """Реплика — копия тестовой базы в файле SQLite, снятая в setUp:
+    записи, сделанные после копирования, на ней не видны.
+
+    Копия делается резервным копированием SQLite, которое ждёт конца
+    открытой транзакции, поэтому тест не оборачивается в TestCase.
+    """
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        Post.objects.create(author=self.author, text='Копия')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.databases[REPLICA] = dict(
+            connections['default'].settings_dict,
+            NAME=os.path.join(directory.name, 'replica.sqlite3'),
+        )
+        self.addCleanup(connections.databases.pop, REPLICA)
+        self.addCleanup(connections[REPLICA].close)
+        self.addCleanup(delattr, connections._connections, REPLICA)
+        connections['default'].ensure_connection()
+        connections[REPLICA].ensure_connection()
+        connections['default'].connection.backup(
+            connections[REPLICA].connection
+        )
+        Post.objects.create(author=self.author, text='Только в основной')
+        cache.clear()
+
+    def test_read_only_views_read_replica(self):
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:profile', args=[self.author.username]),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, 'Копия')
+                self.assertNotContains(response, 'Только в основной')
+
+    def test_other_views_read_primary(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'основной'})
+        self.assertContains(response, 'Только в')
+
+    def test_client_sticks_to_primary_after_write(self):
+        self.client.force_login(self.author)
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Свежая запись'}
+        )
+        self.assertIn('read_primary', response.cookies)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Свежая запись')
+
+    def test_only_executed_writes_pin(self):
+        replicas.use_replica(True)
+        self.addCleanup(replicas.use_replica, False)
+        with replicas.watching_writes():
+            User.objects.get_or_create(username='author')
+            KVStoreModel.objects.create(key='thumbnail', value='{}')
+            self.assertFalse(replicas.wrote())
+            User.objects.get_or_create(username='reader')
+            self.assertTrue(replicas.wrote())
+
+    def test_reads_do_not_pin(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('read_primary', response.cookies)
+
+    def test_pin_expires(self):
+        self.client.cookies['read_primary'] = '1'
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Только в основной')
+        del self.client.cookies['read_primary']
+        cache.clear()
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Только в основной')
@@ -0,0 +1,94 @@
+from django.contrib.admin.sites import site
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from posts import fulltext
+from posts.models import Comment, Post, User
+from .constants import SEARCH_URL
+
+
+class FullTextSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+
+    def search(self, query, cursor=None):
+        data = {'q': query}
+        if cursor:
+            data['cursor'] = cursor
+        return self.client.get(reverse(SEARCH_URL), data).context['posts']
+
+    def test_ranked_by_relevance(self):
+        """Запись, где слово встречается чаще, идёт выше."""
+        once = Post.objects.create(
+            author=self.author, text='Кот спит, а собака лает громко'
+        )
+        twice = Post.objects.create(author=self.author, text='Кот и кот')
+        Post.objects.create(author=self.author, text='Про собак')
+        self.assertEqual(list(self.search('кот')), [twice, once])
+
+    def test_index_follows_edits_and_deletes(self):
+        """Триггеры держат индекс в согласии с таблицей записей."""
+        post = Post.objects.create(author=self.author, text='Старый текст')
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(list(self.search('старый')), [])
+        self.assertEqual(list(self.search('новый')), [post])
+        Post.objects.filter(pk=post.pk).update(text='Третий вариант')
+        self.assertEqual(list(self.search('вариант')), [post])
+        post.delete()
+        self.assertEqual(list(self.search('вариант')), [])
+
+    def test_snippet_highlighted_and_escaped(self):
+        """Совпадение выделено <mark>, разметка из текста экранирована."""
+        Post.objects.create(author=self.author, text='<b>Жирный</b> кот')
+        content = self.client.get(
+            reverse(SEARCH_URL), {'q': 'кот'}
+        ).content.decode()
+        self.assertIn('&lt;b&gt;Жирный&lt;/b&gt; <mark>кот</mark>', content)
+
+    def test_prefix_and_fts_syntax(self):
+        """Последнее слово ищется префиксом, синтаксис FTS5 не ломает поиск."""
+        post = Post.objects.create(author=self.author, text='Программирование')
+        self.assertEqual(list(self.search('програм')), [post])
+        self.assertEqual(list(self.search('"програм)(')), [post])
+        self.assertIsNone(self.search('  '))
+
+    def test_cursor_pagination(self):
+        """Результаты листаются курсором без повторов."""
+        posts = [
+            Post.objects.create(author=self.author, text=f'Запись номер {i}')
+            for i in range(13)
+        ]
+        first = self.search('запись')
+        second = self.search('запись', first.next_cursor)
+        self.assertEqual(len(first), 10)
+        self.assertEqual(
+            {post.pk for post in first} | {post.pk for post in second},
+            {post.pk for post in posts},
+        )
+        self.assertFalse(second.has_next())
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт через индекс FTS5."""
+        post = Post.objects.create(author=self.author, text='Котлета')
+        comment = Comment.objects.create(
+            post=post, author=self.author, text='Вкусная котлета'
+        )
+        request = RequestFactory().get('/')
+        for model, obj in ((Post, post), (Comment, comment)):
+            queryset, _ = site._registry[model].get_search_results(
+                request, model.objects.all(), 'котл'
+            )
+            self.assertIn(fulltext.INDEXES[model], str(queryset.query))
+            self.assertEqual(list(queryset), [obj])
+
+    def test_install_rebuilds_after_lost_triggers(self):
+        """Пропавшие при перестройке таблицы триггеры восстанавливаются."""
+        post = Post.objects.create(author=self.author, text='Потерянный')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_fts_update')
+        Post.objects.filter(pk=post.pk).update(text='Найденный')
+        fulltext.install()
+        self.assertEqual(list(self.search('найденный')), [post])
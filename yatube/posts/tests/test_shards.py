@@ -0,0 +1,258 @@
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from core import writer
+from posts import checks, deletion, shards
+from posts.models import (
+    AuthorShard, Comment, DeletedUser, Follow, Post, PostTag, StoredImage,
+    TimelineEntry, User, UserStats,
+)
+from .pages import SMALL_GIF, StrictQueryBudgetMixin
+
+SHARD = 'shard1'
+
+
+@override_settings(POST_SHARDS=['default', SHARD], THUMBNAIL_PREGENERATE=False)
+class ShardTests(StrictQueryBudgetMixin, TransactionTestCase):
+    """Вторая база — файл SQLite с полной схемой, созданный на класс.
+
+    Роутер пишет на неё из других потоков соединения, поэтому тесты
+    без общей транзакции.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.databases[SHARD] = dict(
+            connections['default'].settings_dict,
+            NAME=os.path.join(cls.directory.name, 'shard.sqlite3'),
+        )
+        call_command('migrate', database=SHARD, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[SHARD].close()
+        del connections._connections.shard1
+        del connections.databases[SHARD]
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(
+            call_command, 'flush', database=SHARD, interactive=False,
+            verbosity=0,
+        )
+        self.near = User.objects.create_user(username='near')
+        self.far = User.objects.create_user(username='far')
+        self.reader = User.objects.create_user(username='reader')
+        AuthorShard.objects.create(author=self.near, alias='default')
+        AuthorShard.objects.create(author=self.far, alias=SHARD)
+
+    def posts(self, alias):
+        return Post.objects.using(alias)
+
+    def test_users_are_replicated(self):
+        self.far.first_name = 'Дальний'
+        self.far.save()
+        self.assertEqual(
+            User.objects.using(SHARD).get(pk=self.far.pk).first_name,
+            'Дальний',
+        )
+
+    def test_posts_are_placed_by_author(self):
+        near = Post.objects.create(author=self.near, text='Рядом #метка')
+        far = Post.objects.create(author=self.far, text='Далеко #метка')
+        self.assertNotEqual(near.pk, far.pk)
+        self.assertTrue(self.posts('default').filter(pk=near.pk).exists())
+        self.assertFalse(self.posts(SHARD).filter(pk=near.pk).exists())
+        self.assertTrue(self.posts(SHARD).filter(pk=far.pk).exists())
+        self.assertTrue(
+            PostTag.objects.using(SHARD).filter(post=far.pk).exists()
+        )
+        self.assertEqual(list(self.far.posts.all()), [far])
+
+    def test_next_id_without_returning(self):
+        database = connections['default'].Database
+        with mock.patch.object(database, 'sqlite_version_info', (3, 31, 1)):
+            self.assertEqual(shards.next_id('tests.sequence'), 1)
+            self.assertEqual(shards.next_id('tests.sequence'), 2)
+        self.assertEqual(shards.next_id('tests.sequence'), 3)
+
+    def test_new_author_is_pinned_to_shard(self):
+        author = User.objects.create_user(username='new')
+        Post.objects.create(author=author, text='Первая')
+        alias = AuthorShard.objects.get(author=author).alias
+        self.assertIn(alias, ['default', SHARD])
+        self.assertTrue(
+            self.posts(alias).filter(author_id=author.pk).exists()
+        )
+
+    def test_index_merges_shards(self):
+        for number in range(12):
+            Post.objects.create(
+                author=self.near if number % 2 else self.far,
+                text=f'Запись {number}',
+            )
+        response = self.client.get(reverse('posts:index'))
+        page = response.context['page_obj']
+        self.assertEqual(
+            [post.text for post in page],
+            [f'Запись {number}' for number in range(11, 1, -1)],
+        )
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': page.next_cursor}
+        )
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Запись 1', 'Запись 0'],
+        )
+
+    def test_post_detail_and_comment_on_shard(self):
+        post = Post.objects.create(author=self.far, text='Далеко')
+        self.client.force_login(self.reader)
+        self.client.post(
+            reverse('posts:add_comment', args=[post.pk]),
+            {'text': 'Комментарий'},
+        )
+        comment = Comment.objects.using(SHARD).get(post=post.pk)
+        self.assertEqual(self.posts(SHARD).get(pk=post.pk).comments_count, 1)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertContains(response, 'Комментарий')
+        self.client.post(reverse('posts:delete_comment', args=[comment.pk]))
+        self.assertFalse(Comment.objects.using(SHARD).exists())
+
+    def test_follow_feeds_merge_shards(self):
+        Post.objects.create(author=self.near, text='Рядом')
+        Post.objects.create(author=self.far, text='Далеко')
+        Follow.objects.create(user=self.reader, author=self.near)
+        Follow.objects.create(user=self.reader, author=self.far)
+        self.client.force_login(self.reader)
+        for engine in ('sql', 'timeline', 'pull'):
+            with self.subTest(engine=engine), \
+                    self.settings(FOLLOW_FEED_ENGINE=engine):
+                cache.clear()
+                response = self.client.get(reverse('posts:follow_index'))
+                self.assertEqual(
+                    [post.text for post in response.context['page_obj']],
+                    ['Далеко', 'Рядом'],
+                )
+
+    def test_write_queue_rolls_back_job_on_its_shard(self):
+        def write():
+            Post.objects.create(author=self.far, text='Откатится')
+            raise ValueError
+
+        future = mock.Mock()
+        writer.commit([(future, write, (), {}, SHARD)])
+        future.set_exception.assert_called_once()
+        self.assertFalse(self.posts(SHARD).exists())
+
+    def test_move_author(self):
+        post = Post.objects.create(author=self.far, text='Переезд #метка')
+        Comment.objects.create(post=post, author=self.reader, text='Ответ')
+        Follow.objects.create(user=self.reader, author=self.far)
+        out = StringIO()
+        call_command('rebalance_shards', 'far', 'default', stdout=out)
+        self.assertIn('Перенесено записей: 1', out.getvalue())
+        self.assertEqual(shards.shard_for(self.far.pk), 'default')
+        self.assertFalse(self.posts(SHARD).exists())
+        self.assertFalse(Comment.objects.using(SHARD).exists())
+        self.assertFalse(TimelineEntry.objects.using(SHARD).exists())
+        moved = self.posts('default').get(pk=post.pk)
+        self.assertEqual(moved.pub_date, post.pub_date)
+        self.assertEqual(moved.comments.get().text, 'Ответ')
+        self.assertEqual(moved.tags.get().name, 'метка')
+        self.assertTrue(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(
+            UserStats.objects.get(user=self.far).posts_count, 1
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertContains(response, 'Ответ')
+
+    def test_move_author_with_stale_cache(self):
+        post = Post.objects.create(author=self.far, text='Переезд')
+        self.client.get(reverse('posts:post_detail', args=[post.pk]))
+        # Перенос в другом процессе: местный кеш он не очищает
+        with mock.patch.object(shards.cache, 'delete'), \
+                mock.patch.object(shards.cache, 'delete_many'):
+            call_command('rebalance_shards', 'far', 'default',
+                         stdout=StringIO())
+        self.assertEqual(cache.get(shards._map_key(self.far.pk)), SHARD)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertContains(response, 'Переезд')
+        new = Post.objects.create(author=self.far, text='После переезда')
+        self.assertTrue(self.posts('default').filter(pk=new.pk).exists())
+        self.assertFalse(self.posts(SHARD).exists())
+
+    def test_shards_require_shared_cache(self):
+        self.assertEqual(
+            [error.id for error in checks.shared_cache(None)],
+            ['posts.E001'],
+        )
+        with self.settings(POST_SHARDS=['default']):
+            self.assertEqual(checks.shared_cache(None), [])
+
+    def test_regenerate_thumbnails_on_every_shard(self):
+        other_gif = Image.new('RGB', (3, 2), 'blue')
+        buffer = BytesIO()
+        other_gif.save(buffer, 'GIF')
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            posts = [
+                Post.objects.create(
+                    author=author, text='С картинкой',
+                    image=SimpleUploadedFile(name, content, 'image/gif'),
+                )
+                for author, name, content in (
+                    (self.near, 'same.gif', SMALL_GIF),
+                    (self.far, 'same.gif', SMALL_GIF),
+                    (self.far, 'other.gif', buffer.getvalue()),
+                )
+            ]
+            out = StringIO()
+            call_command('regenerate_thumbnails', workers=1, chunk_size=1,
+                         stdout=out)
+        self.assertIn('Готово файлов: 2', out.getvalue())
+        self.assertEqual(
+            set(StoredImage.objects.filter(
+                thumbnails_ready=True
+            ).values_list('name', flat=True)),
+            {post.image.name for post in posts},
+        )
+
+    def test_user_delete_cascades_on_shards(self):
+        Post.objects.create(author=self.far, text='Далеко')
+        self.far.delete()
+        self.assertFalse(self.posts(SHARD).exists())
+
+    def test_deleted_user_comments_are_hidden_on_shards(self):
+        post = Post.objects.create(author=self.far, text='Далеко')
+        Comment.objects.create(post=post, author=self.reader, text='Скрыть')
+        deletion.delete_user(self.reader)
+        self.assertTrue(
+            DeletedUser.objects.using(SHARD).filter(user=self.reader).exists()
+        )
+        self.assertEqual(self.posts(SHARD).get(pk=post.pk).comments_count, 0)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertNotContains(response, 'Скрыть')
@@ -0,0 +1,46 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase
+
+
+class SqlitePragmaTests(SimpleTestCase):
+    """Новое подключение к файлу базы настраивается по SQLITE_PRAGMAS."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.wrapper = DatabaseWrapper(
+            dict(connection.settings_dict,
+                 NAME=os.path.join(directory.name, 'db.sqlite3')),
+            alias='pragmas',
+        )
+        self.addCleanup(self.wrapper.close)
+
+    def pragma(self, name):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connection_is_configured(self):
+        with self.settings(SQLITE_PRAGMAS={
+            'busy_timeout': 1234,
+            'journal_mode': 'wal',
+            'synchronous': 'normal',
+            'cache_size': -1024,
+        }):
+            self.assertEqual(self.pragma('journal_mode'), 'wal')
+            self.assertEqual(self.pragma('busy_timeout'), 1234)
+            self.assertEqual(self.pragma('synchronous'), 1)
+            self.assertEqual(self.pragma('cache_size'), -1024)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_sqlite', seconds=0.1, rows=10,
+                     readers=1, writers=1, stdout=out)
+        self.assertIn('default', out.getvalue())
+        self.assertIn('tuned', out.getvalue())
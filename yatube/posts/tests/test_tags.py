@@ -0,0 +1,91 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from posts import tags
+from posts.models import Post, PostTag, User
+from .constants import TAG_URL
+
+
+class TagsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.friend = User.objects.create_user(username='friend')
+
+    def tag_names(self, post):
+        return set(post.tags.values_list('kind', 'name'))
+
+    def test_extracted_on_save(self):
+        """Хештеги и упоминания существующих пользователей пишутся
+        при сохранении и обновляются вместе с текстом.
+        """
+        post = Post.objects.create(
+            author=self.author,
+            text='#Django и #python с @friend, @ghost, почта a@b.ru',
+        )
+        self.assertEqual(self.tag_names(post), {
+            ('#', 'django'), ('#', 'python'), ('@', 'friend'),
+        })
+        post.text = 'Только #python'
+        post.save()
+        self.assertEqual(self.tag_names(post), {('#', 'python')})
+
+    def test_tag_page_keyset_pagination(self):
+        """Страница метки листается курсором в порядке публикации."""
+        posts = [
+            Post.objects.create(author=self.author, text=f'#Тема {i}')
+            for i in range(12)
+        ]
+        Post.objects.create(author=self.author, text='Без метки')
+        url = reverse(TAG_URL, args=['тема'])
+        first = self.client.get(url).context['page_obj']
+        second = self.client.get(
+            url, {'cursor': first.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            list(first) + list(second), list(reversed(posts))
+        )
+        mention = self.client.get(reverse(TAG_URL, args=['@friend']))
+        self.assertEqual(list(mention.context['page_obj']), [])
+
+    def test_text_linkified(self):
+        """В карточке хештеги и упоминания становятся ссылками."""
+        self.assertEqual(
+            tags.linkify('<b> #Тег @friend @ghost'),
+            '&lt;b&gt; <a href="{}">#Тег</a> <a href="{}">@friend</a> '
+            '@ghost'.format(
+                reverse(TAG_URL, args=['тег']),
+                reverse(TAG_URL, args=['@friend']),
+            ),
+        )
+
+    def test_cards_link_only_indexed_mentions(self):
+        """Карточки ссылаются только на упоминания из меток записей
+        и проверяют имена одним запросом на страницу.
+        """
+        for number in range(3):
+            Post.objects.create(
+                author=self.author, text=f'{number} @friend @ghost'
+            )
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            tags.prefetch(posts)
+        for post in posts:
+            self.assertEqual(post.known_mentions, {'friend'})
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response, reverse(TAG_URL, args=['@friend']), count=3
+        )
+        self.assertNotContains(response, reverse(TAG_URL, args=['@ghost']))
+
+    def test_backfill_command(self):
+        """Команда заполняет метки для записей без них."""
+        post = Post.objects.create(author=self.author, text='#старое')
+        PostTag.objects.all().delete()
+        out = StringIO()
+        call_command('backfill_tags', batch_size=1, stdout=out)
+        self.assertIn('Готово, обработано записей: 1', out.getvalue())
+        self.assertEqual(self.tag_names(post), {('#', 'старое')})
@@ -0,0 +1,238 @@
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts import kvstore, thumbnails
+from posts.models import Post, User
+from .constants import INDEX_URL, POST_CREATE_URL
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_PREGENERATE=False)
+class ThumbnailsTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.clear_local()
+        self.user = User.objects.create_user(username='uploader')
+        self.client.force_login(self.user)
+
+    def create_post(self):
+        return Post.objects.create(
+            author=self.user,
+            text='С картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    def stored_thumbnails(self, post):
+        return default.kvstore._get(
+            ImageFile(post.image).key, identity='thumbnails'
+        )
+
+    def test_post_create_schedules_thumbnails(self):
+        """Загрузка картинки ставит подготовку миниатюр в очередь."""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.client.post(reverse(POST_CREATE_URL), data={
+                'text': 'С картинкой',
+                'image': SimpleUploadedFile(
+                    'upload.gif', SMALL_GIF, 'image/gif'
+                ),
+            })
+        schedule.assert_called_once()
+        self.assertTrue(schedule.call_args[0][0].image)
+
+    def test_generate_creates_configured_sizes(self):
+        """generate создаёт все поддерживаемые размеры и форматы."""
+        post = self.create_post()
+        thumbnails.generate(post.image.name)
+        self.assertEqual(len(self.stored_thumbnails(post)),
+                         len(thumbnails.thumbnail_sizes()))
+
+    def test_post_stores_placeholder(self):
+        """Запись с картинкой хранит встроенную заглушку."""
+        post = self.create_post()
+        post.refresh_from_db()
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+        post.image = ''
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_placeholder, '')
+
+    def test_generate_fills_missing_placeholder(self):
+        """generate дописывает заглушку записям, у которых её нет."""
+        post = self.create_post()
+        Post.objects.update(image_placeholder='')
+        thumbnails.generate(post.image.name)
+        post.refresh_from_db()
+        self.assertTrue(post.image_placeholder)
+
+    def test_card_renders_responsive_image(self):
+        """Карточка отдаёт srcset всех ширин, lazy-загрузку и заглушку."""
+        post = self.create_post()
+        thumbnails.generate(post.image.name)
+        content = self.client.get(reverse(INDEX_URL)).content.decode()
+        for width in settings.POST_IMAGE_WIDTHS:
+            self.assertIn(f' {width}w', content)
+        self.assertIn('loading="lazy"', content)
+        self.assertIn(f'sizes="{settings.POST_IMAGE_SIZES}"', content)
+        post.refresh_from_db()
+        self.assertIn(post.image_placeholder, content)
+
+    @override_settings(THUMBNAIL_PREGENERATE=True)
+    def test_missing_thumbnails_are_not_generated_in_request(self):
+        """Без готовых миниатюр показывается исходник, а подготовка
+        уходит в фоновую очередь.
+        """
+        post = self.create_post()
+        with mock.patch.object(thumbnails, 'get_thumbnail') as generate, \
+                mock.patch.object(thumbnails, '_submit') as submit, \
+                mock.patch.object(thumbnails.transaction, 'on_commit',
+                                  side_effect=lambda func: func()):
+            content = self.client.get(reverse(INDEX_URL)).content.decode()
+        generate.assert_not_called()
+        submit.assert_called_once_with(post.image.name)
+        self.assertIn(f'src="{post.image.url}"', content)
+        self.assertNotIn('srcset', content)
+
+    def test_job_skipped_after_media_root_changes(self):
+        """Задача, поставленная при другом MEDIA_ROOT, ничего не пишет,
+        а смена MEDIA_ROOT дожидается задач пула.
+        """
+        post = self.create_post()
+        with mock.patch.object(thumbnails, 'generate') as generate:
+            with tempfile.TemporaryDirectory() as media_root:
+                with self.settings(MEDIA_ROOT=media_root):
+                    submitted_to = thumbnails.locations()
+            thumbnails._generate_in_background(post.image.name, submitted_to)
+            generate.assert_not_called()
+            thumbnails._submit(post.image.name)
+            with self.settings(MEDIA_ROOT=TEMP_MEDIA_ROOT + '-other'):
+                generate.assert_called_once_with(post.image.name)
+
+    def test_generate_refreshes_cached_cards(self):
+        """После подготовки миниатюр закешированные карточки
+        отрисовываются заново.
+        """
+        post = self.create_post()
+        self.client.get(reverse(INDEX_URL))
+        thumbnails.generate(post.image.name)
+        content = self.client.get(reverse(INDEX_URL)).content.decode()
+        for width in settings.POST_IMAGE_WIDTHS:
+            self.assertIn(f' {width}w', content)
+
+    def test_post_detail_prefetches_thumbnail_metadata(self):
+        """Страница записи читает метаданные миниатюр одним запросом."""
+        post = self.create_post()
+        thumbnails.generate(post.image.name)
+        cache.clear()
+        default.kvstore.clear_local()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:post_detail', args=[post.pk])
+            )
+        kvstore_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertContains(response, f' {settings.POST_IMAGE_WIDTHS[-1]}w')
+
+    def test_regenerate_command(self):
+        """Команда пересоздаёт миниатюры для всех записей."""
+        post = self.create_post()
+        out = StringIO()
+        call_command('regenerate_thumbnails', workers=1, force=True,
+                     stdout=out)
+        self.assertIn('Готово файлов: 1', out.getvalue())
+        self.assertEqual(len(self.stored_thumbnails(post)),
+                         len(thumbnails.thumbnail_sizes()))
+
+    def test_feed_prefetches_thumbnail_metadata(self):
+        """Лента читает метаданные миниатюр одним запросом к БД."""
+        for _ in range(3):
+            thumbnails.generate(self.create_post().image.name)
+        cache.clear()
+        default.kvstore.clear_local()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse(INDEX_URL))
+        kvstore_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertEqual(default.kvstore.stats['prefetched'],
+                         3 * len(thumbnails.thumbnail_sizes()))
+        self.assertEqual(default.kvstore.stats['misses'], 0)
+
+
+class KVStoreTests(TestCase):
+    """Два экземпляра хранилища — как LRU двух процессов над общими
+    кешем и БД.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.first = kvstore.KVStore()
+        self.second = kvstore.KVStore()
+
+    def test_prefetch_sees_writes_of_other_instances(self):
+        self.first.prefetch(['key'])
+        self.assertIsNone(self.first._get_raw('key'))
+        self.second._set_raw('key', 'value')
+        self.first.prefetch(['key'])
+        self.assertEqual(self.first._get_raw('key'), 'value')
+        self.second._delete_raw('key')
+        self.first.prefetch(['key'])
+        self.assertIsNone(self.first._get_raw('key'))
+
+    def test_new_keys_keep_other_entries(self):
+        self.second._set_raw('key', 'value')
+        self.first.prefetch(['key', 'other'])
+        self.second._set_raw('other', 'value')
+        self.first.prefetch(['key', 'other'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.first._get_raw('key'), 'value')
+        self.assertEqual(self.first._get_raw('other'), 'value')
+        self.assertEqual(self.first.stats['prefetched'], 3)
+
+    def test_local_entries_expire(self):
+        self.first.prefetch(['key'])
+        self.assertIsNone(self.first._get_raw('key'))
+        # Другой процесс пишет мимо общего поколения, например вручную
+        KVStoreModel.objects.create(key='key', value='value')
+        cache.delete('key')
+        self.assertIsNone(self.first._get_raw('key'))
+        later = time.monotonic() + settings.THUMBNAIL_LRU_TIMEOUT + 1
+        with mock.patch.object(kvstore.time, 'monotonic',
+                               return_value=later):
+            self.assertEqual(self.first._get_raw('key'), 'value')
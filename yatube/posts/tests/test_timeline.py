@@ -0,0 +1,109 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts import timeline
+from posts.feeds import JoinPaginator, TimelinePaginator
+from posts.models import Follow, Post, TimelineEntry, User
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+
+    def feed(self):
+        return list(
+            TimelineEntry.objects.filter(user=self.reader).order_by(
+                '-pub_date', '-post_id'
+            ).values_list('post_id', flat=True)
+        )
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новая запись попадает в ленты подписчиков автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Новая запись', author=self.author)
+        Post.objects.create(text='Чужая запись', author=self.other)
+        self.assertEqual(self.feed(), [post.pk])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        """Подписка добавляет старые записи, отписка их убирает."""
+        posts = [
+            Post.objects.create(text=f'Запись {i}', author=self.author)
+            for i in range(3)
+        ]
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed(), [post.pk for post in reversed(posts)])
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_trim_keeps_newest_entries(self):
+        """Лента обрезается до TIMELINE_LENGTH самых новых записей."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(text=f'Запись {i}', author=self.author)
+            for i in range(4)
+        ]
+        timeline.trim(self.reader)
+        self.assertEqual(self.feed(), [posts[3].pk, posts[2].pk])
+
+    @override_settings(TIMELINE_LENGTH=2, TIMELINE_TRIM_SLACK=0)
+    def test_fan_out_trims_followers(self):
+        """Раскладка записи обрезает ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.other, author=self.author)
+        posts = [
+            Post.objects.create(text=f'Запись {i}', author=self.author)
+            for i in range(4)
+        ]
+        self.assertEqual(self.feed(), [posts[3].pk, posts[2].pk])
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.other).count(), 2
+        )
+
+    @override_settings(TIMELINE_LENGTH=2, TIMELINE_TRIM_SLACK=3)
+    def test_fan_out_keeps_timelines_bounded(self):
+        """Между обрезками лента растёт не больше чем на
+        TIMELINE_TRIM_SLACK записей.
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(10):
+            Post.objects.create(text=f'Запись {i}', author=self.author)
+            self.assertLessEqual(len(self.feed()), 2 + 3)
+
+    def walk(self, paginator_class):
+        """Страницы ленты до последней и страница назад от неё."""
+        pages, cursor = [], None
+        while True:
+            page = paginator_class(self.reader, 2).get_page(cursor)
+            pages.append([post.pk for post in page.object_list])
+            if page.next_cursor is None:
+                break
+            cursor = page.next_cursor
+        back = paginator_class(self.reader, 2).get_page(page.previous_cursor)
+        return pages + [[post.pk for post in back.object_list]]
+
+    @override_settings(TIMELINE_LENGTH=2, TIMELINE_TRIM_SLACK=0)
+    def test_pages_past_trimmed_timeline(self):
+        """За горизонтом обрезанной ленты страницы читаются
+        соединением, вперёд и назад.
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(5):
+            Post.objects.create(text=f'Запись {i}', author=self.author)
+        self.assertEqual(self.feed()[2:], [])
+        self.assertEqual(
+            self.walk(TimelinePaginator), self.walk(JoinPaginator)
+        )
+
+    def test_rebuild_command(self):
+        """Команда rebuild_timeline восстанавливает ленту по подпискам."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Запись', author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timeline', stdout=StringIO())
+        self.assertEqual(self.feed(), [post.pk])
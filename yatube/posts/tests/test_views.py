@@ -9,6 +9,7 @@ from django import forms
 from http import HTTPStatus
 from django.core.files.uploadedfile import SimpleUploadedFile
 
+from posts import checks
 from posts.models import Post, Group, User, Follow, Comment
 from .constants import (
     INDEX_URL,
@@ -32,7 +33,7 @@ from .constants import (
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_PREGENERATE=False)
 class PostPagesTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -227,13 +228,49 @@ class PostPagesTests(TestCase):
         """Проверка кэша главной страницы."""
         response = self.authorized_client.get(reverse(INDEX_URL))
         self.assertContains(response, self.post, status_code=HTTPStatus.OK)
-        self.post.delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         response2 = self.authorized_client.get(reverse(INDEX_URL))
         self.assertContains(response2, self.post, status_code=HTTPStatus.OK)
-        cache.clear()
+        self.post.delete()
         response3 = self.authorized_client.get(reverse(INDEX_URL))
         self.assertNotContains(response3, self.post, status_code=HTTPStatus.OK)
 
+    def test_cache_invalidated_on_write(self):
+        """Новая запись сразу видна в закэшированных лентах."""
+        urls = (
+            reverse(INDEX_URL),
+            reverse(GROUP_LIST_URL, kwargs={'slug': self.group.slug}),
+            reverse(PROFILE_URL, kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        new_post = Post.objects.create(
+            author=self.user, text='Свежая запись', group=self.group
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIn(new_post, response.context['page_obj'])
+
+    def test_local_cache_requires_short_timeouts(self):
+        """С кешем процесса ленты кешируются не дольше
+        LOCAL_CACHE_MAX_TIMEOUT: сброс поколения другим процессам
+        не виден.
+        """
+        self.assertEqual(checks.shared_cache(None), [])
+        with self.settings(FEED_CACHE_TIMEOUT=60 * 60):
+            self.assertEqual(
+                [error.id for error in checks.shared_cache(None)],
+                ['posts.E002'],
+            )
+        with self.settings(
+            FEED_CACHE_TIMEOUT=60 * 60,
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+            }},
+        ):
+            self.assertEqual(checks.shared_cache(None), [])
+
 
 class FollowViewTest(TestCase):
     @classmethod
@@ -330,3 +367,81 @@ class FollowViewTest(TestCase):
         page_obj = response.context['page_obj']
         for post in page_obj:
             self.assertNotEqual(post.text, new_post_follower.text)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='card_author', first_name='Иван', last_name='Иванов'
+        )
+        cls.group = Group.objects.create(
+            title='Группа', slug='card-group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Карточка', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_card_is_cached_until_author_changes(self):
+        """Карточка берётся из кеша, пока автор не сменит имя."""
+        url = reverse(GROUP_LIST_URL, kwargs={'slug': self.group.slug})
+        self.assertContains(self.client.get(url), 'Иван Иванов')
+        User.objects.filter(pk=self.user.pk).update(first_name='Пётр')
+        self.assertContains(self.client.get(url), 'Иван Иванов')
+        user = User.objects.get(pk=self.user.pk)
+        user.save()
+        self.assertContains(self.client.get(url), 'Пётр Иванов')
+
+    def test_card_invalidated_on_post_edit(self):
+        """Изменённая запись сразу видна во всех лентах."""
+        url = reverse(PROFILE_URL, kwargs={'username': self.user.username})
+        self.client.get(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст карточки'
+        post.save()
+        self.assertContains(self.client.get(url), 'Новый текст карточки')
+
+
+class PageShellTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='shell_author')
+        cls.reader = User.objects.create_user(username='shell_reader')
+        cls.post = Post.objects.create(author=cls.author, text='Оболочка')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_shell_shared_between_users(self):
+        """Общая оболочка не раскрывает данные другого пользователя."""
+        urls = (
+            reverse(INDEX_URL),
+            reverse(PROFILE_URL, kwargs={'username': self.author.username}),
+            reverse(POST_DETAIL_URL, kwargs={'post_id': self.post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.reader_client.get(url)
+                self.assertContains(response, self.reader.username)
+                response = self.client.get(url)
+                self.assertNotContains(response, self.reader.username)
+                self.assertContains(response, 'Войти')
+
+    def test_holes_rendered_per_user(self):
+        """Кнопки подписки и форма комментария рисуются для каждого."""
+        profile_url = reverse(
+            PROFILE_URL, kwargs={'username': self.author.username}
+        )
+        self.client.get(profile_url)
+        response = self.reader_client.get(profile_url)
+        self.assertContains(response, 'Подписаться')
+        detail_url = reverse(POST_DETAIL_URL, kwargs={'post_id': self.post.pk})
+        self.client.get(detail_url)
+        response = self.reader_client.get(detail_url)
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertNotContains(response, '<!--hole:')
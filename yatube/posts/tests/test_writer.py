@@ -0,0 +1,82 @@
+import threading
+from unittest import mock
+
+from django.db import IntegrityError, transaction
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core import writer
+from posts.models import Comment, Follow, Post, User
+
+
+@override_settings(WRITE_QUEUE=True, WRITE_QUEUE_LINGER=0.05)
+class WriteQueueTests(TransactionTestCase):
+    """Писатель — отдельный поток, поэтому тесты без общей транзакции."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.author, text='Запись')
+
+    def comment(self, text):
+        return Comment.objects.create(
+            post=self.post, author=self.reader, text=text
+        )
+
+    def test_concurrent_writes_are_group_committed(self):
+        results = []
+
+        def write(number):
+            results.append(
+                writer.submit(self.comment, f'Комментарий {number}')
+            )
+
+        threads = [threading.Thread(target=write, args=(number,))
+                   for number in range(8)]
+        with mock.patch('core.writer.commit', wraps=writer.commit) as commit:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(results), 8)
+        self.assertEqual(Comment.objects.count(), 8)
+        self.assertLess(commit.call_count, 8)
+
+    def test_error_is_returned_to_its_caller_only(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        with self.assertRaises(IntegrityError):
+            writer.submit(
+                Follow.objects.create, user=self.reader, author=self.author
+            )
+        comment = writer.submit(self.comment, 'После ошибки')
+        self.assertTrue(Comment.objects.filter(pk=comment.pk).exists())
+
+    def test_batch_job_failure_rolls_back_only_that_job(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        first, second = mock.Mock(), mock.Mock()
+        writer.commit([
+            (first, self.comment, ('Первый',), {}, 'default'),
+            (second, Follow.objects.create,
+             (), {'user': self.reader, 'author': self.author}, 'default'),
+        ])
+        first.set_result.assert_called_once()
+        second.set_exception.assert_called_once()
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_view_writes_through_queue(self):
+        self.client.force_login(self.reader)
+        with mock.patch('core.writer.commit', wraps=writer.commit) as commit:
+            self.client.post(
+                reverse('posts:add_comment', args=[self.post.pk]),
+                {'text': 'Через очередь'},
+            )
+        commit.assert_called_once()
+        self.assertTrue(
+            Comment.objects.filter(text='Через очередь').exists()
+        )
+
+    def test_runs_inline_inside_transaction(self):
+        with mock.patch('core.writer.commit') as commit:
+            with transaction.atomic():
+                writer.submit(self.comment, 'Сразу')
+        commit.assert_not_called()
@@ -0,0 +1,248 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from core import generations
+from . import shards
+from .ingest import placeholder
+from .models import Post, StoredImage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_failed = set()
+_stale = set()
+_pending_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _pending_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_PREGENERATE_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def drain():
+    """Дожидается всех задач пула; следующая задача создаст новый."""
+    global _executor
+    with _pending_lock:
+        pool, _executor = _executor, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def source_image(name):
+    """Картинка записи в том же хранилище, что и у Post.image.
+
+    Ключи sorl зависят от хранилища, поэтому без него миниатюры
+    не совпали бы с создаваемыми тегом {% thumbnail post.image %}.
+    """
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def locations():
+    """Каталоги картинок и миниатюр, куда сейчас пишут хранилища."""
+    return tuple(
+        getattr(storage, 'location', None)
+        for storage in (Post._meta.get_field('image').storage,
+                        default.storage)
+    )
+
+
+def thumbnail_sizes():
+    """POST_THUMBNAIL_SIZES без форматов, которые Pillow не сохраняет."""
+    Image.init()
+    return [
+        (geometry, options)
+        for geometry, options in settings.POST_THUMBNAIL_SIZES
+        if options.get('format', 'JPEG') in Image.SAVE
+    ]
+
+
+def fill_placeholders(name):
+    """Заглушка для записей с файлом name, у которых её ещё нет."""
+    pending = [
+        posts for posts in shards.across(
+            Post.objects.filter(image=name, image_placeholder='')
+        )
+        if posts.exists()
+    ]
+    if not pending:
+        return
+    with source_image(name).storage.open(name) as file:
+        value = placeholder(file, settings.IMAGE_PLACEHOLDER_WIDTH)
+    for posts in pending:
+        posts.update(image_placeholder=value, updated=timezone.now())
+
+
+def refresh_posts(name):
+    """Сбрасывает закешированные карточки и страницы записей с файлом
+    name: их могли отрисовать, пока миниатюр ещё не было.
+    """
+    scopes = {'posts'}
+    for posts in shards.across(Post.objects.filter(image=name)):
+        rows = list(posts.values_list('author_id', 'group_id'))
+        if not rows:
+            continue
+        posts.update(updated=timezone.now())
+        for author_id, group_id in rows:
+            scopes.add(f'author:{author_id}')
+            if group_id:
+                scopes.add(f'group:{group_id}')
+    generations.bump(*sorted(scopes))
+
+
+def generate(name, force=False):
+    """Создаёт все размеры миниатюр и заглушку для файла name."""
+    source = source_image(name)
+    if force:
+        delete(source, delete_file=False)
+    for geometry, options in thumbnail_sizes():
+        get_thumbnail(source, geometry, **options)
+    fill_placeholders(name)
+    with _pending_lock:
+        stale = name in _stale
+        _stale.discard(name)
+    if force or stale:
+        refresh_posts(name)
+    StoredImage.objects.filter(name=name).update(thumbnails_ready=True)
+
+
+def _full_options(source, options):
+    """Опции миниатюры в том виде, в каком их дополняет get_thumbnail.
+
+    Повторяет начало ThumbnailBackend.get_thumbnail, иначе имя файла
+    миниатюры, а с ним и ключ в KV-хранилище, не совпадут.
+    """
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_files(name):
+    """Пары (опции, ImageFile) миниатюр файла name под теми именами,
+    которые им даст get_thumbnail; сами файлы не создаются.
+    """
+    source = source_image(name)
+    for geometry, options in thumbnail_sizes():
+        yield options, ImageFile(
+            default.backend._get_thumbnail_filename(
+                source, geometry, _full_options(source, options)
+            ),
+            default.storage,
+        )
+
+
+def kvstore_keys(names):
+    """Ключи KV-хранилища sorl для миниатюр файлов names."""
+    return [
+        add_prefix(thumbnail.key)
+        for name in names
+        for _, thumbnail in thumbnail_files(name)
+    ]
+
+
+def _prefetch(names):
+    prefetch_keys = getattr(default.kvstore, 'prefetch', None)
+    if prefetch_keys is not None and names:
+        prefetch_keys(kvstore_keys(names))
+
+
+def prefetch(posts):
+    """Заранее загружает метаданные миниатюр записей страницы."""
+    _prefetch([post.image.name for post in posts if post.image])
+
+
+def ready(name):
+    """Уже созданные миниатюры файла name — пары (опции, ImageFile)
+    по метаданным из KV-хранилища.
+
+    В запросе миниатюры не создаются: недостающие при
+    THUMBNAIL_PREGENERATE уходят в фоновую очередь, а до тех пор
+    показываются только готовые. Отрисованное
+    без них generate() потом сбросит из кеша.
+    """
+    _prefetch([name])
+    found = []
+    missing = False
+    for options, thumbnail in thumbnail_files(name):
+        stored = default.kvstore.get(thumbnail)
+        if stored is None:
+            missing = True
+        else:
+            found.append((options, stored))
+    # Файл, на котором генерация уже падала, из запросов не повторяется
+    if missing and name not in _failed:
+        with _pending_lock:
+            _stale.add(name)
+        if settings.THUMBNAIL_PREGENERATE:
+            transaction.on_commit(lambda: _submit(name))
+    return found
+
+
+def _generate_in_background(name, submitted_to):
+    try:
+        # Каталоги, в которые смотрели хранилища при постановке задачи:
+        # если MEDIA_ROOT с тех пор сменился, например закончился
+        # override_settings теста, файлы легли бы не туда
+        if locations() != submitted_to:
+            logger.info('MEDIA_ROOT сменился, миниатюры для %s пропущены',
+                        name)
+            return
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры для %s', name)
+        with _pending_lock:
+            _failed.add(name)
+    finally:
+        with _pending_lock:
+            _pending.discard(name)
+        close_old_connections()
+
+
+def _submit(name):
+    """Отдаёт файл в пул, если он уже не ждёт там своей очереди."""
+    with _pending_lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    executor().submit(_generate_in_background, name, locations())
+
+
+def schedule(post):
+    """Ставит подготовку миниатюр записи в фоновую очередь.
+
+    Задача уходит в пул после фиксации транзакции, чтобы поток
+    увидел сохранённый файл и запись. Уже обработанные файлы, в том
+    числе повторные загрузки той же картинки, пропускаются, а одна
+    и та же картинка не обрабатывается в пуле дважды одновременно.
+    """
+    if not post.image or not settings.THUMBNAIL_PREGENERATE:
+        return
+    name = post.image.name
+    if StoredImage.objects.filter(name=name, thumbnails_ready=True).exists():
+        return
+    transaction.on_commit(lambda: _submit(name))
@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count
+
+from . import shards
+from .models import Follow, Post, TimelineEntry
+
+
+def _entries(user_ids, posts, model=TimelineEntry):
+    return [
+        model(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in user_ids
+        for post in posts
+    ]
+
+
+def fan_out_post(post):
+    """Раскладывает новую запись по лентам всех подписчиков автора.
+
+    Строки ленты лежат на базе записи. В каждой пачке подписчиков
+    обрезаются ленты тех, кто перерос TIMELINE_LENGTH больше чем на
+    TIMELINE_TRIM_SLACK записей: так удаления идут пачками, а не по
+    строке на каждую запись.
+    """
+    follower_ids = list(Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True))
+    using = post._state.db
+    size = settings.TIMELINE_BATCH_SIZE
+    for start in range(0, len(follower_ids), size):
+        batch = follower_ids[start:start + size]
+        TimelineEntry.objects.using(using).bulk_create(
+            _entries(batch, [post]), ignore_conflicts=True,
+        )
+        trim_many(overflowing(batch, using), using)
+
+
+def overflowing(user_ids, using):
+    """Читатели из user_ids, чьи ленты на базе using длиннее
+    TIMELINE_LENGTH + TIMELINE_TRIM_SLACK.
+    """
+    return list(TimelineEntry.objects.using(using).filter(
+        user_id__in=user_ids
+    ).order_by().values('user_id').annotate(
+        total=Count('pk')
+    ).filter(
+        total__gt=settings.TIMELINE_LENGTH + settings.TIMELINE_TRIM_SLACK
+    ).values_list('user_id', flat=True))
+
+
+def _author_databases(author_id):
+    """База свежих записей автора и архив, если он есть."""
+    aliases = [shards.shard_for(author_id)]
+    if settings.POST_ARCHIVE:
+        aliases.append(settings.POST_ARCHIVE)
+    return aliases
+
+
+def backfill(user, author):
+    """Добавляет в ленту читателя последние записи нового автора
+    с его базы и из архива.
+    """
+    for alias in _author_databases(author.pk):
+        posts = latest(Post.objects.using(alias).filter(author=author))
+        with transaction.atomic(using=alias):
+            TimelineEntry.objects.using(alias).bulk_create(
+                _entries([user.pk], posts),
+                batch_size=settings.TIMELINE_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            trim(user, alias)
+
+
+def remove_author(user, author):
+    """Убирает из ленты читателя записи автора, от которого он отписался."""
+    for alias in _author_databases(author):
+        TimelineEntry.objects.using(alias).filter(
+            user=user, author=author
+        ).delete()
+
+
+def trim(user, using=None):
+    """Оставляет в ленте читателя не более TIMELINE_LENGTH записей
+    на базе using, по умолчанию — на каждой базе с записями.
+    """
+    for alias in [using] if using else shards.databases():
+        entries = TimelineEntry.objects.using(alias).filter(user=user)
+        boundary = entries.order_by('-pub_date', '-post_id').values_list(
+            'pub_date', 'post_id'
+        )[settings.TIMELINE_LENGTH:settings.TIMELINE_LENGTH + 1]
+        for pub_date, post_id in boundary:
+            entries.filter(pub_date__lte=pub_date).exclude(
+                pub_date=pub_date, post_id__gt=post_id
+            ).delete()
+
+
+def trim_many(user_ids, using):
+    """trim() для многих читателей на базе using: по одному запросу
+    на пачку из TIMELINE_BATCH_SIZE лент.
+    """
+    table = TimelineEntry._meta.db_table
+    size = settings.TIMELINE_BATCH_SIZE
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(user_ids), size):
+            batch = user_ids[start:start + size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN ('
+                f'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+                f'PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC'
+                f') AS position FROM {table} '
+                f'WHERE user_id IN ({placeholders})'
+                f') WHERE position > %s)',
+                [*batch, settings.TIMELINE_LENGTH],
+            )
+
+
+def latest(posts):
+    """Последние TIMELINE_LENGTH записей выборки — столько их
+    помещается в ленту.
+    """
+    return posts.order_by('-pub_date', '-pk').only(
+        'pk', 'author_id', 'pub_date'
+    )[:settings.TIMELINE_LENGTH]
+
+
+def fill(Follow, Post, TimelineEntry, using):
+    """Собирает ленты всех читателей на базе using заново.
+
+    Модели передаются явно, чтобы миграция могла заполнить ленты
+    своими историческими моделями.
+    """
+    readers = {}
+    for user_id, author_id in Follow.objects.using(using).values_list(
+        'user_id', 'author_id'
+    ).iterator():
+        readers.setdefault(user_id, []).append(author_id)
+    for user_id, author_ids in readers.items():
+        posts = latest(
+            Post.objects.using(using).filter(author_id__in=author_ids)
+        )
+        TimelineEntry.objects.using(using).bulk_create(
+            _entries([user_id], posts, TimelineEntry),
+            batch_size=settings.TIMELINE_BATCH_SIZE,
+        )
+
+
+def rebuild(user):
+    """Пересобирает ленту читателя по текущим подпискам."""
+    author_ids = list(Follow.objects.filter(user=user).values_list(
+        'author_id', flat=True
+    ))
+    for alias in shards.databases():
+        posts = latest(
+            Post.objects.using(alias).filter(author_id__in=author_ids)
+        )
+        with transaction.atomic(using=alias):
+            TimelineEntry.objects.using(alias).filter(user=user).delete()
+            TimelineEntry.objects.using(alias).bulk_create(
+                _entries([user.pk], posts),
+                batch_size=settings.TIMELINE_BATCH_SIZE,
+            )
@@ -1,69 +1,152 @@
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.db import router
+from django.db.models import prefetch_related_objects
 
-from .models import Post, Group, User, Follow, Comment
+from core import generations, writer
+from core.paginator import (
+    CursorPaginator, MergedCursorPaginator, TieredCursorPaginator,
+)
+from core.queries import query_budget
+from core.replicas import replica_reads
+from core.shell import render_shell
+from .cards import shell_key
+from .models import Post, Group, User, Follow, Comment, PostTag
 from .forms import PostForm, CommentForm
+from . import deletion, feeds, fulltext, shards, tags, thumbnails
 
 
-def paginator(posts, request):
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+def paginator(posts, request, paginator_class=CursorPaginator, scopes=()):
+    paginator = paginator_class(
+        posts,
+        10,
+        approximate_total=settings.PAGINATOR_APPROXIMATE_TOTAL,
+        total_timeout=settings.PAGINATOR_TOTAL_TIMEOUT,
+    )
+    cursor = request.GET.get('cursor')
+    if scopes:
+        # Автор и группа подгружаются после кеша страницы: иначе
+        # в нём остались бы их копии со старым именем и названием
+        page_obj = paginator.get_cached_page(
+            cursor,
+            generations.key('feed_page', *scopes),
+            settings.FEED_CACHE_TIMEOUT,
+        )
+        prefetch_related_objects(page_obj.object_list, 'author', 'group')
+        return page_obj
+    return paginator.get_page(cursor)
+
+
+def sharded_object_or_404(queryset, pk):
+    """get_object_or_404 на той базе, где лежит строка с ключом pk,
+    в том числе в архиве.
+    """
+    try:
+        return shards.get(queryset, pk)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'{queryset.model._meta.object_name} не найден')
 
 
-@cache_page(20, key_prefix='index_page')
+@query_budget(8, per_database=2)
+@replica_reads
 def index(request):
-    posts = Post.objects.all()
-    page_obj = paginator(posts, request)
+    posts = shards.tiers(Post.objects.all())
+    page_obj = paginator(posts, request, TieredCursorPaginator,
+                         scopes=('posts',))
     context = {
         'posts': page_obj,
         'page_obj': page_obj,
     }
-    return render(request, 'posts/index.html', context)
+    key = shell_key('index', page_obj, ('posts',),
+                    request.GET.get('cursor', ''))
+    return render_shell(request, 'posts/index.html', context, key)
 
 
+@query_budget(9, per_database=2)
+@replica_reads
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.group_posts.all()
-    page_obj = paginator(posts, request)
+    posts = shards.tiers(Post.objects.filter(group=group))
+    scopes = (f'group:{group.pk}',)
+    page_obj = paginator(posts, request, TieredCursorPaginator,
+                         scopes=scopes)
     context = {
         'posts': page_obj,
         'group': group,
         'page_obj': page_obj,
     }
-    return render(request, 'posts/group_list.html', context)
+    key = shell_key('group', page_obj, scopes, request.GET.get('cursor', ''))
+    return render_shell(request, 'posts/group_list.html', context, key)
+
+
+@query_budget(6, per_database=2)
+def tag_posts(request, name):
+    kind, name = tags.parse_slug(name)
+    entries = PostTag.objects.filter(kind=kind, name=name)
+    page_obj = paginator(entries, request, feeds.EntryPaginator)
+    context = {
+        'posts': page_obj,
+        'tag': f'{kind}{name}',
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/tag.html', context)
 
 
+@query_budget(10, per_database=2)
+@replica_reads
 def profile(request, username):
     author = get_object_or_404(User, username=username)
     following = False
     if request.user.is_authenticated:
         following = request.user.follower.filter(author=author).exists()
-    author_posts = author.posts.all()
-    page_obj = paginator(author_posts, request)
+    author_posts = [
+        [author.posts.all()],
+        shards.archived(Post.objects.filter(author=author)),
+    ]
+    page_obj = paginator(
+        author_posts, request, TieredCursorPaginator,
+        scopes=(f'author:{author.pk}',),
+    )
     context = {
         'posts': page_obj,
         'author': author,
         'page_obj': page_obj,
         'following': following
     }
-    return render(request, 'posts/profile.html', context)
+    key = shell_key(
+        'profile',
+        page_obj,
+        (f'author:{author.pk}', f'user:{author.pk}', f'profile:{author.pk}'),
+        request.GET.get('cursor', ''),
+    )
+    return render_shell(request, 'posts/profile.html', context, key)
 
 
+@query_budget(8, per_database=1)
+@replica_reads
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = sharded_object_or_404(
+        Post.objects.select_related('author', 'group'), post_id
+    )
+    # Комментарии удалённых пользователей скрыты до их вычистки
+    comments = post.comments.select_related('author').filter(
+        author__deletion__isnull=True
+    ).order_by('-created', '-pk')
     comment_form = CommentForm()
     context = {
         'post': post,
         'form': comment_form,
         'comments': comments,
     }
-    return render(request, 'posts/post_detail.html', context)
+    key = shell_key(
+        'post', [post], (f'post:{post.pk}', f'profile:{post.author_id}')
+    )
+    return render_shell(request, 'posts/post_detail.html', context, key)
 
 
+@query_budget(20)
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
@@ -71,7 +154,11 @@ def post_create(request):
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        # При шардах id выдаёт next_id ещё до вставки, и без
+        # force_insert Django сначала попробовал бы UPDATE
+        writer.submit(post.save, force_insert=True,
+                      using=router.db_for_write(Post, instance=post))
+        thumbnails.schedule(post)
         return redirect('posts:profile', request.user)
     context = {
         'form': form,
@@ -79,9 +166,10 @@ def post_create(request):
     return render(request, 'posts/create_post.html', context)
 
 
+@query_budget(20, per_database=1)
 @login_required
 def post_edit(request, post_id):
-    edit_post = get_object_or_404(Post, id=post_id)
+    edit_post = sharded_object_or_404(Post.objects.all(), post_id)
     edit_form = PostForm(
         request.POST or None,
         files=request.FILES or None,
@@ -90,7 +178,9 @@ def post_edit(request, post_id):
     if edit_post.author != request.user:
         return redirect('posts:post_detail', post_id)
     if edit_form.is_valid():
-        edit_form.save()
+        post = edit_form.save()
+        if 'image' in edit_form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': edit_form,
@@ -100,44 +190,48 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+@query_budget(20, per_database=1)
 @login_required
 def post_delete(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharded_object_or_404(Post.objects.all(), post_id)
     if request.method == 'POST':
         if post.author == request.user:
             confirm = request.POST.get('confirm') == 'True'
             if confirm:
-                post.delete()
+                deletion.delete_post(post)
                 return redirect('posts:profile', post.author.username)
             else:
                 return redirect('posts:post_detail', post.id)
     return render(request, 'posts/post_delete.html', {'post': post})
 
 
+@query_budget(8, per_database=1)
 @login_required
 def add_comment(request, post_id):
-    comment_post = get_object_or_404(Post, id=post_id)
+    comment_post = sharded_object_or_404(Post.objects.all(), post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = comment_post
-        comment.save()
+        writer.submit(comment.save, force_insert=True,
+                      using=router.db_for_write(Comment, instance=comment))
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(10, per_database=1)
 @login_required
 def comment_delete(request, comment_id):
-    comment = get_object_or_404(Comment, pk=comment_id)
+    comment = sharded_object_or_404(Comment.objects.all(), comment_id)
     if comment.author == request.user:
         comment.delete()
     return redirect('posts:post_detail', post_id=comment.post.pk)
 
 
+@query_budget(6, per_database=3)
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginator(posts, request)
+    page_obj = paginator(request.user, request, feeds.follow_paginator)
     context = {
         'posts': page_obj,
         'page_obj': page_obj,
@@ -145,17 +239,39 @@ def follow_index(request):
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(16)
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     user = request.user
     if author != user:
-        Follow.objects.get_or_create(user=user, author=author)
+        writer.submit(Follow.objects.get_or_create, user=user, author=author)
     return redirect('posts:profile', username=username)
 
 
+@query_budget(10)
 @login_required
 def profile_unfollow(request, username):
     user = request.user
     Follow.objects.filter(user=user, author__username=username).delete()
     return redirect('posts:profile', username=username)
+
+
+@query_budget(5, per_database=1)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = MergedCursorPaginator(
+            shards.across(fulltext.search_posts(query)),
+            10,
+            ordering=('rank', '-pk'),
+        ).get_page(request.GET.get('cursor'))
+        for post in page_obj:
+            post.snippet = fulltext.highlight(post.snippet)
+    context = {
+        'query': query,
+        'posts': page_obj,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryInspectorMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,9 +89,71 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            # Размер кеша подготовленных выражений на подключение
+            'cached_statements': 512,
+        },
     }
 }
 
+# Реплики основной базы для чтения представлений с @replica_reads:
+# псевдонимы из DATABASES, которые наполняет репликация снаружи Django
+DATABASE_ROUTERS = [
+    'posts.shards.ShardRouter',
+    'core.replicas.ReplicaRouter',
+]
+DATABASE_REPLICAS = []
+# Сколько секунд после записи клиент читает только основную базу
+REPLICA_PIN_SECONDS = 10
+REPLICA_PIN_COOKIE = 'read_primary'
+# Таблицы, запись в которые не закрепляет клиента за основной базой:
+# метаданные миниатюр sorl дописывает и при чтении страниц
+REPLICA_UNPINNED_TABLES = ['thumbnail_kvstore']
+
+# Базы с записями и комментариями (posts.shards): автор со всеми
+# своими записями и комментариями к ним живёт на одной из них. Карта
+# «автор → база» хранится в default и кешируется на SHARD_MAP_TIMEOUT.
+# На каждой базе нужна полная схема: manage.py migrate --database=...
+POST_SHARDS = ['default']
+SHARD_MAP_TIMEOUT = 60 * 60
+SHARD_BATCH_SIZE = 500
+
+# Архивная база для записей старше ARCHIVE_AFTER_DAYS дней (posts.archive):
+# псевдоним из DATABASES с полной схемой или None. Переносит записи
+# manage.py archive_posts, читают их страницы записи, профиля и глубокие
+# страницы лент.
+POST_ARCHIVE = None
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_BATCH_SIZE = 500
+
+# Удаление записей и пользователей (posts.deletion): сначала они только
+# скрываются, а строки, которые на них ссылаются, удаляются пачками
+# по PURGE_BATCH_SIZE в фоновом потоке или manage.py purge_deleted
+PURGE_IN_BACKGROUND = True
+PURGE_BATCH_SIZE = 500
+
+# Запись через единственный поток-писатель процесса (core.writer):
+# add_comment, post_create и profile_follow ставят изменения в очередь,
+# писатель фиксирует их пачками до WRITE_QUEUE_BATCH_SIZE, дожидаясь
+# попутных задач не дольше WRITE_QUEUE_LINGER секунд; при 0 в пачку
+# попадают только задачи, накопившиеся за прошлую фиксацию
+WRITE_QUEUE = False
+WRITE_QUEUE_BATCH_SIZE = 32
+WRITE_QUEUE_LINGER = 0
+
+# Настройки каждого подключения к SQLite (core.sqlite.configure):
+# WAL не блокирует читателей на время записи, а busy_timeout
+# заставляет писателя ждать блокировку вместо «database is locked»
+SQLITE_PRAGMAS = {
+    # Первым, чтобы переключение в WAL тоже ждало блокировку
+    'busy_timeout': 5000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер в КиБ, а не в страницах
+    'cache_size': -64 * 1024,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -141,3 +205,89 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+# Сдвиг поколения (core.generations) в LocMemCache виден только своему
+# процессу. Поэтому с ним страницы, карточки и списки записей авторов
+# кешируются не дольше LOCAL_CACHE_MAX_TIMEOUT секунд, как прежний
+# cache_page, а с общим кешем — до смены поколения. Следит posts.E002.
+LOCAL_CACHE_MAX_TIMEOUT = 20
+SHARED_CACHE = (
+    CACHES['default']['BACKEND']
+    != 'django.core.cache.backends.locmem.LocMemCache'
+)
+
+# Keyset-пагинация лент. Число страниц «из ~N» считается COUNT(*) —
+# полным проходом индекса, лишь закешированным на PAGINATOR_TOTAL_TIMEOUT
+# в каждом процессе, поэтому по умолчанию не показывается.
+PAGINATOR_APPROXIMATE_TOTAL = False
+PAGINATOR_TOTAL_TIMEOUT = 60 * 5
+
+# Материализованная лента подписок: глубина и размер пачки вставки.
+# Ленту читателя обрезают при раскладке, когда она переросла
+# TIMELINE_LENGTH больше чем на TIMELINE_TRIM_SLACK строк. Страницы
+# глубже ленты читаются соединением подписок и записей.
+TIMELINE_LENGTH = 1000
+TIMELINE_BATCH_SIZE = 500
+TIMELINE_TRIM_SLACK = 20
+
+# Движок ленты подписок: 'timeline' (запись в ленты читателей),
+# 'pull' (слияние кешированных списков авторов) или 'sql' (соединение).
+# После переключения на 'timeline' выполните rebuild_timeline.
+FOLLOW_FEED_ENGINE = 'timeline'
+AUTHOR_RECENT_LENGTH = 200
+AUTHOR_RECENT_TIMEOUT = (
+    60 * 60 * 24 if SHARED_CACHE else LOCAL_CACHE_MAX_TIMEOUT
+)
+
+# Поиск N+1: предупреждение о повторах одной формы запроса и
+# о превышении @query_budget представления. None — включён, пока
+# включён DEBUG; настройка читается на каждом запросе.
+QUERY_INSPECTOR = None
+QUERY_REPEAT_LIMIT = 3
+
+# Размер пачки при записи хештегов и упоминаний
+TAG_BATCH_SIZE = 500
+
+# Страницы лент кешируются до смены поколения их содержимого
+FEED_CACHE_TIMEOUT = 60 * 60 if SHARED_CACHE else LOCAL_CACHE_MAX_TIMEOUT
+POST_CARD_CACHE_TIMEOUT = (
+    60 * 60 * 24 if SHARED_CACHE else LOCAL_CACHE_MAX_TIMEOUT
+)
+SHELL_CACHE_TIMEOUT = 60 * 60 if SHARED_CACHE else LOCAL_CACHE_MAX_TIMEOUT
+
+# Лестница ширин картинки записи, каждая в WebP и JPEG; последний формат
+# идёт в <img>, остальные — в <source>. Форматы, которые установленный
+# Pillow не умеет сохранять, пропускаются.
+POST_IMAGE_WIDTHS = (320, 640, 960)
+POST_IMAGE_ASPECT = 960 / 339
+POST_IMAGE_FORMATS = ('WEBP', 'JPEG')
+POST_IMAGE_SIZES = '(min-width: 992px) 960px, 100vw'
+POST_THUMBNAIL_SIZES = [
+    (
+        f'{width}x{round(width / POST_IMAGE_ASPECT)}',
+        {'crop': 'center', 'upscale': True, 'format': image_format},
+    )
+    for image_format in POST_IMAGE_FORMATS
+    for width in POST_IMAGE_WIDTHS
+]
+# Миниатюры новых картинок готовятся в фоновом пуле процесса.
+# Тесты с временным MEDIA_ROOT его выключают: задача пула пережила бы
+# такой каталог
+THUMBNAIL_PREGENERATE = True
+THUMBNAIL_PREGENERATE_WORKERS = 2
+
+# Метаданные миниатюр: LRU в памяти процесса поверх кеша и БД.
+# Записи LRU живут THUMBNAIL_LRU_TIMEOUT секунд и сбрасываются
+# раньше, когда другой процесс меняет хранилище.
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+THUMBNAIL_LRU_SIZE = 10000
+THUMBNAIL_LRU_TIMEOUT = 60
+
+# Приём картинок: предел по заголовку и размер хранимого оригинала
+IMAGE_MAX_PIXELS = 50_000_000
+# PNG, GIF и WebP раскодируются целиком, а уменьшение RGBA делает ещё
+# копию: 8 Мп в RGBA обходятся примерно в 85 МБ
+IMAGE_MAX_DECODED_PIXELS = 8_000_000
+IMAGE_MASTER_SIZE = (1920, 1920)
+IMAGE_MASTER_QUALITY = 90
+# Ширина встроенной в запись заглушки, которую видно до загрузки картинки
+IMAGE_PLACEHOLDER_WIDTH = 16